@@ -0,0 +1,59 @@
+import random
+from collections.abc import Callable
+
+
+class Catalog:
+    """
+    A fixed list of game objects, built on first use and indexed by lower-cased name.
+
+    The catalog keeps its entries to itself and only hands out copies made by `copy`, callers may change
+    whatever they get. Lookups pick the first entry in build order, like a scan of the list would.
+    """
+    __slots__ = ("_build", "_name", "_copy", "_entries", "_names", "_found")
+
+    # partial names `containing` remembers the scan for, the books only ask for a handful
+    found_limit: int = 4096
+
+    def __init__(self, build: Callable[[], list], name: Callable[[any], str], copy: Callable[[any], any]):
+        self._build: Callable[[], list] = build
+        self._name: Callable[[any], str] = name
+        self._copy: Callable[[any], any] = copy
+        self._entries: tuple | None = None
+        self._names: dict[str, int] = dict()
+        self._found: dict[str, int | None] = dict()
+
+    @property
+    def entries(self) -> tuple:
+        """The catalog's own entries, not to be changed."""
+        if self._entries is None:
+            self._entries = tuple(self._build())
+            for index, entry in enumerate(self._entries):
+                self._names.setdefault(self._name(entry).lower(), index)
+        return self._entries
+
+    def list(self) -> list:
+        """Fresh copies of all entries."""
+        return [self._copy(entry) for entry in self.entries]
+
+    def named(self, name: str) -> any:
+        """A copy of the first entry with the name, ignoring case, or None."""
+        entries: tuple = self.entries
+        index: int | None = self._names.get(name.lower())
+        return None if index is None else self._copy(entries[index])
+
+    def containing(self, name: str) -> any:
+        """A copy of the first entry whose name contains `name`, ignoring case, or None."""
+        entries: tuple = self.entries
+        query: str = name.lower()
+        if query in self._found:
+            index: int | None = self._found[query]
+        else:
+            index = next((at for at, entry in enumerate(entries) if query in self._name(entry).lower()), None)
+            if len(self._found) >= self.found_limit:
+                self._found.clear()
+            self._found[query] = index
+        return None if index is None else self._copy(entries[index])
+
+    def choice(self) -> any:
+        """A copy of a random entry, drawing from `random` like `random.choice` of the list."""
+        return self._copy(random.choice(self.entries))
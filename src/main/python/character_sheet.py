@@ -1,12 +1,16 @@
 import random
-import textwrap
+from collections.abc import Callable
 from dataclasses import dataclass
 from dataclasses import field
 
-import dice
 import jsonpickle
 
+import dice_expr
 import gamebook_core
+from combat_events import CombatLog
+from combat_events import CombatSink
+from combat_events import EventKind
+from combat_events import sheet_name
 from equipment import Armor
 from equipment import Item
 from equipment import Money
@@ -28,6 +32,8 @@ def copy_of(o) -> any:
 
 
 _id: int = 0
+# counts the changes to the HP and attributes of all sheets, for aggregates over many sheets like a mob's stats
+_revision: int = 0
 
 
 def next_id():
@@ -36,6 +42,56 @@ def next_id():
     return _id
 
 
+def revision() -> int:
+    return _revision
+
+
+class CombatSnapshot:
+    """
+    The fields a fight changes of some sheets and mobs, to undo the fight or to return to its end later.
+
+    Anything with `combat_state` and `restore_combat_state` can be taken, lists are taken item by item. For a
+    sheet that is HP, mana, fate, the massive attack flag and armor HP, a handful of values where a jsonpickle
+    copy rebuilds the sheet with all its gear, skills, talents and spells.
+    """
+    __slots__ = ("_states",)
+
+    def __init__(self, *fighters: any):
+        self._states: list[tuple[any, tuple]] = list()
+        self._take(fighters)
+
+    def _take(self, fighters: any) -> None:
+        for fighter in fighters:
+            if isinstance(fighter, list):
+                self._take(fighter)
+            else:
+                self._states.append((fighter, fighter.combat_state()))
+
+    def restore(self) -> None:
+        for fighter, state in self._states:
+            fighter.restore_combat_state(state)
+
+
+def best_of(tries: int, fight: Callable[[], "list[str] | CombatSink"], *fighters: any,
+            key: Callable[[any], any] = len) -> "list[str] | CombatSink":
+    """
+    Fight `tries` times from the same start and return the log with the smallest key, the first one on ties.
+    A log is a list of lines or a `CombatSink`. The fighters are left the way the returned fight ended.
+    """
+    start: CombatSnapshot = CombatSnapshot(*fighters)
+    best: list[str] | CombatSink | None = None
+    end: CombatSnapshot | None = None
+    for attempt in range(tries):
+        if attempt:
+            start.restore()
+        log: list[str] | CombatSink = fight()
+        if best is None or key(log) < key(best):
+            best, end = log, CombatSnapshot(*fighters)
+    if end is not None:
+        end.restore()
+    return best
+
+
 @dataclass(slots=True)
 class CharacterSheet(gamebook_core.AbstractCharacter):
     _id: int = 0
@@ -160,8 +216,10 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
 
     @warrior_mod.setter
     def warrior_mod(self, mod: int) -> None:
+        global _revision
         self._warrior_mod = mod
         self.reset_defense()
+        _revision += 1
 
     @property
     def rogue_mod(self) -> int:
@@ -169,8 +227,10 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
 
     @rogue_mod.setter
     def rogue_mod(self, mod: int) -> None:
+        global _revision
         self._rogue_mod = mod
         self.reset_defense()
+        _revision += 1
 
     @property
     def mage_mod(self) -> int:
@@ -178,8 +238,10 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
 
     @mage_mod.setter
     def mage_mod(self, mod: int) -> None:
+        global _revision
         self._mage_mod = mod
         self.reset_mana_max()
+        _revision += 1
 
     @property
     def is_full_health(self) -> str:
@@ -202,10 +264,7 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
 
     @property
     def name(self) -> str:
-        if self.location:
-            return f"{self._name} (HP: {self.hp}, XP: {self.xp}) <Room: {self.location}>"
-        else:
-            return f"{self._name} (HP: {self.hp}, XP: {self.xp})"
+        return sheet_name(self._name, self.hp, self.xp, self.location)
 
     @name.setter
     def name(self, name: str) -> None:
@@ -266,10 +325,14 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
 
     @property
     def attack(self) -> int:
+        return self.attack_at(self.hit_points)
+
+    def attack_at(self, hit_points: int) -> int:
+        """The attack with `hit_points` left, wounded below half the maximum HP."""
         bonus: int = 0
         if self.weapons:
             bonus = self.weapons[0].attack_bonus
-        if self.hit_points < self.hit_points_max // 2:
+        if hit_points < self.hit_points_max // 2:
             bonus -= 3
         if hasattr(self, "attack_attribute"):
             if self.attack_attribute == SkillAttribute.Warrior:
@@ -282,15 +345,21 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
 
     @property
     def damage(self) -> str:
+        damage: str = self.damage_at(self.hit_points, self.massive_attack)
+        if self.massive_attack:
+            self.massive_attack = False
+        return damage
+
+    def damage_at(self, hit_points: int, massive_attack: bool = False) -> str:
+        """The damage die with `hit_points` left, without using up the massive attack."""
         damage: str = "1d2x"
         if self.weapons:
             weapon: Weapon = self.weapons[0]
             damage = weapon.damage
-        if self.massive_attack:
+        if massive_attack:
             damage = f"{damage}{self.warrior:+}"
-            self.massive_attack = False
-        if self.hit_points < self.hit_points_max // 2:
-            m = int(dice.roll_max(damage.replace("x", "")))
+        if hit_points < self.hit_points_max // 2:
+            m = dice_expr.roll_max(damage)
             m = max(min(m-1, 3), 0)
             damage = f"({damage})-{m}"
         return damage
@@ -301,7 +370,9 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
 
     @hit_points.setter
     def hit_points(self, hit_points: int):
+        global _revision
         self._hit_points = min(self.hit_points_max, hit_points)
+        _revision += 1
 
     def hp_add(self, hp: int) -> int:
         self.hp = self.hp + hp
@@ -509,7 +580,7 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
             if spell.name.lower().startswith(spell_name):
                 if self.mana < spell.mana_cost:
                     return [f"; Not enough mana ({self.mana}) for {spell.name} ({spell.mana_cost})"]
-                check: int = int(dice.roll(f"1d6 + {self.mage}"))
+                check: int = dice_expr.roll(f"1d6 + {self.mage}")
                 if check < spell.difficulty.value:
                     return [f"; Cast failed. {check} < {spell.difficulty.name} {spell.difficulty.value}"]
                 result: list[str] = list()
@@ -544,7 +615,7 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
     def attack_opponent(self, opponent, bonus_roll: str = "") -> bool:
         bonus: int = 0
         if bonus_roll:
-            bonus = int(dice.roll(f"{bonus_roll}"))
+            bonus = dice_expr.roll(bonus_roll)
         attack_attribute, defense = self.attack + bonus, opponent.defense
         check: int = roll(f"1d6x+{attack_attribute}")
         return True if check >= defense else False
@@ -569,53 +640,75 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
     def moral_check(self, bonus: int = 0) -> str:
         return dl_check("Routine", self.warrior + bonus)
 
+    def combat_state(self) -> tuple[int, int, int, bool, int]:
+        return self._hit_points, self.mana, self.fate, self._massive_attack, self.hit_points_armor
+
+    def restore_combat_state(self, state: tuple[int, int, int, bool, int]) -> None:
+        global _revision
+        self._hit_points, self.mana, self.fate, self._massive_attack, self.hit_points_armor = state
+        _revision += 1
+
     def run_combat4(self, side_b: list["CharacterSheet"],  #
                     max_opponents: int = 3  #
                     ) -> list[str]:
+        return self.run_combat_best(side_b, 4, max_opponents=max_opponents)
+
+    def run_combat_best(self, side_b: list["CharacterSheet"],  #
+                        tries: int,  #
+                        max_opponents: int = 3  #
+                        ) -> list[str]:
+        """The shortest log of `tries` fights, the sheets are left as they were, the log records the changes."""
         if not isinstance(side_b, list):
             side_b = [side_b]
-        logs: list[list[str]] = list()
-        for _ in range(4):
-            copy_self = copy_of(self)
-            copy_side_b = copy_of(side_b)
-            logs.append(copy_self.run_combat(copy_side_b, max_opponents=max_opponents))
-        logs.sort(key=len)
-        return logs[0]
+        start: CombatSnapshot = CombatSnapshot(self, side_b)
+        log: CombatLog = best_of(tries, lambda: self._run_combat(list(side_b), max_opponents, CombatLog()),
+                                 self, side_b)
+        start.restore()
+        return log.lines()
+
+    def combat_odds(self, side_b: list["CharacterSheet"],  #
+                    max_opponents: int = 1  #
+                    ) -> "duel_solver.DuelOdds":
+        """Exact odds of `run_combat` against `side_b`, without fighting."""
+        import duel_solver
+        return duel_solver.solve(self, side_b, max_opponents)
 
     def run_combat(self,  #
                    side_b: list["CharacterSheet"],  #
-                   max_opponents: int = 1) -> list[str]:
+                   max_opponents: int = 1,  #
+                   sink: CombatSink | None = None) -> list[str]:
+        """The combat log, with a `sink` the events go there instead and nothing is formatted."""
+        if sink is not None:
+            self._run_combat(side_b, max_opponents, sink)
+            return list()
+        return self._run_combat(side_b, max_opponents, CombatLog()).lines()
+
+    def _run_combat(self,  #
+                    side_b: list["CharacterSheet"],  #
+                    max_opponents: int,  #
+                    sink: CombatSink) -> CombatSink:
 
         if isinstance(side_b, list):
             pass
         else:
             side_b = [side_b]
 
-        combat_log: list[str] = list()
         side_a = [self]
 
         for c in side_a:
-            combat_log.append(f"; {c.name} {c.weapon}")
+            sink.emit(EventKind.Weapon, c._name, c.hp, c.xp, c.location, c.weapon)
         for c in side_b:
-            combat_log.append(f"; {c.name} {c.weapon}")
-        combat_log.append("")
+            sink.emit(EventKind.Weapon, c._name, c.hp, c.xp, c.location, c.weapon)
+        sink.text("")
 
         npc_1: CharacterSheet = side_b[0]
         have_initiative: bool = initiative_check(self.rogue, npc_1.rogue)
 
-        combat_log.append("")
+        sink.text("")
         if have_initiative:
-            combat_log.append("; PC party has initiative")
+            sink.text("; PC party has initiative")
         else:
-            combat_log.append("; NPC party has initiative")
-
-        pc_hp: int = 0
-        for pc in side_a:
-            pc_hp += pc.hit_points
-
-        npc_hp: int = 0
-        for npc in side_b:
-            npc_hp += npc.hit_points
+            sink.text("; NPC party has initiative")
 
         while True:
             if have_initiative:
@@ -630,29 +723,12 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
                     if not npc or not npc.is_alive:
                         continue
                     if pc.attack_opponent(npc):
-                        var: str = "_"
-                        if "Player" in pc._name:
-                            var = "player"
-                        else:
-                            var = f"room.npc(\"{pc._name}\")"
                         if pc.massive_attack:
-                            combat_log.append(f"; {pc._name} uses talent massive attack")
-                            combat_log[-1] = f"!{var}.massive_attack=False # " + combat_log[-1]
+                            sink.emit(EventKind.MassiveAttack, pc._name)
                         hp: int = npc.hit_points
                         npc.hit_points = pc.damage_opponent(npc)
-                        if npc.hit_points < 1:
-                            combat_log.append(
-                                    f"; {pc._name} hits for {hp - npc.hit_points} points and {npc._name} dies")
-                        else:
-                            combat_log.append(
-                                    f"; {pc._name} hits {npc.name} for {hp - npc.hit_points} points of damage")
-                        if "Player" in npc._name:
-                            var = "player"
-                        else:
-                            var = f"room.npc(\"{npc._name}\")"
-                        combat_log[-1] = f"!{var}.hp={npc.hit_points} # " + combat_log[-1]
-                    else:
-                        pass  # combat_log.append(f"; {pc.name} misses {npc.name}")
+                        sink.emit(EventKind.Hit, pc._name, npc._name, npc.hit_points, npc.xp, npc.location,
+                                  hp - npc.hit_points)
             else:
                 counter: int = 0
                 random.shuffle(side_b)
@@ -670,25 +746,9 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
                     if not pc or not pc.is_alive:
                         continue
                     if npc.attack_opponent(pc):
-                        var: str = "_"
-                        if "Player" in npc._name:
-                            var = "player"
-                        else:
-                            var = f"room.npc(\"{npc._name}\")"
                         hp: int = pc.hit_points
                         pc.hit_points = npc.damage_opponent(pc)
-                        if pc.hit_points < 1:
-                            combat_log.append(
-                                    f"; {npc._name} hits for {hp - pc.hit_points} points and kills {pc._name}")
-                        else:
-                            combat_log.append(
-                                    f"; {npc._name} hits {pc._name} for {hp - pc.hit_points} points of damage")
-                        var: str = "_"
-                        if "Player" in pc._name:
-                            var = "player"
-                        else:
-                            var = f"room.npc(\"{pc._name}\")"
-                        combat_log[-1] = f"!{var}.hp = {pc.hit_points} # " + combat_log[-1]
+                        sink.emit(EventKind.HitBack, npc._name, pc._name, pc.hit_points, hp - pc.hit_points)
 
             new_pc_hp: int = 0
             for pc in side_a:
@@ -706,42 +766,34 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
 
             have_initiative = not have_initiative
 
-        combat_log.append("")
+        sink.text("")
         side_b.sort(key=lambda x: x.name)
         for npc in side_b:
-            if npc.is_alive:
-                combat_log.append(f"; {npc._name}")
-            else:
-                combat_log.append(f"; DEAD: {npc._name}")
+            sink.emit(EventKind.Standing, npc._name, npc.is_alive)
         side_a.sort(key=lambda x: x.name)
         for pc in side_a:
-            if pc.is_alive:
-                combat_log.append(f"; {pc._name}")
-            else:
-                combat_log.append(f"; DEAD: {pc._name}")
+            sink.emit(EventKind.Standing, pc._name, pc.is_alive)
         if not new_pc_hp and self.fate:
             self.fate -= 1
-            combat_log.append(f"@player.fate: {self.fate}")
+            sink.text(f"@player.fate: {self.fate}")
+            sink.text("")
             if self.fate:
-                combat_log.append("")
-                combat_log.append(f"FATE - 1. FATE POINTS REMAINING: {self.fate}")
-                combat_log.append("")
-                combat_log.append(f"; {textwrap.fill(intervention(), 80).strip()}".replace("\n", "\n; "))
+                sink.text(f"FATE - 1. FATE POINTS REMAINING: {self.fate}")
             else:
-                combat_log.append("")
-                combat_log.append(f"FATE - 1. NO FATE POINTS REMAINING.")
-                combat_log.append("")
-                combat_log.append(f"; {textwrap.fill(intervention(), 80).strip()}".replace("\n", "\n; "))
-        return combat_log
+                sink.text(f"FATE - 1. NO FATE POINTS REMAINING.")
+            sink.text("")
+            sink.emit(EventKind.Intervention, intervention())
+        return sink
 
     def run_combat_round(self,  #
                          side_b: list["CharacterSheet"],  #
                          max_opponents: int = 3,  #
-                         opponents_have_initiative: None | bool = None) -> list[str]:
+                         opponents_have_initiative: None | bool = None,  #
+                         sink: CombatSink | None = None) -> list[str]:
+        """The log of one round, with a `sink` the events go there instead and nothing is formatted."""
+        log: CombatSink = CombatLog() if sink is None else sink
 
-        combat_log: list[str] = list()
         side_a = [self]
-        hp_to_report: dict[str, int] = dict()
 
         npc_1: CharacterSheet
         if isinstance(side_b, list):
@@ -757,14 +809,6 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
         else:
             have_initiative = initiative_check(self.rogue, npc_1.rogue)
 
-        pc_hp: int = 0
-        for pc in side_a:
-            pc_hp += pc.hit_points
-
-        npc_hp: int = 0
-        for npc in side_b:
-            npc_hp += npc.hit_points
-
         if have_initiative:
             for pc in side_a:
                 if not pc.is_alive:
@@ -776,25 +820,12 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
                     break
                 if not npc or not npc.is_alive:
                     continue
-                var: str = "_"
-                if "Player" in pc._name:
-                    var = "player"
-                else:
-                    var = f"room.npc(\"{pc._name}\")"
                 if pc.massive_attack:
-                    combat_log.append(f"; {pc._name} uses talent massive attack")
-                    combat_log[-1] = f"!{var}.massive_attack=False # " + combat_log[-1]
+                    log.emit(EventKind.MassiveAttack, pc._name)
                 hp: int = npc.hit_points
                 npc.hit_points = pc.damage_opponent(npc)
-                if npc.hit_points < 1:
-                    combat_log.append(f"; {pc._name} hits for {hp - npc.hit_points} points and {npc._name} dies")
-                else:
-                    combat_log.append(f"; {pc._name} hits {npc.name} for {hp - npc.hit_points} points of damage")
-                if "Player" in npc._name:
-                    var = "player"
-                else:
-                    var = f"room.npc(\"{npc._name}\")"
-                combat_log[-1] = f"!{var}.hp={npc.hit_points} # " + combat_log[-1]
+                log.emit(EventKind.Hit, pc._name, npc._name, npc.hit_points, npc.xp, npc.location,
+                         hp - npc.hit_points)
         else:
             counter: int = 0
             random.shuffle(side_b)
@@ -812,24 +843,10 @@ class CharacterSheet(gamebook_core.AbstractCharacter):
                 if not pc or not pc.is_alive:
                     continue
                 if npc.attack_opponent(pc):
-                    var: str = "_"
-                    if "Player" in npc._name:
-                        var = "player"
-                    else:
-                        var = f"room.npc(\"{npc._name}\")"
                     hp: int = pc.hit_points
                     pc.hit_points = npc.damage_opponent(pc)
-                    if pc.hit_points < 1:
-                        combat_log.append(f"; {npc._name} hits for {hp - pc.hit_points} points and kills {pc._name}")
-                    else:
-                        combat_log.append(f"; {npc._name} hits {pc._name} for {hp - pc.hit_points} points of damage")
-                    var: str = "_"
-                    if "Player" in pc._name:
-                        var = "player"
-                    else:
-                        var = f"room.npc(\"{pc._name}\")"
-                    combat_log[-1] = f"!{var}.hp = {pc.hit_points} # " + combat_log[-1]
-        return combat_log
+                    log.emit(EventKind.HitBack, npc._name, pc._name, pc.hit_points, hp - pc.hit_points)
+        return log.lines() if sink is None else list()
 
     @property
     def list_gear(self) -> str:
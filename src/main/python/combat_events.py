@@ -0,0 +1,131 @@
+import abc
+import textwrap
+from abc import ABC
+from collections.abc import Callable
+from enum import Enum
+from enum import auto
+
+
+class EventKind(Enum):
+    # a line of text that needs no formatting
+    Text = auto()
+    # a fighter and the weapon it fights with
+    Weapon = auto()
+    # a fighter using its massive attack
+    MassiveAttack = auto()
+    # a hit of the player's side, and a hit of the opponents' side
+    Hit = auto()
+    HitBack = auto()
+    # who is still standing when the fight is over
+    Standing = auto()
+    # a unit of a mob, and the HP a unit of a mob lost in a round
+    Unit = auto()
+    UnitHp = auto()
+    # the divine intervention saving a fighter
+    Intervention = auto()
+
+
+def sheet_name(name: str, hp: int, xp: int, location: str) -> str:
+    """The name of a character sheet with its HP and XP, see `CharacterSheet.name`."""
+    if location:
+        return f"{name} (HP: {hp}, XP: {xp}) <Room: {location}>"
+    return f"{name} (HP: {hp}, XP: {xp})"
+
+
+def _var(name: str) -> str:
+    """The variable of a fighter in the macros of a combat log."""
+    return "player" if "Player" in name else f"room.npc(\"{name}\")"
+
+
+def _hit(attacker: str, target: str, hp: int, xp: int, location: str, damage: int) -> str:
+    if hp < 1:
+        return f"!{_var(target)}.hp={hp} # ; {attacker} hits for {damage} points and {target} dies"
+    return f"!{_var(target)}.hp={hp} # " \
+           f"; {attacker} hits {sheet_name(target, hp, xp, location)} for {damage} points of damage"
+
+
+def _hit_back(attacker: str, target: str, hp: int, damage: int) -> str:
+    if hp < 1:
+        return f"!{_var(target)}.hp = {hp} # ; {attacker} hits for {damage} points and kills {target}"
+    return f"!{_var(target)}.hp = {hp} # ; {attacker} hits {target} for {damage} points of damage"
+
+
+def _unit_hp(name: str, hp: int, xp: int, location: str, hp_lost: int) -> str:
+    died_text: str = "" if hp > 0 else ", DIED."
+    return f"- {sheet_name(name, hp, xp, location)}: {hp_lost:+,} HP{died_text}"
+
+
+_formats: dict[EventKind, Callable[..., str]] = {
+    EventKind.Text: lambda text: text,
+    EventKind.Weapon: lambda name, hp, xp, location, weapon: f"; {sheet_name(name, hp, xp, location)} {weapon}",
+    EventKind.MassiveAttack: lambda name: f"!{_var(name)}.massive_attack=False # ; {name} uses talent massive attack",
+    EventKind.Hit: _hit,
+    EventKind.HitBack: _hit_back,
+    EventKind.Standing: lambda name, alive: f"; {name}" if alive else f"; DEAD: {name}",
+    EventKind.Unit: lambda name, hp, xp, location: f"* {sheet_name(name, hp, xp, location)}",
+    EventKind.UnitHp: _unit_hp,
+    EventKind.Intervention: lambda text: f"; {textwrap.fill(text, 80).strip()}".replace("\n", "\n; "),
+}
+
+
+class CombatEvent:
+    """One line of a combat log, kept as the values it is made of until the line is needed."""
+    __slots__ = ("kind", "values")
+
+    def __init__(self, kind: EventKind, values: tuple):
+        self.kind: EventKind = kind
+        self.values: tuple = values
+
+    def __repr__(self) -> str:
+        return f"CombatEvent({self.kind.name}, {self.values!r})"
+
+    def __str__(self) -> str:
+        return _formats[self.kind](*self.values)
+
+
+class CombatSink(ABC):
+    """Receives the events of a fight."""
+
+    @abc.abstractmethod
+    def emit(self, kind: EventKind, *values: any) -> None:
+        pass
+
+    def text(self, text: str) -> None:
+        self.emit(EventKind.Text, text)
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        return 0
+
+    @abc.abstractmethod
+    def lines(self) -> list[str]:
+        return list()
+
+
+class NullSink(CombatSink):
+    """Drops every event, for callers that only want the outcome of a fight."""
+
+    def emit(self, kind: EventKind, *values: any) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return 0
+
+    def lines(self) -> list[str]:
+        return list()
+
+
+class CombatLog(CombatSink):
+    """Keeps the events of a fight, the lines are only formatted when `lines` is called."""
+
+    def __init__(self):
+        self.events: list[CombatEvent] = list()
+
+    def emit(self, kind: EventKind, *values: any) -> None:
+        self.events.append(CombatEvent(kind, values))
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def lines(self) -> list[str]:
+        return [str(event) for event in self.events]
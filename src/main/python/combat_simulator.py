@@ -0,0 +1,217 @@
+"""
+Monte Carlo simulation of many fights at once with NumPy arrays.
+
+Unlike `dice_distribution` this module requires NumPy, it is listed in environment.yml.
+"""
+from dataclasses import dataclass
+
+import numpy
+
+import dice_expr
+from character_sheet import CharacterSheet
+from mob_combat import MobUnit
+
+
+@dataclass(frozen=True, slots=True)
+class StatBlock:
+    """The combat stats of one side, its units share everything but their HP."""
+    attack: int
+    defense: int
+    hp: int
+    damage: str = "1d2x"
+    units: int = 1
+    hp_max: int = 0
+    rogue: int = 0
+    fate: int = 0
+    # damage bonus of the first hit when the side has the Massive Attack talent ready
+    massive_attack: int = 0
+    # HP and maximum HP of every unit when they differ, `hp`, `hp_max` and `units` are ignored then
+    unit_hp: tuple[int, ...] = ()
+    unit_hp_max: tuple[int, ...] = ()
+
+    @property
+    def starting_hp(self) -> tuple[int, ...]:
+        return self.unit_hp or (self.hp,) * self.units
+
+    @property
+    def wounded_below(self) -> tuple[int, ...]:
+        """HP under which each unit counts as wounded, half its maximum HP."""
+        if self.unit_hp_max:
+            return tuple(hp_max // 2 for hp_max in self.unit_hp_max)
+        return ((self.hp_max or self.hp) // 2,) * len(self.starting_hp)
+
+    @classmethod
+    def from_sheet(cls, sheet: CharacterSheet) -> "StatBlock":
+        return cls(attack=sheet.attack_at(sheet.hit_points_max), defense=sheet.defense, hp=sheet.hit_points,
+                   damage=sheet.damage_at(sheet.hit_points_max), hp_max=sheet.hit_points_max, rogue=sheet.rogue,
+                   fate=sheet.fate,
+                   massive_attack=sheet.warrior if sheet.massive_attack else 0)
+
+    @classmethod
+    def from_mob(cls, mob: MobUnit) -> "StatBlock":
+        """
+        Stats of the first living unit with the HP of every living unit. `MobUnit.damage_die` uses up the
+        Massive Attack of the units before the mob looks at it, mob fights get no massive attack bonus.
+        """
+        living: list[CharacterSheet] = [unit for unit in mob.units if unit.is_alive]
+        if not living:
+            raise ValueError(f"{mob.name} has no living units")
+        first: CharacterSheet = living[0]
+        return cls(attack=max(unit.attack_at(unit.hit_points_max) for unit in living), defense=mob.defense,
+                   hp=first.hit_points, damage=first.damage_at(first.hit_points_max), units=len(living),
+                   hp_max=first.hit_points_max, rogue=mob.rogue, fate=mob.fate,
+                   unit_hp=tuple(unit.hit_points for unit in living),
+                   unit_hp_max=tuple(unit.hit_points_max for unit in living))
+
+
+@dataclass(frozen=True, slots=True)
+class SimulationResult:
+    trials: int
+    wins_a: int
+    wins_b: int
+    # fights still undecided after the round limit
+    draws: int
+    # number of fights per round count
+    rounds: numpy.ndarray
+    # number of fights per total HP left on the side
+    hp_left_a: numpy.ndarray
+    hp_left_b: numpy.ndarray
+    # fights lost by a side that still had a fate point to spend
+    fate_spent_a: int
+    fate_spent_b: int
+
+    @property
+    def win_rate_a(self) -> float:
+        return self.wins_a / self.trials
+
+    @property
+    def win_rate_b(self) -> float:
+        return self.wins_b / self.trials
+
+    @property
+    def mean_rounds(self) -> float:
+        return float(numpy.arange(len(self.rounds)) @ self.rounds) / self.trials
+
+
+def sample(expression: dice_expr.DiceExpr | str, rng: numpy.random.Generator, shape: tuple[int, ...]) -> numpy.ndarray:
+    """Roll a dice expression for every cell of an array at once."""
+    if isinstance(expression, str):
+        expression = dice_expr.parse(expression)
+    return _sample(expression.node, rng, shape)
+
+
+def _scalar(node: dice_expr.Node) -> int:
+    if node[0] != "int":
+        raise ValueError("only fixed dice counts, sides and thresholds can be sampled in batches")
+    return node[1]
+
+
+def _sample(node: dice_expr.Node, rng: numpy.random.Generator, shape: tuple[int, ...]) -> numpy.ndarray:
+    kind: str = node[0]
+    if kind == "int":
+        return numpy.full(shape, node[1], dtype=numpy.int64)
+    if kind == "neg":
+        return -_sample(node[1], rng, shape)
+    if kind == "dice":
+        amount, sides = _scalar(node[1]), _scalar(node[2])
+        return rng.integers(1, sides + 1, shape + (amount,)).sum(axis=-1)
+    if kind == "explode":
+        amount, sides = _scalar(node[1]), _scalar(node[2])
+        threshold: int = sides if node[3] is None else _scalar(node[3])
+        rolled: numpy.ndarray = rng.integers(1, sides + 1, shape + (amount,))
+        total: numpy.ndarray = rolled.sum(axis=-1)
+        again: numpy.ndarray = (rolled >= threshold).sum(axis=-1)
+        while again.any():
+            count: int = int(again.max())
+            rolled = rng.integers(1, sides + 1, shape + (count,))
+            rolled = rolled * (numpy.arange(count) < again[..., None])
+            total += rolled.sum(axis=-1)
+            again = (rolled >= threshold).sum(axis=-1)
+        return total
+    return dice_expr.operators[kind](_sample(node[1], rng, shape), _sample(node[2], rng, shape))
+
+
+def _initiative(a: StatBlock, b: StatBlock, rng: numpy.random.Generator, trials: int) -> numpy.ndarray:
+    """Whether side a starts, exploding d6 plus rogue and ties rolled again like `MobUnit.initiative_check`."""
+    result: numpy.ndarray = numpy.zeros(trials, dtype=bool)
+    open_: numpy.ndarray = numpy.ones(trials, dtype=bool)
+    while open_.any():
+        roll_a: numpy.ndarray = sample("1d6x", rng, (trials,)) + a.rogue
+        roll_b: numpy.ndarray = sample("1d6x", rng, (trials,)) + b.rogue
+        result = numpy.where(open_, roll_a > roll_b, result)
+        open_ &= roll_a == roll_b
+    return result
+
+
+def _attack(attacker: StatBlock, attacker_hp: numpy.ndarray, defender_hp: numpy.ndarray, defense: int,
+            massive: numpy.ndarray, rows: numpy.ndarray, exploding: bool, rng: numpy.random.Generator) -> None:
+    """One attack of a side in the fights `rows`, the defender's HP and the massive attack flags are updated."""
+    hp: numpy.ndarray = attacker_hp[rows]
+    alive: numpy.ndarray = hp > 0
+    healthy: numpy.ndarray = alive & (hp >= numpy.array(attacker.wounded_below))
+    # wounded units attack at -3, the side attacks with its best living unit
+    attack: numpy.ndarray = numpy.where(healthy.any(axis=1), attacker.attack, max(1, attacker.attack - 3))
+    roll: numpy.ndarray = sample("1d6x" if exploding else "1d6", rng, (len(rows),))
+    hit: numpy.ndarray = roll + attack >= defense
+    rows, alive, healthy = rows[hit], alive[hit], healthy[hit]
+    if not len(rows):
+        return
+
+    # `MobUnit.damage_die` takes the die of the first living unit once per living unit, a wounded unit's die
+    # is cut off at its penalty and rolled only once
+    first: numpy.ndarray = alive.argmax(axis=1)
+    first_healthy: numpy.ndarray = healthy[numpy.arange(len(rows)), first]
+    rolling: numpy.ndarray = alive & (first_healthy[:, None] | (numpy.arange(alive.shape[1]) == first[:, None]))
+    damage: numpy.ndarray = (sample(attacker.damage, rng, alive.shape) * rolling).sum(axis=1)
+    damage += numpy.where(massive[rows], attacker.massive_attack, 0)
+    damage = numpy.maximum(damage, 1)
+    massive[rows] = False
+
+    # the damage goes through the defending units in random order
+    target: numpy.ndarray = defender_hp[rows]
+    order: numpy.ndarray = numpy.argsort(rng.random(target.shape), axis=1)
+    shuffled: numpy.ndarray = numpy.take_along_axis(target, order, axis=1)
+    before: numpy.ndarray = numpy.cumsum(shuffled, axis=1) - shuffled
+    shuffled -= numpy.clip(damage[:, None] - before, 0, shuffled)
+    numpy.put_along_axis(target, order, shuffled, axis=1)
+    defender_hp[rows] = target
+
+
+def simulate(a: StatBlock, b: StatBlock, trials: int = 100_000, seed: int | None = None,
+             exploding: bool = False, max_rounds: int = 1_000) -> SimulationResult:
+    """
+    Run `trials` fights between two sides at once, following `MobUnit.combat`.
+
+    The sides take turns, starting with the winner of the initiative. An attack hits when a d6 plus the attack
+    reaches the defense, `exploding` uses an exploding d6 like `CharacterSheet.attack_opponent`. A hit rolls the
+    damage once per living unit, adds the massive attack bonus on the first hit and does at least one point,
+    spread over the defending units in random order. Only the fights still going are rolled for and no combat
+    log is built.
+    """
+    rng: numpy.random.Generator = numpy.random.default_rng(seed)
+    hp_a: numpy.ndarray = numpy.tile(numpy.array(a.starting_hp, dtype=numpy.int64), (trials, 1))
+    hp_b: numpy.ndarray = numpy.tile(numpy.array(b.starting_hp, dtype=numpy.int64), (trials, 1))
+    massive_a: numpy.ndarray = numpy.full(trials, a.massive_attack > 0)
+    massive_b: numpy.ndarray = numpy.full(trials, b.massive_attack > 0)
+    turn_a: numpy.ndarray = _initiative(a, b, rng, trials)
+    rounds: numpy.ndarray = numpy.zeros(trials, dtype=numpy.int64)
+    active: numpy.ndarray = numpy.flatnonzero((hp_a.sum(axis=1) > 0) & (hp_b.sum(axis=1) > 0))
+
+    for _ in range(max_rounds):
+        if not len(active):
+            break
+        attacking_a: numpy.ndarray = turn_a[active]
+        _attack(a, hp_a, hp_b, b.defense, massive_a, active[attacking_a], exploding, rng)
+        _attack(b, hp_b, hp_a, a.defense, massive_b, active[~attacking_a], exploding, rng)
+        rounds[active] += 1
+        turn_a[active] = ~attacking_a
+        active = active[(hp_a[active].sum(axis=1) > 0) & (hp_b[active].sum(axis=1) > 0)]
+
+    left_a: numpy.ndarray = hp_a.sum(axis=1)
+    left_b: numpy.ndarray = hp_b.sum(axis=1)
+    wins_a: int = int(((left_b == 0) & (left_a > 0)).sum())
+    wins_b: int = int(((left_a == 0) & (left_b > 0)).sum())
+    return SimulationResult(trials=trials, wins_a=wins_a, wins_b=wins_b, draws=trials - wins_a - wins_b,
+                            rounds=numpy.bincount(rounds), hp_left_a=numpy.bincount(left_a),
+                            hp_left_b=numpy.bincount(left_b), fate_spent_a=wins_b if a.fate else 0,
+                            fate_spent_b=wins_a if b.fate else 0)
@@ -0,0 +1,156 @@
+import copy
+from dataclasses import dataclass
+from dataclasses import field
+
+import gamebook_core
+import gamebook_state
+from character_sheet import CharacterSheet
+from equipment import Weapon
+from skills import SkillAttribute
+
+
+@dataclass(slots=True, eq=False)
+class CombatTemplate:
+    """
+    The stats every creature of a kind shares, taken once from a character sheet.
+
+    Templates are interned and never changed, combatants with the same stats hold the same template. Copies
+    of the state keep pointing at it and the state fingerprint only hashes its key.
+    """
+    description: str
+    warrior: int
+    rogue: int
+    mage: int
+    hit_points_max: int
+    mana_max: int
+    defense: int
+    attack_attribute: SkillAttribute
+    weapons: tuple[Weapon, ...]
+    # lower-cased talent names
+    talents: tuple[str, ...]
+    key: tuple = field(repr=False)
+
+    def __fingerprint__(self) -> tuple:
+        return self.key
+
+    def __copy__(self) -> "CombatTemplate":
+        return self
+
+    def __deepcopy__(self, memo: dict[int, any]) -> "CombatTemplate":
+        return self
+
+    @classmethod
+    def of(cls, sheet: CharacterSheet) -> "CombatTemplate":
+        """The interned template with the stats of `sheet`, its weapons are copied."""
+        key: tuple = (sheet.description, sheet.warrior, sheet.rogue, sheet.mage, sheet.hit_points_max,
+                      sheet.mana_max, sheet.defense, sheet.attack_attribute.name,
+                      gamebook_state.structure(list(sheet.weapons)),
+                      tuple(talent.name.lower() for talent in sheet.talents))
+        template: CombatTemplate | None = _templates.get(key)
+        if template is None:
+            template = _templates[key] = cls(description=sheet.description, warrior=sheet.warrior,
+                                             rogue=sheet.rogue, mage=sheet.mage,
+                                             hit_points_max=sheet.hit_points_max, mana_max=sheet.mana_max,
+                                             defense=sheet.defense, attack_attribute=sheet.attack_attribute,
+                                             weapons=tuple(copy.copy(weapon) for weapon in sheet.weapons),
+                                             talents=key[-1], key=key)
+        return template
+
+
+_templates: dict[tuple, CombatTemplate] = dict()
+_bare_hands: Weapon = Weapon("Bare hands")
+_bare_hands.damage = "1d2x"
+
+
+@dataclass(slots=True, eq=False)
+class Combatant(gamebook_core.AbstractCharacter):
+    """
+    A creature that only fights: a shared `CombatTemplate` and what changes in a fight.
+
+    Combatants stand in for the character sheets of spawned NPCs in rooms, mobs and `run_combat`, the combat
+    properties and rules are those of `CharacterSheet`. Equipment, skills and spells are left out, the
+    template's weapons are only read.
+    """
+    template: CombatTemplate
+    _id: int = 0
+    _name: str = ""
+    location: str = ""
+    xp: int = 0
+    _hit_points: int = 0
+    mana: int = 0
+    fate: int = 0
+    _massive_attack: bool = False
+    hit_points_armor: int = 0
+
+    # AbstractCharacter compares its (no) fields, combatants are only equal to themselves
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    @classmethod
+    def from_sheet(cls, sheet: CharacterSheet) -> "Combatant":
+        return cls(template=CombatTemplate.of(sheet), _id=sheet._id, _name=sheet._name, location=sheet.location,
+                   xp=sheet.xp, _hit_points=sheet.hit_points, mana=sheet.mana, fate=sheet.fate,
+                   _massive_attack=sheet._massive_attack, hit_points_armor=sheet.hit_points_armor)
+
+    @property
+    def description(self) -> str:
+        return self.template.description
+
+    @property
+    def warrior(self) -> int:
+        return self.template.warrior
+
+    @property
+    def rogue(self) -> int:
+        return self.template.rogue
+
+    @property
+    def mage(self) -> int:
+        return self.template.mage
+
+    @property
+    def hit_points_max(self) -> int:
+        return self.template.hit_points_max
+
+    @property
+    def mana_max(self) -> int:
+        return self.template.mana_max
+
+    @property
+    def defense(self) -> int:
+        return self.template.defense
+
+    @property
+    def attack_attribute(self) -> SkillAttribute:
+        return self.template.attack_attribute
+
+    @property
+    def weapons(self) -> tuple[Weapon, ...]:
+        return self.template.weapons
+
+    @property
+    def weapon(self) -> Weapon:
+        return self.template.weapons[0] if self.template.weapons else _bare_hands
+
+    def has_talent(self, name: str) -> bool:
+        return name.lower() in self.template.talents
+
+    name = CharacterSheet.name
+    name_with_id = CharacterSheet.name_with_id
+    base_name = CharacterSheet.base_name
+    hit_points = CharacterSheet.hit_points
+    hp = CharacterSheet.hp
+    hp_add = CharacterSheet.hp_add
+    is_alive = CharacterSheet.is_alive
+    massive_attack = CharacterSheet.massive_attack
+    attack = CharacterSheet.attack
+    attack_at = CharacterSheet.attack_at
+    damage = CharacterSheet.damage
+    damage_at = CharacterSheet.damage_at
+    attack_opponent = CharacterSheet.attack_opponent
+    damage_opponent = CharacterSheet.damage_opponent
+    take_damage_from = CharacterSheet.take_damage_from
+    take_damage_roll = CharacterSheet.take_damage_roll
+    moral_check = CharacterSheet.moral_check
+    combat_state = CharacterSheet.combat_state
+    restore_combat_state = CharacterSheet.restore_combat_state
@@ -0,0 +1,205 @@
+import itertools
+from collections.abc import Callable
+from collections.abc import Iterator
+from collections.abc import Sequence
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional, the distributions fall back to lists of floats
+    numpy = None
+
+import dice_expr
+from skills import Difficulty
+
+
+def _array(probabilities: Sequence[float]) -> Sequence[float]:
+    if numpy is not None:
+        return numpy.asarray(probabilities, dtype=float)
+    return list(probabilities)
+
+
+def _convolve(left: Sequence[float], right: Sequence[float]) -> Sequence[float]:
+    if numpy is not None:
+        return numpy.convolve(left, right)
+    result: list[float] = [0.0] * (len(left) + len(right) - 1)
+    for i, p in enumerate(left):
+        if p:
+            for j, q in enumerate(right):
+                result[i + j] += p * q
+    return result
+
+
+class Distribution:
+    """
+    Probabilities of the outcomes `offset`, `offset + 1`, ... of a dice expression.
+
+    `probabilities` is a NumPy array when NumPy is installed and a list of floats otherwise. Explosion chains
+    are cut off, the missing probability belongs to the highest outcomes and is counted as such by `at_least`.
+    """
+    __slots__ = ("offset", "probabilities", "_cumulative")
+
+    def __init__(self, offset: int, probabilities: Sequence[float]):
+        self.offset: int = offset
+        self.probabilities: Sequence[float] = _array(probabilities)
+        self._cumulative: Sequence[float] | None = None
+
+    def __repr__(self) -> str:
+        return f"Distribution({self.minimum}..{self.maximum}, mean={self.mean():.3f})"
+
+    def __add__(self, other: "Distribution | int") -> "Distribution":
+        if isinstance(other, int):
+            return self.shift(other)
+        return Distribution(self.offset + other.offset, _convolve(self.probabilities, other.probabilities))
+
+    def __neg__(self) -> "Distribution":
+        return Distribution(-self.maximum, self.probabilities[::-1])
+
+    @property
+    def minimum(self) -> int:
+        return self.offset
+
+    @property
+    def maximum(self) -> int:
+        return self.offset + len(self.probabilities) - 1
+
+    def items(self) -> Iterator[tuple[int, float]]:
+        """Outcomes with a probability above zero."""
+        for index, p in enumerate(self.probabilities):
+            if p:
+                yield self.offset + index, float(p)
+
+    def pmf(self, value: int) -> float:
+        index: int = value - self.offset
+        return float(self.probabilities[index]) if 0 <= index < len(self.probabilities) else 0.0
+
+    def cdf(self, value: int) -> float:
+        """Probability of an outcome of at most `value`."""
+        if self._cumulative is None:
+            self._cumulative = numpy.cumsum(self.probabilities) if numpy is not None \
+                else list(itertools.accumulate(self.probabilities))
+        index: int = value - self.offset
+        if index < 0:
+            return 0.0
+        return float(self._cumulative[min(index, len(self._cumulative) - 1)])
+
+    def at_least(self, value: int) -> float:
+        return 1.0 - self.cdf(value - 1)
+
+    def mean(self) -> float:
+        return sum(value * p for value, p in self.items())
+
+    def shift(self, amount: int) -> "Distribution":
+        return Distribution(self.offset + amount, self.probabilities)
+
+    def clamp(self, low: int) -> "Distribution":
+        """Distribution of `max(low, outcome)`, the way `gb_utils.roll` and damage rolls floor their results."""
+        if low <= self.offset:
+            return self
+        if low > self.maximum:
+            return Distribution(low, [1.0])
+        cut: int = low - self.offset
+        probabilities: list[float] = [float(p) for p in self.probabilities[cut:]]
+        probabilities[0] += self.cdf(low - 1)
+        return Distribution(low, probabilities)
+
+
+def _from_dict(outcomes: dict[int, float]) -> Distribution:
+    low: int = min(outcomes)
+    probabilities: list[float] = [0.0] * (max(outcomes) - low + 1)
+    for value, p in outcomes.items():
+        probabilities[value - low] += p
+    return Distribution(low, probabilities)
+
+
+def _mixture(parts: list[tuple[float, Distribution]]) -> Distribution:
+    outcomes: dict[int, float] = dict()
+    for weight, part in parts:
+        for value, p in part.items():
+            outcomes[value] = outcomes.get(value, 0.0) + weight * p
+    return _from_dict(outcomes)
+
+
+def _pairwise(left: Distribution, right: Distribution, function: Callable[[int, int], int]) -> Distribution:
+    outcomes: dict[int, float] = dict()
+    for a, p in left.items():
+        for b, q in right.items():
+            value: int = function(a, b)
+            outcomes[value] = outcomes.get(value, 0.0) + p * q
+    return _from_dict(outcomes)
+
+
+def _chain(sides: int, threshold: int, epsilon: float) -> Distribution:
+    """One exploding die, it is rolled again while it shows `threshold` or more."""
+    outcomes: dict[int, float] = dict()
+    frontier: dict[int, float] = {0: 1.0}
+    while sum(frontier.values()) >= epsilon:
+        following: dict[int, float] = dict()
+        for base, p in frontier.items():
+            for value in range(1, sides + 1):
+                target: dict[int, float] = outcomes if value < threshold else following
+                target[base + value] = target.get(base + value, 0.0) + p / sides
+        frontier = following
+    return _from_dict(outcomes)
+
+
+def _repeat(single: Distribution, amount: int) -> Distribution:
+    result: Distribution = Distribution(0, [1.0])
+    for _ in range(amount):
+        result = result + single
+    return result
+
+
+def _build(node: dice_expr.Node, epsilon: float) -> Distribution:
+    kind: str = node[0]
+    if kind == "int":
+        return Distribution(node[1], [1.0])
+    if kind == "neg":
+        return -_build(node[1], epsilon)
+    if kind in ("dice", "explode"):
+        thresholds: list[tuple[int | None, float]] = [(None, 1.0)]
+        if kind == "explode" and node[3] is not None:
+            thresholds = list(_build(node[3], epsilon).items())
+        parts: list[tuple[float, Distribution]] = list()
+        for amount, p in _build(node[1], epsilon).items():
+            for sides, q in _build(node[2], epsilon).items():
+                for threshold, r in thresholds:
+                    single: Distribution = Distribution(1, [1 / sides] * sides) if kind == "dice" \
+                        else _chain(sides, threshold or sides, epsilon)
+                    parts.append((p * q * r, _repeat(single, amount)))
+        return parts[0][1] if len(parts) == 1 else _mixture(parts)
+    left, right = _build(node[1], epsilon), _build(node[2], epsilon)
+    if kind == "+":
+        return left + right
+    if kind == "-":
+        return left + -right
+    return _pairwise(left, right, dice_expr.operators[kind])
+
+
+_distributions: dict[tuple[str, float], Distribution] = dict()
+
+
+def distribution(expression: "dice_expr.DiceExpr | str", epsilon: float = 1e-12) -> Distribution:
+    """Exact distribution of a dice expression, computed once per notation and `epsilon`."""
+    if isinstance(expression, str):
+        expression = dice_expr.parse(expression)
+    key: tuple[str, float] = (expression.notation, epsilon)
+    if key not in _distributions:
+        _distributions[key] = _build(expression.node, epsilon)
+    return _distributions[key]
+
+
+def hit_probability(attack: int, defense: int) -> float:
+    """Chance of `CharacterSheet.attack_opponent` to hit, an exploding d6 plus the attack against the defense."""
+    return distribution("1d6x").shift(attack).clamp(0).at_least(defense)
+
+
+def pass_probability(difficulty: Difficulty, attribute: int) -> float:
+    """Chance to pass `gb_utils.dl_check` for a difficulty with an attribute."""
+    return distribution("1d6x").shift(attribute).at_least(difficulty.value)
+
+
+def expected_damage(die: str, extra_damage: str = "") -> float:
+    """Mean damage of `CharacterSheet.take_damage_roll`, a hit always does at least one point."""
+    notation: str = f"{die} + {extra_damage}" if extra_damage else die
+    return distribution(notation).clamp(1).mean()
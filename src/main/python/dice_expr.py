@@ -0,0 +1,243 @@
+import operator
+import random
+import re
+from collections.abc import Callable
+
+# dice notation as used by the books and the library modules: NdM, dM, d%, exploding x with an optional
+# threshold, the total operator t, unary signs, + - * / % and parentheses
+_token: re.Pattern = re.compile(r"\s*(?:(\d+)|([dxt%()+\-*/]))", re.IGNORECASE)
+
+# binary operators from the loosest to the tightest binding one, the same ladder the dice library uses
+_binary: list[str] = ["+", "-", "*", "/", "%"]
+_symbols: dict[str, str] = {"+": "+", "-": "-", "*": "*", "/": "//", "%": "%"}
+operators: dict[str, Callable[[int, int], int]] = {"+": operator.add, "-": operator.sub, "*": operator.mul,
+                                                    "/": operator.floordiv, "%": operator.mod}
+
+Node = tuple
+
+
+def _dice(randint: Callable[[int, int], int], amount: int, sides: int) -> int:
+    if amount < 0 or sides < 1:
+        raise ValueError(f"cannot roll {amount}d{sides}")
+    total: int = 0
+    for _ in range(amount):
+        total += randint(1, sides)
+    return total
+
+
+def _explode(randint: Callable[[int, int], int], amount: int, sides: int, threshold: int | None) -> int:
+    """Roll the dice, then roll again as many dice as rolled the threshold or more, until none does."""
+    threshold = sides if threshold is None else threshold
+    if amount < 0 or sides < 2 or threshold <= 1:
+        raise ValueError(f"cannot explode {amount}d{sides} at {threshold}")
+    total: int = 0
+    while amount:
+        rolled: int = 0
+        for _ in range(amount):
+            value: int = randint(1, sides)
+            total += value
+            if value >= threshold:
+                rolled += 1
+        amount = rolled
+    return total
+
+
+class _Parser:
+    def __init__(self, notation: str):
+        self.notation: str = notation
+        self.tokens: list[str] = list()
+        position: int = 0
+        while position < len(notation):
+            match: re.Match | None = _token.match(notation, position)
+            if match is None:
+                if not notation[position:].strip():
+                    break
+                raise ValueError(f"unsupported dice notation {notation!r} at {position}")
+            self.tokens.append(match.group(1) or match.group(2).lower())
+            position = match.end()
+        self.index: int = 0
+
+    def peek(self) -> str | None:
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def take(self, expected: str | None = None) -> str:
+        token: str | None = self.peek()
+        if token is None or expected is not None and token != expected:
+            raise ValueError(f"unsupported dice notation {self.notation!r}, expected {expected or 'more'}")
+        self.index += 1
+        return token
+
+    def parse(self) -> Node:
+        node: Node = self.binary(0)
+        if self.peek() is not None:
+            raise ValueError(f"unsupported dice notation {self.notation!r} at {self.peek()!r}")
+        return node
+
+    def binary(self, level: int) -> Node:
+        if level == len(_binary):
+            return self.unary()
+        node: Node = self.binary(level + 1)
+        while self.peek() == _binary[level]:
+            self.take()
+            node = (_binary[level], node, self.binary(level + 1))
+        return node
+
+    def unary(self) -> Node:
+        if self.peek() == "-":
+            self.take()
+            return ("neg", self.unary())
+        if self.peek() == "+":
+            self.take()
+            return self.unary()
+        return self.total()
+
+    def total(self) -> Node:
+        node: Node = self.explode()
+        while self.peek() == "t":
+            self.take()
+        return node
+
+    def explode(self) -> Node:
+        node: Node = self.dice()
+        while self.peek() == "x":
+            self.take()
+            if node[0] != "dice":
+                raise ValueError(f"only dice explode in {self.notation!r}")
+            following: str = self.peek() or ""
+            threshold: Node | None = self.dice() if following == "(" or following.isdigit() else None
+            node = ("explode", node[1], node[2], threshold)
+        return node
+
+    def dice(self) -> Node:
+        amount: Node = ("int", 1) if self.peek() == "d" else self.atom()
+        if self.peek() != "d":
+            return amount
+        self.take()
+        sides: Node
+        if self.peek() == "%":
+            self.take()
+            sides = ("int", 100)
+        else:
+            sides = self.atom()
+        if self.peek() == "d":
+            raise ValueError(f"dice operators cannot be stacked in {self.notation!r}")
+        return ("dice", amount, sides)
+
+    def atom(self) -> Node:
+        token: str = self.take()
+        if token.isdigit():
+            return ("int", int(token))
+        if token == "(":
+            node: Node = self.binary(0)
+            self.take(")")
+            return node
+        raise ValueError(f"unsupported dice notation {self.notation!r} at {token!r}")
+
+
+def _chain(node: Node) -> list[Node]:
+    """Operands of a left leaning chain of one operator, long sums of dice stay flat instead of nested."""
+    operands: list[Node] = list()
+    while node[0] in operators and node[1][0] == node[0]:
+        operands.append(node[2])
+        node = node[1]
+    operands.extend((node[2], node[1]) if node[0] in operators else (node,))
+    return operands[::-1]
+
+
+def _source(node: Node) -> str:
+    """Python expression rolling the node, `randint` is the only free name."""
+    kind: str = node[0]
+    if kind == "int":
+        return str(node[1])
+    if kind == "neg":
+        return f"(-{_source(node[1])})"
+    if kind == "dice":
+        if node[1] == ("int", 1) and node[2][0] == "int" and node[2][1] >= 1:
+            return f"randint(1, {node[2][1]})"
+        return f"_dice(randint, {_source(node[1])}, {_source(node[2])})"
+    if kind == "explode":
+        threshold: str = "None" if node[3] is None else _source(node[3])
+        return f"_explode(randint, {_source(node[1])}, {_source(node[2])}, {threshold})"
+    operands: list[str] = [_source(operand) for operand in _chain(node)]
+    if kind == "+" and len(operands) > 2:
+        # a flat tuple compiles at any length, a long chain of + nests too deep for the compiler
+        return "sum((" + ", ".join(operands) + "))"
+    return "(" + f" {_symbols[kind]} ".join(operands) + ")"
+
+
+def _extreme(node: Node, face: Callable[[int], int]) -> int:
+    """Value with every die showing the face picked by `face` from its sides, dice do not explode."""
+    kind: str = node[0]
+    if kind == "int":
+        return node[1]
+    if kind == "neg":
+        return -_extreme(node[1], face)
+    if kind in ("dice", "explode"):
+        return _extreme(node[1], face) * face(_extreme(node[2], face))
+    operands: list[Node] = _chain(node)
+    value: int = _extreme(operands[0], face)
+    for operand in operands[1:]:
+        value = operators[kind](value, _extreme(operand, face))
+    return value
+
+
+class DiceExpr:
+    """
+    A dice expression parsed once and compiled into a Python function.
+
+    `roll` draws exactly the same numbers from the random generator as the dice library did for the same
+    notation, so compiled books keep their results. `max` and `min` are the value with every die on its
+    highest or lowest face, explosions left out, like `dice.roll_max` and `dice.roll_min` of the notation
+    without `x`.
+    """
+    __slots__ = ("notation", "node", "_roll", "_max", "_min")
+
+    def __init__(self, notation: str):
+        self.notation: str = notation
+        # parsed expression as nested tuples: ("int", value), ("neg", node), ("dice", amount, sides),
+        # ("explode", amount, sides, threshold or None) and (operator, left, right)
+        self.node: Node = _Parser(notation).parse()
+        self._roll: Callable = eval(f"lambda randint: {_source(self.node)}", {"_dice": _dice, "_explode": _explode})
+        self._max: int = _extreme(self.node, lambda sides: sides)
+        self._min: int = _extreme(self.node, lambda sides: 1)
+
+    def __repr__(self) -> str:
+        return f"DiceExpr({self.notation!r})"
+
+    def roll(self, rng: random.Random | None = None) -> int:
+        """Roll the expression with `rng`, the module level generator of `random` by default."""
+        return self._roll(random.randint if rng is None else rng.randint)
+
+    def max(self) -> int:
+        return self._max
+
+    def min(self) -> int:
+        return self._min
+
+    def distribution(self, epsilon: float = 1e-12) -> "dice_distribution.Distribution":
+        """Probability of every total, explosion chains less likely than `epsilon` are cut off."""
+        import dice_distribution
+        return dice_distribution.distribution(self, epsilon)
+
+
+_compiled: dict[str, DiceExpr] = dict()
+
+
+def parse(notation: str) -> DiceExpr:
+    """The compiled expression for a notation, every notation is only parsed once per process."""
+    expression: DiceExpr | None = _compiled.get(notation)
+    if expression is None:
+        expression = _compiled[notation] = DiceExpr(notation)
+    return expression
+
+
+def roll(notation: str, rng: random.Random | None = None) -> int:
+    return parse(notation).roll(rng)
+
+
+def roll_max(notation: str) -> int:
+    return parse(notation).max()
+
+
+def roll_min(notation: str) -> int:
+    return parse(notation).min()
@@ -0,0 +1,201 @@
+import itertools
+from dataclasses import dataclass
+
+import dice_distribution
+from character_sheet import CharacterSheet
+
+# (probability the sheet wins, expected number of turns still to come)
+_Value = tuple[float, float]
+
+
+@dataclass(frozen=True, slots=True)
+class DuelOdds:
+    """Exact odds of `CharacterSheet.run_combat` between a sheet and its opponents."""
+    win: float
+    loss: float
+    # expected number of turns, each side's attacks count as one turn
+    rounds: float
+    # chance that the fight ends with the sheet spending a fate point
+    fate_spent: float
+    # chance that the sheet gets the initiative
+    initiative: float
+
+
+def initiative_probability(rogue_a: int, rogue_b: int) -> float:
+    """Chance of side a to win `gb_utils.initiative_check`, a d6 plus rogue each with ties rolled again."""
+    wins: int = 0
+    ties: int = 0
+    for roll_a, roll_b in itertools.product(range(1, 7), repeat=2):
+        wins += roll_a + rogue_a > roll_b + rogue_b
+        ties += roll_a + rogue_a == roll_b + rogue_b
+    return wins / (36 - ties)
+
+
+class DuelSolver:
+    """
+    Win probability and expected length of `CharacterSheet.run_combat` by dynamic programming.
+
+    The state of a fight is the HP of the sheet and of every opponent, whose turn it is, the opponent the
+    sheet attacks and whether its massive attack is still ready. Every hit does at least one point, so apart
+    from turns where everybody misses each state leads to states with less HP. The misses are solved for in
+    closed form and the rest is a memoized recursion over the HP. Opponents act in random order: up to
+    `max_opponents` of the living ones attack, and the first of them is who the sheet attacks next.
+    Opponents that share their stats are interchangeable, states only differing in which of them has which
+    HP are solved once. The state space grows with the product of the opponents' HP, this is meant for
+    duels and small groups.
+
+    The massive attack of opponents is not modelled.
+    """
+
+    def __init__(self, sheet: CharacterSheet, opponents: CharacterSheet | list[CharacterSheet],
+                 max_opponents: int = 3):
+        self.sheet: CharacterSheet = sheet
+        self.opponents: list[CharacterSheet] = opponents if isinstance(opponents, list) else [opponents]
+        self.max_opponents: int = max_opponents
+        # opponents with the same stats share a kind, the HP within a kind are kept sorted
+        kinds: dict[tuple, int] = dict()
+        self._kind: list[int] = [kinds.setdefault(self._stats(opponent), len(kinds)) for opponent in self.opponents]
+        self._slots: list[list[int]] = [[index for index, kind in enumerate(self._kind) if kind == current]
+                                        for current in range(len(kinds))]
+        self._turns: dict[tuple[tuple[int, ...], bool], _Value] = dict()
+        self._hits: dict[tuple[int, int], float] = dict()
+        self._damage: dict[tuple[str, int], list[tuple[int, float]]] = dict()
+        self._losses: dict[tuple[int, int, int], list[tuple[int, float]]] = dict()
+        self._attacks: dict[tuple[tuple[int, ...], bool, int], tuple[float, _Value]] = dict()
+
+    @staticmethod
+    def _stats(sheet: CharacterSheet) -> tuple:
+        return (sheet.attack_at(sheet.hit_points_max), sheet.attack_at(0), sheet.defense, sheet.hit_points_max,
+                sheet.damage_at(sheet.hit_points_max), sheet.damage_at(0))
+
+    def solve(self) -> DuelOdds:
+        hps: tuple[int, ...] = tuple(opponent.hit_points for opponent in self.opponents)
+        initiative: float = initiative_probability(self.sheet.rogue, self.opponents[0].rogue)
+        win: float
+        rounds: float
+        if self.sheet.hit_points <= 0 or not any(hp > 0 for hp in hps):
+            win, rounds = float(self.sheet.hit_points > 0), 0.0
+        else:
+            state: tuple[int, ...] = (self.sheet.hit_points, *hps)
+            massive: bool = self.sheet.massive_attack
+            target: int = next(index for index, hp in enumerate(hps) if hp > 0)
+            first: _Value = self._sheet_turn(state, massive, target, self._opponents_turn(state, massive))
+            second: _Value = self._opponents_turn(state, massive)
+            win = initiative * first[0] + (1 - initiative) * second[0]
+            rounds = initiative * first[1] + (1 - initiative) * second[1]
+        return DuelOdds(win=win, loss=1 - win, rounds=rounds, fate_spent=(1 - win) if self.sheet.fate else 0.0,
+                        initiative=initiative)
+
+    def _hit(self, attack: int, defense: int) -> float:
+        key: tuple[int, int] = (attack, defense)
+        if key not in self._hits:
+            self._hits[key] = dice_distribution.hit_probability(attack, defense)
+        return self._hits[key]
+
+    def _damage_of(self, die: str, cap: int) -> list[tuple[int, float]]:
+        """
+        Damage of a hit against `cap` HP, `CharacterSheet.take_damage_roll` does at least one point. Damage
+        of `cap` or more kills either way and is counted as `cap`, this cuts off the explosion chains.
+        """
+        key: tuple[str, int] = (die, cap)
+        if key not in self._damage:
+            damage: dice_distribution.Distribution = dice_distribution.distribution(die).clamp(1)
+            self._damage[key] = [(value, p) for value, p in damage.items() if value < cap] \
+                + [(cap, damage.at_least(cap))]
+        return self._damage[key]
+
+    def _loss(self, index: int, hp: int, cap: int) -> list[tuple[int, float]]:
+        """HP the sheet loses to one attack of an opponent with `hp` left, a miss loses nothing."""
+        key: tuple[int, int, int] = (self._kind[index], hp, cap)
+        if key not in self._losses:
+            opponent: CharacterSheet = self.opponents[index]
+            hit: float = self._hit(opponent.attack_at(hp), self.sheet.defense)
+            self._losses[key] = [(0, 1 - hit)] + [(damage, hit * p)
+                                                  for damage, p in self._damage_of(opponent.damage_at(hp), cap)]
+        return self._losses[key]
+
+    def _canonical(self, hps: tuple[int, ...]) -> tuple[int, ...]:
+        """The opponents' HP sorted within every kind, states of interchangeable opponents coincide."""
+        result: list[int] = list(hps)
+        for indexes in self._slots:
+            for index, hp in zip(indexes, sorted(hps[index] for index in indexes)):
+                result[index] = hp
+        return tuple(result)
+
+    def _sheet_attack(self, state: tuple[int, ...], massive: bool, target: int) -> tuple[float, _Value]:
+        """Chance the sheet misses the target and the value of the states after a hit, weighted."""
+        key: tuple[tuple[int, ...], bool, int] = (state, massive, target)
+        if key in self._attacks:
+            return self._attacks[key]
+        sheet_hp: int = state[0]
+        hp: int = state[1 + target]
+        hit: float = self._hit(self.sheet.attack_at(sheet_hp), self.opponents[target].defense)
+        win: float = 0.0
+        rounds: float = 0.0
+        for damage, p in self._damage_of(self.sheet.damage_at(sheet_hp, massive), hp):
+            after: list[int] = list(state)
+            after[1 + target] = hp - damage
+            if not any(after[1:]):
+                win += hit * p
+                continue
+            value: _Value = self._opponents_turn(tuple(after), False)
+            win += hit * p * value[0]
+            rounds += hit * p * value[1]
+        self._attacks[key] = 1 - hit, (win, rounds)
+        return self._attacks[key]
+
+    def _sheet_turn(self, state: tuple[int, ...], massive: bool, target: int, opponents: _Value) -> _Value:
+        """Value of the sheet's turn, `opponents` is the value of the opponents' turn with the same HP."""
+        miss, (win, rounds) = self._sheet_attack(state, massive, target)
+        return win + miss * opponents[0], 1 + rounds + miss * opponents[1]
+
+    def _opponents_turn(self, state: tuple[int, ...], massive: bool) -> _Value:
+        value: _Value | None = self._turns.get((state, massive))
+        if value is not None:
+            return value
+        key: tuple[tuple[int, ...], bool] = ((state[0], *self._canonical(state[1:])), massive)
+        if key in self._turns:
+            self._turns[(state, massive)] = self._turns[key]
+            return self._turns[key]
+        state = key[0]
+        sheet_hp: int = state[0]
+        living: list[int] = [index for index, hp in enumerate(state[1:]) if hp > 0]
+        groups: list[tuple[int, ...]] = list(itertools.combinations(living, min(self.max_opponents, len(living))))
+
+        # the opponents' turn is V = 1 + sum over targets t of w_t * V_t + rest, where w_t is the chance
+        # that t attacks first and nobody hits, and the sheet's turn against t is V_t = 1 + miss_t * V + rest_t
+        loop: float = 0.0
+        win: float = 0.0
+        rounds: float = 1.0
+        for group in groups:
+            losses: dict[int, float] = {0: 1.0}
+            for index in group:
+                following: dict[int, float] = dict()
+                for lost, p in losses.items():
+                    for damage, q in self._loss(index, state[1 + index], sheet_hp - lost):
+                        total: int = lost + damage
+                        following[total] = following.get(total, 0.0) + p * q
+                losses = following
+            for target in group:
+                weight: float = 1 / (len(groups) * len(group))
+                for lost, p in losses.items():
+                    if lost >= sheet_hp:
+                        continue
+                    after: tuple[int, ...] = (sheet_hp - lost, *state[1:])
+                    if lost:
+                        following_turn: _Value = self._opponents_turn(after, massive)
+                        sheet_turn: _Value = self._sheet_turn(after, massive, target, following_turn)
+                        win += weight * p * sheet_turn[0]
+                        rounds += weight * p * sheet_turn[1]
+                        continue
+                    miss, (rest_win, rest_rounds) = self._sheet_attack(after, massive, target)
+                    loop += weight * p * miss
+                    win += weight * p * rest_win
+                    rounds += weight * p * (1 + rest_rounds)
+        value = (win / (1 - loop), rounds / (1 - loop))
+        self._turns[key] = value
+        return value
+
+
+def solve(sheet: CharacterSheet, opponents: CharacterSheet | list[CharacterSheet], max_opponents: int = 3) -> DuelOdds:
+    return DuelSolver(sheet, opponents, max_opponents).solve()
@@ -1,10 +1,10 @@
+import copy
 import random
 from dataclasses import dataclass
 from dataclasses import field
 
-import dice
-
 import gamebook_core
+from catalog import Catalog
 from skills import CharacterSkill
 from skills import CharacterSkillsList
 
@@ -211,19 +211,22 @@ class Shield(gamebook_core.AbstractItem):
 
     @classmethod
     def list(cls) -> list["Shield"]:
-        shields: list["Shield"] = list()
-        shields.append(Shield("Small Shield", 1, 2, 5))
-        shields.append(Shield("Large Shield", 2, 4, 12))
-        shields.append(Shield("Tower Shield", 3, 6, 15))
-        return shields
+        return _shields.list()
 
     @classmethod
     def by_name(cls, name: str) -> "Shield":
-        shields = cls.list()
-        for shield in shields:
-            if name.lower() in shield.name.lower():
-                return shield
-        return shields[0]
+        return _shields.containing(name) or _shields.list()[0]
+
+
+def _build_shields() -> list[Shield]:
+    shields: list[Shield] = list()
+    shields.append(Shield("Small Shield", 1, 2, 5))
+    shields.append(Shield("Large Shield", 2, 4, 12))
+    shields.append(Shield("Tower Shield", 3, 6, 15))
+    return shields
+
+
+_shields: Catalog = Catalog(_build_shields, lambda shield: shield.name, copy.copy)
 
 
 @dataclass(slots=True)
@@ -292,30 +295,37 @@ class Item(gamebook_core.AbstractItem):
 
     @classmethod
     def list(cls) -> list["Item"]:
-        items: list["Item"] = list()
-        items.append(Item("Adventurer's Kit", "", 5))
-        items.append(Item("Backpack", "", 4))
-        items.append(Item("Cask of Beer", "", 6))
-        items.append(Item("Cask of Wine", "", 9))
-        items.append(Item("Donkey", "", 25))
-        items.append(Item("Iron Rations (1 week)", "", 14))
-        items.append(Item("Lantern", "", 5))
-        items.append(Item("Lock Pick", "", 2))
-        items.append(Item("Noble's Clothing", "", 12))
-        items.append(Item("Common Clothing", "", 3))
-        items.append(Item("Ox Cart", "", 7))
-        items.append(Item("Packhorse", "", 30))
-        items.append(Item("Pickaxe", "", 3))
-        items.append(Item("Pole (3 Yard)", "", 1))
-        items.append(Item("Rations (1 week)", "", 7))
-        items.append(Item("Riding Horse", "", 75))
-        items.append(Item("Rope (10 yards)", "", 2))
-        items.append(Item("Saddle Bags, Saddle, and Bridle", "", 8))
-        items.append(Item("Torch", "", 1))
-        items.append(Item("Travel Clothing", "", 5))
-        items.append(Item("Warhorse", "", 150))
-        items.append(Item("Spellbook", "", 20))
-        return items
+        return _items.list()
+
+
+def _build_items() -> list[Item]:
+    items: list[Item] = list()
+    items.append(Item("Adventurer's Kit", "", 5))
+    items.append(Item("Backpack", "", 4))
+    items.append(Item("Cask of Beer", "", 6))
+    items.append(Item("Cask of Wine", "", 9))
+    items.append(Item("Donkey", "", 25))
+    items.append(Item("Iron Rations (1 week)", "", 14))
+    items.append(Item("Lantern", "", 5))
+    items.append(Item("Lock Pick", "", 2))
+    items.append(Item("Noble's Clothing", "", 12))
+    items.append(Item("Common Clothing", "", 3))
+    items.append(Item("Ox Cart", "", 7))
+    items.append(Item("Packhorse", "", 30))
+    items.append(Item("Pickaxe", "", 3))
+    items.append(Item("Pole (3 Yard)", "", 1))
+    items.append(Item("Rations (1 week)", "", 7))
+    items.append(Item("Riding Horse", "", 75))
+    items.append(Item("Rope (10 yards)", "", 2))
+    items.append(Item("Saddle Bags, Saddle, and Bridle", "", 8))
+    items.append(Item("Torch", "", 1))
+    items.append(Item("Travel Clothing", "", 5))
+    items.append(Item("Warhorse", "", 150))
+    items.append(Item("Spellbook", "", 20))
+    return items
+
+
+_items: Catalog = Catalog(_build_items, lambda item: item.name, copy.copy)
 
 
 @dataclass(slots=True)
@@ -386,24 +396,27 @@ class Armor(gamebook_core.AbstractItem):
 
     @classmethod
     def list(cls) -> list["Armor"]:
-        armors: list["Armor"] = list()
-        armors.append(Armor("Clothes", 0, 0, 3))
-        armors.append(Armor("Padded Cloth", 1, 0, 8))
-        armors.append(Armor("Leather", 2, 1, 15))
-        armors.append(Armor("Scale", 3, 2, 23))
-        armors.append(Armor("Lamellar", 4, 3, 35))
-        armors.append(Armor("Chain", 5, 4, 70))
-        armors.append(Armor("Light Plate", 6, 5, 90))
-        armors.append(Armor("Heavy Plate", 7, 5, 120))
-        return armors
+        return _armors.list()
 
     @classmethod
     def by_name(cls, name: str) -> "Armor":
-        armor: Armor
-        for armor in cls.list():
-            if name.lower() in armor._name.lower():
-                return armor
-        return cls.list()[0]
+        return _armors.containing(name) or _armors.list()[0]
+
+
+def _build_armors() -> list[Armor]:
+    armors: list[Armor] = list()
+    armors.append(Armor("Clothes", 0, 0, 3))
+    armors.append(Armor("Padded Cloth", 1, 0, 8))
+    armors.append(Armor("Leather", 2, 1, 15))
+    armors.append(Armor("Scale", 3, 2, 23))
+    armors.append(Armor("Lamellar", 4, 3, 35))
+    armors.append(Armor("Chain", 5, 4, 70))
+    armors.append(Armor("Light Plate", 6, 5, 90))
+    armors.append(Armor("Heavy Plate", 7, 5, 120))
+    return armors
+
+
+_armors: Catalog = Catalog(_build_armors, lambda armor: armor._name, copy.copy)
 
 
 class Weapon(gamebook_core.AbstractItem):
@@ -548,40 +561,44 @@ class Weapon(gamebook_core.AbstractItem):
 
     @classmethod
     def by_name(cls, name: str):
-        for weapon in Weapon.list():
-            if weapon._name.lower() == name.lower():
-                return weapon
-        return random.choice(Weapon.list())
+        weapon: Weapon | None = _weapons.named(name)
+        if weapon is None:
+            return _weapons.choice()
+        return weapon
 
     @classmethod
     def random(cls) -> "Weapon":
-        return random.choice(cls.list())
+        return _weapons.choice()
 
     @classmethod
     def list(cls) -> list["Weapon"]:
-        weapons: list["Weapon"] = list()
-        weapons.append(Weapon("Axe", CharacterSkillsList.skill_by_name("Axes"), "1d6x", 5))
-        weapons.append(Weapon("Bow", CharacterSkillsList.skill_by_name("Bows"), "1d6x", 4, two_handed=True))
-        weapons.append(Weapon("Crossbow", CharacterSkillsList.skill_by_name("Bows"), "1d6x+3", 8))
-        weapons.append(Weapon("Dagger", CharacterSkillsList.skill_by_name("Daggers"), "1d6x-2", 2))
-        weapons.append(Weapon("Dragon Pistol", CharacterSkillsList.skill_by_name("Firearms"), "1d6x+4", 18))
-        weapons.append(Weapon("Dragon Rifle", CharacterSkillsList.skill_by_name("Firearms"), "2d6x", 25))
-        weapons.append(Weapon("Halberd", CharacterSkillsList.skill_by_name("Axes"), "1d6x", 7))
-        weapons.append(Weapon("Longbow", CharacterSkillsList.skill_by_name("Bows"), "1d6x+2", 0))
-        weapons.append(Weapon("Mace", CharacterSkillsList.skill_by_name("Blunt"), "1d6x", 5))
-        weapons.append(Weapon("Spear", CharacterSkillsList.skill_by_name("Thrown"), "1d6x", 3))
-        weapons.append(Weapon("Staff", CharacterSkillsList.skill_by_name("Blunt"), "1d6x", 2))
-        weapons.append(Weapon("Sword", CharacterSkillsList.skill_by_name("Swords"), "1d6x", 5))
-        weapons.append(Weapon("Throwing Star", CharacterSkillsList.skill_by_name("Thrown"), "1d6x-2", 2))
-        weapons.append(Weapon("Warhammer", CharacterSkillsList.skill_by_name("Blunt"), "1d6x", 5))
-        two_handed_flame_axe: Weapon = Weapon("Black Axe",  #
-                                              skill=CharacterSkillsList.skill_by_name("Axes"),  #
-                                              base_damage="2d6x",  #
-                                              cost=50000,  #
-                                              two_handed=True)
-        two_handed_flame_axe.attack_bonus = 1
-        two_handed_flame_axe.damage_bonus = 1
-        two_handed_flame_axe._description = """
+        return _weapons.list()
+
+
+def _build_weapons() -> list[Weapon]:
+    weapons: list[Weapon] = list()
+    weapons.append(Weapon("Axe", CharacterSkillsList.skill_by_name("Axes"), "1d6x", 5))
+    weapons.append(Weapon("Bow", CharacterSkillsList.skill_by_name("Bows"), "1d6x", 4, two_handed=True))
+    weapons.append(Weapon("Crossbow", CharacterSkillsList.skill_by_name("Bows"), "1d6x+3", 8))
+    weapons.append(Weapon("Dagger", CharacterSkillsList.skill_by_name("Daggers"), "1d6x-2", 2))
+    weapons.append(Weapon("Dragon Pistol", CharacterSkillsList.skill_by_name("Firearms"), "1d6x+4", 18))
+    weapons.append(Weapon("Dragon Rifle", CharacterSkillsList.skill_by_name("Firearms"), "2d6x", 25))
+    weapons.append(Weapon("Halberd", CharacterSkillsList.skill_by_name("Axes"), "1d6x", 7))
+    weapons.append(Weapon("Longbow", CharacterSkillsList.skill_by_name("Bows"), "1d6x+2", 0))
+    weapons.append(Weapon("Mace", CharacterSkillsList.skill_by_name("Blunt"), "1d6x", 5))
+    weapons.append(Weapon("Spear", CharacterSkillsList.skill_by_name("Thrown"), "1d6x", 3))
+    weapons.append(Weapon("Staff", CharacterSkillsList.skill_by_name("Blunt"), "1d6x", 2))
+    weapons.append(Weapon("Sword", CharacterSkillsList.skill_by_name("Swords"), "1d6x", 5))
+    weapons.append(Weapon("Throwing Star", CharacterSkillsList.skill_by_name("Thrown"), "1d6x-2", 2))
+    weapons.append(Weapon("Warhammer", CharacterSkillsList.skill_by_name("Blunt"), "1d6x", 5))
+    two_handed_flame_axe: Weapon = Weapon("Black Axe",  #
+                                          skill=CharacterSkillsList.skill_by_name("Axes"),  #
+                                          base_damage="2d6x",  #
+                                          cost=50000,  #
+                                          two_handed=True)
+    two_handed_flame_axe.attack_bonus = 1
+    two_handed_flame_axe.damage_bonus = 1
+    two_handed_flame_axe._description = """
 The blades are a solid black with red etchings following along their cutting edges.
 The hand grip is wrapped in a black leather that is stamped with dark blood red arcane symbols.
 The top of the hand grip has a circle of dark blood red leather as does the bottom of the hand grip.
@@ -589,6 +606,16 @@ From the edge of the hasp dangles a dark blood red leather strip loop.
 Attack Bonus: +1, Damage Bonus: +1, Grants dark sight 60ft.
 The blade edges become wreathed in flame when attacking. The +1 effects are from the flames. 
 """
-        weapons.append(two_handed_flame_axe)
+    weapons.append(two_handed_flame_axe)
+
+    return weapons
+
+
+def _copy_weapon(weapon: Weapon) -> Weapon:
+    weapon = copy.copy(weapon)
+    if weapon.skill is not None:
+        weapon.skill = copy.copy(weapon.skill)
+    return weapon
+
 
-        return weapons
+_weapons: Catalog = Catalog(_build_weapons, lambda weapon: weapon._name, _copy_weapon)
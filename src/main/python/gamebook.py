@@ -8,27 +8,30 @@ exec python "$0" "$@"
 exit $?
 ''"""
 import os
+import shlex
+import sys
 import time
 from datetime import timedelta
 
+from gamebook_parser import IncrementalParser
+from gamebook_link import write_room_modules
+from gb_compiler import CompiledBook
 from gb_compiler import GamebookCompiler
 from lark import UnexpectedCharacters
-from lark import Lark
 
 base_name: str = "gb1"
 
 
 def main() -> None:
     start = time.time()
-    parser: Lark
-    with open("lark/gamebook.lark") as r:
-        # parser = Lark(r, cache=None, parser="earley", lexer="dynamic_complete", ambiguity="resolve")  # parser="lalr")
-        parser = Lark(r, cache=None, parser="lalr", propagate_positions=True)
+    gbc: GamebookCompiler = GamebookCompiler()
     gb: str
     with open("gamebooks/" + base_name + ".gb") as r:
         gb = r.read()
+    # only rooms edited since the last run are parsed again
+    rooms_parser: IncrementalParser = IncrementalParser("gamebooks/__pycache__/" + base_name + ".rooms.pickle")
     try:
-        tree = parser.parse(gb)
+        tree = rooms_parser.parse(gb)
     except UnexpectedCharacters as e:
         print(e)
         for rule in e.considered_rules:
@@ -36,18 +39,21 @@ def main() -> None:
             break
         return
 
+    rooms_parser.save()
+
     with open("gamebooks/" + base_name + ".tree.txt", "w") as w:
         w.write(tree.pretty())
         w.write("\n")
 
-    gbc: GamebookCompiler = GamebookCompiler()  # gbi.visit(tree)
     with open("gamebooks/" + base_name + ".py", "w") as w:
-        program: str = gbc.visit(tree)
-        for part in program:
-            w.write(part)
+        # the compiler writes the program straight into the file, every room goes into a module of its own
+        book: CompiledBook = gbc.compile(tree, w, room_modules=base_name + "_rooms")
         w.write("\n")
+    # unchanged room modules keep their cached bytecode
+    write_room_modules("gamebooks/" + base_name + "_rooms", book.room_sources)
 
-    os.system("cd gamebooks; python " + base_name + ".py")
+    # remaining command line arguments are passed on to the compiled gamebook, e.g. --order bfs
+    os.system("cd gamebooks; python " + base_name + ".py " + shlex.join(sys.argv[1:]))
     execution_time = time.time() - start
     print(timedelta(seconds=execution_time))
 
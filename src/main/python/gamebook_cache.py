@@ -0,0 +1,406 @@
+import hashlib
+import os
+import pickle
+import random
+import sqlite3
+import sys
+import types
+from collections.abc import Callable
+from collections.abc import Iterator
+
+import gamebook_core
+import gamebook_state
+
+# library module variables that carry over from one room to the next, they are part of every cache key
+_module_globals: tuple[tuple[str, str], ...] = (("character_sheet", "_id"), ("mob_combat", "_mob_counter"),
+                                               ("npcs", "_npc_section_tag"), ("room_descriptions", "_rooms"))
+_schema: int = 1
+# values written back into closures and library modules when a record is replayed
+_replayable: tuple[type, ...] = (type(None), bool, int, float, str)
+
+
+class _Empty:
+    """Stands in for a closure cell that has not been assigned yet."""
+
+
+def code_digest(code: types.CodeType) -> str:
+    """Hash of what a code object does. Line numbers are left out, moving a room around does not change it."""
+    sha = hashlib.sha256()
+    for part in (code.co_name, code.co_names, code.co_varnames, code.co_freevars, code.co_cellvars):
+        sha.update(repr(part).encode("utf-8"))
+    sha.update(code.co_code)
+    sha.update(getattr(code, "co_exceptiontable", b""))
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            sha.update(code_digest(const).encode("utf-8"))
+        elif isinstance(const, frozenset):
+            sha.update(repr(sorted([repr(item) for item in const])).encode("utf-8"))
+        else:
+            sha.update(repr((type(const).__name__, const)).encode("utf-8"))
+    return sha.hexdigest()
+
+
+def _cell_value(cell: types.CellType) -> any:
+    try:
+        return cell.cell_contents
+    except ValueError:
+        return _Empty
+
+
+class _Record:
+    """
+    Everything an explored request did to the shared exploration tables.
+
+    `events` replays the node table lookups ("?") and writes ("="), label counter updates ("n"), reported pages
+    ("o", "p") and nested cached requests ("s") in the order they happened. `deps` holds the code digest of every
+    room that was run while exploring it.
+    """
+    __slots__ = ("events", "deps", "node_id", "end")
+
+    def __init__(self, events: list[tuple], deps: dict[str, str], node_id: str, end: tuple):
+        self.events = events
+        self.deps = deps
+        self.node_id = node_id
+        self.end = end
+
+
+class Context:
+    """Cache key of a request, with the closure and library variable digests it was requested with."""
+    __slots__ = ("key", "request", "cells", "modules")
+
+    def __init__(self, key: str, request: Callable, cells: list[int], modules: list[int]):
+        self.key = key
+        self.request = request
+        self.cells = cells
+        self.modules = modules
+
+
+class _Recording:
+    __slots__ = ("context", "depth", "events", "deps", "poisoned")
+
+    def __init__(self, context: Context, depth: int):
+        self.context = context
+        self.depth = depth
+        self.events: list[tuple] = list()
+        self.deps: dict[str, str] = dict()
+        self.poisoned: bool = False
+
+
+class _NodeTable(dict):
+    __slots__ = ("cache",)
+
+    def __init__(self, cache: "ExplorationCache", data: dict):
+        super().__init__(data)
+        self.cache = cache
+
+    def __contains__(self, key: any) -> bool:
+        if self.cache._events is not None:
+            self.cache._events.append(("?", key, dict.get(self, key)))
+        return dict.__contains__(self, key)
+
+    def __getitem__(self, key: any) -> any:
+        if self.cache._events is not None:
+            self.cache._events.append(("?", key, dict.get(self, key)))
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key: any, value: any) -> None:
+        if self.cache._events is not None:
+            self.cache._events.append(("=", key, value))
+        dict.__setitem__(self, key, value)
+
+
+class _Counters(dict):
+    __slots__ = ("cache",)
+
+    def __init__(self, cache: "ExplorationCache", data: dict):
+        super().__init__(data)
+        self.cache = cache
+
+    def __setitem__(self, key: any, value: any) -> None:
+        if self.cache._events is not None:
+            self.cache._events.append(("n", key, dict.get(self, key), value))
+        dict.__setitem__(self, key, value)
+
+
+class _Pages:
+    """Journals the pages the program reports before passing them on to its own report function."""
+    __slots__ = ("cache", "tag", "report")
+
+    def __init__(self, cache: "ExplorationCache", tag: str, report: Callable):
+        self.cache = cache
+        self.tag = tag
+        self.report = report
+
+    def __call__(self, *args: any) -> None:
+        if self.cache._events is not None:
+            self.cache._events.append((self.tag, *args))
+        self.report(*args)
+
+
+class ExplorationCache:
+    """
+    Keeps explored subtrees of a compiled gamebook in a SQLite database so the next build can reuse them.
+
+    Only options explored after the first one of a room are cached, they start from a restored snapshot so
+    their outcome depends on nothing but the key: the code of the room, the state checksum, the random state,
+    the turn stack, the closure of the option and the library counters. A cached subtree also depends on what
+    the node table held when it was explored, so it is only replayed when every recorded lookup still gives
+    the same answer and none of the rooms it ran have changed. Anything else is explored again.
+
+    The compiled gamebook passes its globals, the node table and label counters are replaced with journaling
+    dicts, its `page_appended` and `page_finished` functions with journaling wrappers. Replayed pages are passed
+    to the functions it had.
+    """
+
+    def __init__(self, path: str, namespace: dict[str, any]):
+        self.path: str = path
+        self.namespace: dict[str, any] = namespace
+        self.hits: int = 0
+        self.misses: int = 0
+        self._database: sqlite3.Connection = sqlite3.connect(path)
+        self._database.execute("create table if not exists meta (name text primary key, value text)")
+        self._database.execute("create table if not exists records (id text primary key, key text, record blob)")
+        self._database.execute("create index if not exists records_key on records (key)")
+        self._environment: str = self._environment_digest()
+        stored = self._database.execute("select value from meta where name = 'environment'").fetchone()
+        if stored is None or stored[0] != self._environment:
+            self._database.execute("delete from records")
+        self._code: dict[str, str] = dict()
+        self._records: dict[str, _Record | None] = dict()
+        self._candidates: dict[str, list[str]] = dict()
+        self._new: dict[str, tuple[str, bytes]] = dict()
+        self._used: set[str] = set()
+        self._recordings: list[_Recording] = list()
+        self._events: list[tuple] | None = None
+
+        namespace["node_id_by_hash"] = _NodeTable(self, namespace["node_id_by_hash"])
+        namespace["_node_id"] = _Counters(self, namespace["_node_id"])
+        self._pages: dict[str, _Pages] = {"o": _Pages(self, "o", namespace["page_finished"]),
+                                          "p": _Pages(self, "p", namespace["page_appended"])}
+        namespace["page_finished"] = self._pages["o"]
+        namespace["page_appended"] = self._pages["p"]
+
+    def _environment_digest(self) -> str:
+        # anything a cached subtree may depend on besides its own rooms, a change throws the whole cache away
+        sha = hashlib.sha256(f"{_schema} {sys.version}".encode("utf-8"))
+        library: str = os.path.dirname(os.path.abspath(__file__))
+        for name, module in sorted(sys.modules.items()):
+            file: str | None = getattr(module, "__file__", None)
+            if not file or os.path.dirname(os.path.abspath(file)) != library:
+                continue
+            sha.update(name.encode("utf-8"))
+            with open(file, "rb") as r:
+                sha.update(r.read())
+        lookup: dict[str, Callable] = self.namespace["room_function_lookup"]
+        rooms: set[str] = {function.__name__ for function in lookup.values()}
+        sha.update(repr(sorted([(title, function.__name__) for title, function in lookup.items()])).encode("utf-8"))
+        sha.update(repr(sorted(self.namespace.get("ignore_pickle_keys", ()))).encode("utf-8"))
+        for name, value in sorted(self.namespace.items()):
+            if isinstance(value, types.FunctionType) and name not in rooms:
+                sha.update(f"{name} {code_digest(value.__code__)}".encode("utf-8"))
+        return sha.hexdigest()
+
+    def _room_code(self, request: Callable) -> tuple[str, str]:
+        # option, direction and goto functions are nested in their room, the room's code covers them
+        room: str = request.__qualname__.split(".")[0]
+        if room not in self._code:
+            function: any = self.namespace.get(room)
+            code: types.CodeType = function.__code__ if isinstance(function, types.FunctionType) else request.__code__
+            self._code[room] = code_digest(code)
+        return room, self._code[room]
+
+    @staticmethod
+    def _module_values() -> list[any]:
+        values: list[any] = list()
+        for module_name, name in _module_globals:
+            module: types.ModuleType | None = sys.modules.get(module_name)
+            values.append(getattr(module, name, None) if module is not None else None)
+        return values
+
+    def _context(self, request: Callable) -> Context:
+        cells: list[int] = [gamebook_state.digest(_cell_value(cell)) for cell in request.__closure__ or ()]
+        modules: list[int] = [gamebook_state.digest(value) for value in self._module_values()]
+        parts: tuple = (request.__qualname__, self._room_code(request)[1], self.namespace["state_checksum"](),
+                        gamebook_state.digest(request.__defaults__), cells, modules,
+                        gamebook_state.digest(random.getstate()), gamebook_core._turn)
+        return Context(hashlib.sha256(repr(parts).encode("utf-8")).hexdigest(), request, cells, modules)
+
+    def _load(self, record_id: str) -> _Record | None:
+        if record_id not in self._records:
+            row = self._database.execute("select record from records where id = ?", (record_id,)).fetchone()
+            self._records[record_id] = pickle.loads(row[0]) if row is not None else None
+        return self._records[record_id]
+
+    def _walk(self, record_id: str) -> Iterator[tuple]:
+        # flattens nested records without recursion, exploration can be much deeper than the stack
+        record: _Record | None = self._load(record_id)
+        if record is None:
+            yield "x", record_id
+            return
+        yield "c", record
+        stack: list[Iterator[tuple]] = [iter(record.events)]
+        while stack:
+            event: tuple | None = next(stack[-1], None)
+            if event is None:
+                stack.pop()
+                continue
+            if event[0] != "s":
+                yield event
+                continue
+            record = self._load(event[1])
+            if record is None:
+                yield "x", event[1]
+                return
+            yield "c", record
+            stack.append(iter(record.events))
+
+    def _valid(self, record_id: str) -> bool:
+        nodes: dict = self.namespace["node_id_by_hash"]
+        counters: dict = self.namespace["_node_id"]
+        written_nodes: dict = dict()
+        written_counters: dict = dict()
+        for event in self._walk(record_id):
+            kind: str = event[0]
+            if kind == "x":
+                return False
+            if kind == "c":
+                for room, digest in event[1].deps.items():
+                    function: any = self.namespace.get(room)
+                    if not isinstance(function, types.FunctionType) or self._room_code(function)[1] != digest:
+                        return False
+            elif kind == "?":
+                current = written_nodes[event[1]] if event[1] in written_nodes else dict.get(nodes, event[1])
+                if current != event[2]:
+                    return False
+            elif kind == "=":
+                written_nodes[event[1]] = event[2]
+            elif kind == "n":
+                current = written_counters[event[1]] if event[1] in written_counters else dict.get(counters, event[1])
+                if current != event[2]:
+                    return False
+                written_counters[event[1]] = event[3]
+        return True
+
+    def _apply(self, record_id: str) -> None:
+        nodes: dict = self.namespace["node_id_by_hash"]
+        counters: dict = self.namespace["_node_id"]
+        self._used.add(record_id)
+        for event in self._walk(record_id):
+            kind: str = event[0]
+            if kind == "=":
+                dict.__setitem__(nodes, event[1], event[2])
+            elif kind in self._pages:
+                # replayed pages are reported to the program like explored ones
+                self._pages[kind].report(*event[1:])
+            elif kind == "n":
+                dict.__setitem__(counters, event[1], event[3])
+        # `_walk` expands nested records, their ids are collected separately
+        stack: list[str] = [record_id]
+        while stack:
+            for event in self._load(stack.pop()).events:
+                if event[0] == "s":
+                    self._used.add(event[1])
+                    stack.append(event[1])
+
+    def _candidate_ids(self, key: str) -> list[str]:
+        if key not in self._candidates:
+            rows = self._database.execute("select id from records where key = ?", (key,)).fetchall()
+            self._candidates[key] = [row[0] for row in rows]
+        return self._candidates[key]
+
+    def replay(self, request: Callable) -> tuple[Context, str | None]:
+        """Replay a cached exploration of the request, returns its node id or None when it has to be explored."""
+        context: Context = self._context(request)
+        for record_id in self._candidate_ids(context.key):
+            if not self._valid(record_id):
+                continue
+            self._apply(record_id)
+            record: _Record = self._records[record_id]
+            random_state, turns, cells, modules = record.end
+            random.setstate(random_state)
+            gamebook_core._turn[:] = turns
+            for index, value in cells:
+                request.__closure__[index].cell_contents = value
+            for index, value in modules:
+                module_name, name = _module_globals[index]
+                setattr(sys.modules[module_name], name, value)
+            if self._recordings:
+                self._recordings[-1].events.append(("s", record_id))
+            self.hits += 1
+            return context, record.node_id
+        self.misses += 1
+        return context, None
+
+    def begin(self, context: Context, depth: int) -> None:
+        """Start recording the exploration of a request, its generator sits at `depth` of the explorer stack."""
+        recording: _Recording = _Recording(context, depth)
+        self._recordings.append(recording)
+        self._events = recording.events
+
+    def executed(self, request: Callable) -> None:
+        if self._recordings:
+            room, digest = self._room_code(request)
+            self._recordings[-1].deps[room] = digest
+
+    def _pop(self, depth: int) -> _Recording | None:
+        if not self._recordings or self._recordings[-1].depth != depth:
+            return None
+        recording: _Recording = self._recordings.pop()
+        self._events = self._recordings[-1].events if self._recordings else None
+        return recording
+
+    def finished(self, depth: int, node_id: str) -> None:
+        """The generator at `depth` returned, store the recording started for it."""
+        recording: _Recording | None = self._pop(depth)
+        if recording is None:
+            return
+        parent: _Recording | None = self._recordings[-1] if self._recordings else None
+        context: Context = recording.context
+        cells: list[tuple[int, any]] = list()
+        for index, cell in enumerate(context.request.__closure__ or ()):
+            value: any = _cell_value(cell)
+            if gamebook_state.digest(value) == context.cells[index]:
+                continue
+            if type(value) in _replayable:
+                cells.append((index, value))
+            else:
+                # changes to objects can not be replayed, the request is explored every time
+                recording.poisoned = True
+        modules: list[tuple[int, any]] = list()
+        for index, value in enumerate(self._module_values()):
+            if gamebook_state.digest(value) == context.modules[index]:
+                continue
+            if type(value) in _replayable:
+                modules.append((index, value))
+            else:
+                recording.poisoned = True
+        if recording.poisoned:
+            if parent is not None:
+                parent.poisoned = True
+            return
+        record: _Record = _Record(recording.events, recording.deps, node_id,
+                                  (random.getstate(), list(gamebook_core._turn), cells, modules))
+        pickled: bytes = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        record_id: str = hashlib.sha256(pickled).hexdigest()
+        self._records[record_id] = record
+        self._new[record_id] = (context.key, pickled)
+        self._used.add(record_id)
+        if parent is not None:
+            parent.events.append(("s", record_id))
+
+    def failed(self, depth: int) -> None:
+        """The generator at `depth` raised, nothing it or the requests around it explored is stored."""
+        if self._pop(depth) is not None:
+            for recording in self._recordings:
+                recording.poisoned = True
+
+    def close(self) -> None:
+        """Store the new records and drop the ones this build did not use."""
+        with self._database:
+            self._database.execute("create temp table used (id text primary key)")
+            self._database.executemany("insert into used values (?)", [(record_id,) for record_id in self._used])
+            self._database.execute("delete from records where id not in (select id from used)")
+            self._database.executemany("insert or ignore into records values (?, ?, ?)",
+                                       [(record_id, key, pickled) for record_id, (key, pickled) in self._new.items()])
+            self._database.execute("insert or replace into meta values ('environment', ?)", (self._environment,))
+        self._database.close()
@@ -1,13 +1,21 @@
 import abc
+import bisect
 import dataclasses
+import heapq
 import random
 from abc import ABC
+from collections.abc import Iterable
+from typing import ClassVar
 
-import dice
+import dice_expr
+import gamebook_state
 
 
 @dataclasses.dataclass(slots=True)
-class AbstractItem(ABC):
+class AbstractItem(gamebook_state.Tracked, ABC):
+    # items whose name changes while they lie in a room, like the HP in the name of a mob
+    live_name: ClassVar[bool] = False
+
     @property
     @abc.abstractmethod
     def name(self) -> str:
@@ -20,7 +28,7 @@ class AbstractItem(ABC):
 
 
 @dataclasses.dataclass(slots=True)
-class AbstractCharacter(ABC):
+class AbstractCharacter(gamebook_state.Tracked, ABC):
 
     @property
     @abc.abstractmethod
@@ -28,30 +36,35 @@ class AbstractCharacter(ABC):
         return False
 
 
-@dataclasses.dataclass
+# the compass directions clockwise from north
+compass: str = "nesw"
+_facing_subj: tuple[str, ...] = ("front", "right", "rear", "left")
+_facing_obj: tuple[str, ...] = ("north", "east", "south", "west")
+_direction_as_option: tuple[str, ...] = ("Continue forwards.", "Turn right and continue.", "Go back.",
+                                         "Turn left and continue.")
+# relative_direction[facing][direction]: where a compass direction is for someone facing another one, as front,
+# right, rear or left, both compass directions counted clockwise from north
+relative_direction: tuple[tuple[int, ...], ...] = tuple(tuple((direction - facing) % 4 for direction in range(4))
+                                                        for facing in range(4))
+
+
+@dataclasses.dataclass(slots=True, repr=False)
 class Facing:
     _facing: int = 0
-    _facing_subj: dict[int, str] = dataclasses.field(default_factory=dict)
-    _facing_obj: dict[int, str] = dataclasses.field(default_factory=dict)
-    _direction_as_option: dict[int, str] = dataclasses.field(default_factory=dict)
-
-    def __post_init__(self):
-        self._facing: int = 0
 
-        self._facing_subj[0] = "front"
-        self._facing_subj[1] = "right"
-        self._facing_subj[2] = "rear"
-        self._facing_subj[3] = "left"
+    def __repr__(self) -> str:
+        # books print the facing, the tables are listed the way they were when every instance had its own
+        return f"Facing(_facing={self._facing}, _facing_subj={dict(enumerate(_facing_subj))}, " \
+               f"_facing_obj={dict(enumerate(_facing_obj))}, " \
+               f"_direction_as_option={dict(enumerate(_direction_as_option))})"
 
-        self._direction_as_option[0] = "Continue forwards."
-        self._direction_as_option[1] = "Turn right and continue."
-        self._direction_as_option[2] = "Go back."
-        self._direction_as_option[3] = "Turn left and continue."
+    def __fingerprint__(self) -> int:
+        return self._facing
 
-        self._facing_obj[0] = "north"
-        self._facing_obj[1] = "east"
-        self._facing_obj[2] = "south"
-        self._facing_obj[3] = "west"
+    @property
+    def fingerprint_revision(self) -> int:
+        # the facing index is the whole state, the lookup tables are shared by the module
+        return self._facing
 
     def face(self, direction: str):
         self.facing = direction
@@ -91,18 +104,12 @@ class Facing:
 
     @property
     def compass(self) -> str:
-        return self._facing_obj[self._facing]
+        return _facing_obj[self._facing]
 
     @property
     def facing(self) -> str:
-        if self._facing == 0:
-            return "n"
-        if self._facing == 1:
-            return "e"
-        if self._facing == 2:
-            return "s"
-        if self._facing == 3:
-            return "w"
+        if 0 <= self._facing < 4:
+            return compass[self._facing]
         return "UNKNOWN"
 
     def subj_idx(self, direction: int) -> int:
@@ -113,117 +120,195 @@ class Facing:
         if not facing:
             return
         facing = facing.strip().lower()[0]
-        if facing == "n":
-            self._facing = 0
-            return
-        if facing == "e":
-            self._facing = 1
-            return
-        if facing == "s":
-            self._facing = 2
-            return
-        if facing == "w":
-            self._facing = 3
+        if facing in compass:
+            self._facing = compass.index(facing)
             return
         print(f"Unknown facing: {facing}")
 
     @property
     def n(self) -> str:
-        return self._facing_subj[self.subj_idx(0)]
+        return _facing_subj[relative_direction[self._facing][0]]
 
     @property
     def e(self) -> str:
-        return self._facing_subj[self.subj_idx(1)]
+        return _facing_subj[relative_direction[self._facing][1]]
 
     @property
     def s(self) -> str:
-        return self._facing_subj[self.subj_idx(2)]
+        return _facing_subj[relative_direction[self._facing][2]]
 
     @property
     def w(self) -> str:
-        return self._facing_subj[self.subj_idx(3)]
+        return _facing_subj[relative_direction[self._facing][3]]
 
     # _direction_as_option
 
     @property
     def dn(self) -> str:
-        return self._direction_as_option[self.subj_idx(0)]
+        return _direction_as_option[relative_direction[self._facing][0]]
 
     @property
     def de(self) -> str:
-        return self._direction_as_option[self.subj_idx(1)]
+        return _direction_as_option[relative_direction[self._facing][1]]
 
     @property
     def ds(self) -> str:
-        return self._direction_as_option[self.subj_idx(2)]
+        return _direction_as_option[relative_direction[self._facing][2]]
 
     @property
     def dw(self) -> str:
-        return self._direction_as_option[self.subj_idx(3)]
+        return _direction_as_option[relative_direction[self._facing][3]]
 
 
 class Items:
+    """
+    The items and characters of a room, in the order they were added.
+
+    Lookups go through indexes the container keeps up to date itself: the names of the items sorted for
+    prefix lookups, built on first use, and the rendered inventory. Characters and items with a `live_name`
+    are kept apart and looked at directly, their names change with their HP. Other items are indexed by their
+    name, an item is indexed again when it was written to since, like an `Item` getting a location or `Money`
+    a new quantity. The indexes are left out of the state fingerprint, only the items count.
+    """
     _inv: list[AbstractItem] = list()
 
     def __init__(self):
         self._inv: list[AbstractItem] = list()
+        # ascending sequence number of every entry of _inv
+        self._order: list[int] = list()
+        self._added: int = 0
+        # (sequence number, entry) of the characters and items with a live name, in the order of _inv
+        self._live: list[tuple[int, AbstractItem | AbstractCharacter]] = list()
+        # (name, sequence number, item) of everything else sorted by name, and the name each was indexed by
+        self._names: list[tuple[str, int, AbstractItem]] | None = None
+        self._keys: dict[int, str] = dict()
+        # when the names were last checked, see `gamebook_state.written_since`
+        self._mark: tuple[int, int] = gamebook_state.mark()
+        self._rendered: str | None = None
+
+    def __fingerprint__(self) -> list[AbstractItem]:
+        return self._inv
+
+    def _index(self) -> list[tuple[str, int, AbstractItem]]:
+        if self._names is not None and self._mark != gamebook_state.mark():
+            self._rename()
+        if self._names is None:
+            self._keys = {seq: item.name for item, seq in zip(self._inv, self._order) if not _live(item)}
+            self._names = sorted((name, seq, self._inv[bisect.bisect_left(self._order, seq)])
+                                 for seq, name in self._keys.items())
+            self._mark = gamebook_state.mark()
+        return self._names
+
+    def _rename(self) -> None:
+        # index again the items written to since the last check whose name changed
+        since: tuple[int, int] = self._mark
+        self._mark = gamebook_state.mark()
+        for item, seq in zip(self._inv, self._order):
+            name: str | None = self._keys.get(seq)
+            if name is None or not gamebook_state.written_since(item, since) or item.name == name:
+                continue
+            del self._names[bisect.bisect_left(self._names, (name, seq))]
+            self._keys[seq] = item.name
+            bisect.insort(self._names, (self._keys[seq], seq, item))
+            self._rendered = None
+
+    def _find(self, item_name: str) -> int | None:
+        """Position of the first entry whose name starts with `item_name`."""
+        if not item_name:
+            return 0 if self._inv else None
+        first: int | None = None
+        for seq, entry in self._live:
+            if entry.name.startswith(item_name):
+                first = seq
+                break
+        names: list[tuple[str, int, AbstractItem]] = self._index()
+        position: int = bisect.bisect_left(names, (item_name,))
+        while position < len(names) and names[position][0].startswith(item_name):
+            if first is None or names[position][1] < first:
+                first = names[position][1]
+            position += 1
+        return None if first is None else bisect.bisect_left(self._order, first)
+
+    def _remove(self, position: int) -> AbstractItem:
+        item: AbstractItem = self._inv.pop(position)
+        seq: int = self._order.pop(position)
+        if _live(item):
+            self._live.remove((seq, item))
+        elif self._names is not None:
+            del self._names[bisect.bisect_left(self._names, (self._keys.pop(seq), seq))]
+        self._rendered = None
+        return item
+
+    def refresh(self) -> None:
+        """Index all names again."""
+        self._names = None
+        self._rendered = None
 
     def add(self, item: AbstractItem):
+        seq: int = self._added
+        self._added += 1
         self._inv.append(item)
+        self._order.append(seq)
+        if _live(item):
+            self._live.append((seq, item))
+        elif self._names is not None:
+            self._keys[seq] = item.name
+            bisect.insort(self._names, (self._keys[seq], seq, item))
+        self._rendered = None
 
     def drop(self, item: AbstractItem):
         if isinstance(item, AbstractItem):
-            self._inv.remove(item)
+            self._remove(self._inv.index(item))
             return
 
     def item(self, item_name: str) -> AbstractItem:
-        for item in self._inv:
-            if item.name.startswith(item_name):
-                return item
+        position: int | None = self._find(item_name)
+        if position is not None:
+            return self._inv[position]
 
     def pop(self, item_name: str) -> AbstractItem:
-        for item in self._inv:
-            if item.name.startswith(item_name):
-                self._inv.remove(item)
-                return item
+        position: int | None = self._find(item_name)
+        if position is not None:
+            return self._remove(position)
 
     def clear(self) -> None:
         self._inv.clear()
+        self._order.clear()
+        self._live.clear()
+        self._names = None
+        self._rendered = None
 
     @property
     def mobs(self) -> list[AbstractCharacter]:
-        mobs = list()
-        if not self._inv:
-            return mobs
-        for item in self._inv:
-            if isinstance(item, AbstractCharacter):
-                if item.is_alive:
-                    mobs.append(item)
-        return mobs
+        return [entry for _, entry in self._live if isinstance(entry, AbstractCharacter) and entry.is_alive]
 
     @property
     def inv(self) -> str:
-        result: str = ""
         if not self._inv:
             return ""
+        indexed: list[tuple[str, int, AbstractItem]] = self._index()
+        if self._rendered is not None:
+            return self._rendered
 
-        names: list[str] = list()
-        for item in self._inv:
-            names.append(item.name)
-        names.sort()
-
-        result = ""
-        for name in names:
-            if name:
-                result += "- " + name + "\n"
+        names: Iterable[str] = (name for name, _, _ in indexed)
+        if self._live:
+            names = heapq.merge(names, sorted(entry.name for _, entry in self._live))
+        result: str = "".join("- " + name + "\n" for name in names if name)
 
-        x = len(self._inv)
-        if x == 1:
+        if len(self._inv) == 1:
             result = "\n\n**Item**\n" + result
         else:
             result = "\n\n**Items**\n" + result
 
-        return result + "\n\n"
+        result += "\n\n"
+        if not self._live:
+            # live names change with the HP, only an inventory without them stays valid
+            self._rendered = result
+        return result
+
+
+def _live(item: AbstractItem | AbstractCharacter) -> bool:
+    return isinstance(item, AbstractCharacter) or getattr(item, "live_name", False)
 
 
 _turn: list[int] = [0]
@@ -262,7 +347,7 @@ def dice_roll2(die_roll: str) -> int:
     try:
         if "-" in die_roll:
             die_roll = die_roll[:die_roll.index("-")]
-        return int(dice.roll(die_roll))
+        return dice_expr.roll(die_roll)
     except RecursionError as e:
         return 1
 
@@ -271,7 +356,7 @@ def dice_roll2_max(die_roll: str) -> int:
     try:
         if "-" in die_roll:
             die_roll = die_roll[:die_roll.index("-")]
-        return int(dice.roll_max(die_roll.replace("x", "")))
+        return dice_expr.roll_max(die_roll)
     except RecursionError as e:
         return 1
 
@@ -280,7 +365,7 @@ def dice_roll2_min(die_roll: str) -> int:
     try:
         if "-" in die_roll:
             die_roll = die_roll[:die_roll.index("-")]
-        return int(dice.roll_min(die_roll.replace("x", "")))
+        return dice_expr.roll_min(die_roll)
     except RecursionError as e:
         return 1
 
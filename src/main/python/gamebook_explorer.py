@@ -0,0 +1,149 @@
+import collections
+import random
+import re
+import types
+from collections.abc import Callable
+from collections.abc import Generator
+
+import gamebook_cache
+import gamebook_core
+
+# compiled room, option, direction and goto functions are generators, they yield the next function to explore
+# and are sent back the node id it produced
+Exploration = Generator[Callable, str, str]
+
+_placeholder: re.Pattern = re.compile("\x00(\\d+)\x00")
+
+
+class FromSnapshot:
+    """
+    Marks a request made right after the state was restored from a snapshot.
+
+    Nothing but the snapshot and the global exploration state can influence such a request, so the explorer is
+    free to replay it from the exploration cache.
+    """
+    __slots__ = ("request",)
+
+    def __init__(self, request: Callable):
+        self.request = request
+
+
+class _WorkItem:
+    __slots__ = ("ref", "request", "snapshot", "random_state", "turns")
+
+    def __init__(self, ref: int, request: Callable, snapshot: any, random_state: tuple, turns: list[int]):
+        self.ref = ref
+        self.request = request
+        self.snapshot = snapshot
+        self.random_state = random_state
+        self.turns = turns
+
+
+class Explorer:
+    """
+    Explores a compiled gamebook from an explicit frontier instead of nested room function calls.
+
+    Depth is only limited by memory. With "dfs" ordering a requested function is explored as soon as it is
+    requested, which visits nodes in the same order as the old recursive descent. With "bfs" ordering the
+    request is queued together with a snapshot of the state, the random state and the turn stack, and the
+    requesting function continues with a placeholder node id that `resolve` replaces once everything has been
+    explored.
+
+    With a cache, requests marked with `FromSnapshot` are replayed from an earlier build where possible and
+    recorded otherwise. The cache is only used with "dfs" ordering, it relies on the nodes being explored in the
+    same order as the build that recorded them.
+    """
+
+    orders: tuple[str, ...] = ("dfs", "bfs")
+
+    def __init__(self, save_state: Callable[[], any], restore_state: Callable[[any], None], order: str = "dfs",
+                 cache: gamebook_cache.ExplorationCache | None = None):
+        if order not in Explorer.orders:
+            raise ValueError(f"Unknown exploration order {order}, expected one of {Explorer.orders}")
+        if cache is not None and order != "dfs":
+            raise ValueError(f"The exploration cache needs dfs ordering, not {order}")
+        self.save_state: Callable[[], any] = save_state
+        self.restore_state: Callable[[any], None] = restore_state
+        self.order: str = order
+        self.cache: gamebook_cache.ExplorationCache | None = cache
+        self._frontier: collections.deque[_WorkItem] = collections.deque()
+        self._resolved: list[str | None] = list()
+
+    def _defer(self, request: Callable) -> str:
+        ref: int = len(self._resolved)
+        self._resolved.append(None)
+        self._frontier.append(_WorkItem(ref, request, self.save_state(), random.getstate(),
+                                        list(gamebook_core._turn)))
+        return f"\x00{ref}\x00"
+
+    def _run(self, request: Callable) -> str:
+        started: any = request()
+        if not isinstance(started, types.GeneratorType):
+            return started
+        stack: list[Exploration] = [started]
+        value: str | None = None
+        error: BaseException | None = None
+        while stack:
+            try:
+                if error is not None:
+                    pending, error = error, None
+                    request = stack[-1].throw(pending)
+                else:
+                    request = stack[-1].send(value)
+            except StopIteration as stop:
+                if self.cache is not None:
+                    self.cache.finished(len(stack), stop.value)
+                stack.pop()
+                value = stop.value
+                continue
+            except BaseException as e:
+                if self.cache is not None:
+                    self.cache.failed(len(stack))
+                stack.pop()
+                if not stack:
+                    raise
+                error = e
+                continue
+
+            context: gamebook_cache.Context | None = None
+            if type(request) is FromSnapshot:
+                request = request.request
+                if self.cache is not None:
+                    context, value = self.cache.replay(request)
+                    if value is not None:
+                        continue
+            if self.order == "bfs":
+                value = self._defer(request)
+                continue
+            try:
+                started = request()
+            except BaseException as e:
+                error = e
+                continue
+            if isinstance(started, types.GeneratorType):
+                stack.append(started)
+                value = None
+                if context is not None:
+                    self.cache.begin(context, len(stack))
+            else:
+                value = started
+            if self.cache is not None:
+                self.cache.executed(request)
+        return value
+
+    def explore(self, entry: Callable) -> str:
+        """Explore everything reachable from the entry room, returns the entry node id."""
+        node_id: str = self._run(entry)
+        while self._frontier:
+            item: _WorkItem = self._frontier.popleft()
+            self.restore_state(item.snapshot)
+            random.setstate(item.random_state)
+            gamebook_core._turn[:] = item.turns
+            self._resolved[item.ref] = self._run(item.request)
+        return self.resolve(node_id)
+
+    def resolve(self, text: str) -> str:
+        """Replace the placeholder node ids handed out during "bfs" exploration."""
+        if not self._resolved or not text or "\x00" not in text:
+            return text
+        return _placeholder.sub(lambda match: self.resolve(self._resolved[int(match.group(1))]), text)
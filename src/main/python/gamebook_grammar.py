@@ -0,0 +1,94 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+import lark
+from lark import Lark
+
+_grammar_dir: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lark")
+_parsers: dict[tuple[str, str], Lark] = dict()
+_lock: threading.Lock = threading.Lock()
+_room_options: dict[str, any] = dict(parser="lalr", propagate_positions=True, start=["start", "rooms"])
+
+
+def _options_key(options: dict[str, any]) -> str:
+    return repr(sorted(options.items()))
+
+
+def _grammar_path(grammar: str) -> str:
+    return grammar if os.path.isabs(grammar) else os.path.join(_grammar_dir, grammar)
+
+
+def _key(grammar: str, options: str) -> str:
+    return hashlib.sha256(f"{lark.__version__}\n{options}\n{grammar}".encode("utf-8")).hexdigest()
+
+
+def _cache_path(path: str, grammar: str, options: str) -> str:
+    key: str = _key(grammar, options)
+    name: str = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.dirname(path), "__pycache__", f"{name}.{key[:32]}.lark")
+
+
+def _build(path: str, options: dict[str, any]) -> Lark:
+    with open(path) as r:
+        grammar: str = r.read()
+    if options.get("parser", "earley") != "lalr":
+        # lark only serializes LALR parsers, everything else is analysed again in every process
+        return Lark(grammar, **options)
+
+    cache: str = _cache_path(path, grammar, _options_key(options))
+    try:
+        with open(cache, "rb") as r:
+            return Lark.load(r)
+    except Exception:
+        # missing, stale or unreadable cache, build the parser again
+        pass
+    parser: Lark = Lark(grammar, **options)
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        handle, temp = tempfile.mkstemp(dir=os.path.dirname(cache), suffix=".tmp")
+        with os.fdopen(handle, "wb") as w:
+            parser.save(w)
+        os.replace(temp, cache)
+    except OSError:
+        pass
+    return parser
+
+
+def load(grammar: str = "gamebook.lark", **options: any) -> Lark:
+    """
+    Process-wide parser for a grammar in the lark directory.
+
+    Every combination of grammar and options is built once per process. LALR parsers are also saved to
+    `lark/__pycache__`, keyed by a hash of the grammar, the options and the lark version, so later processes
+    only load the tables instead of analysing the grammar again.
+    """
+    path: str = _grammar_path(grammar)
+    key: tuple[str, str] = (path, _options_key(options))
+    with _lock:
+        if key not in _parsers:
+            _parsers[key] = _build(path, options)
+        return _parsers[key]
+
+
+def key(grammar: str = "gamebook.lark", **options: any) -> str:
+    """Hash of a grammar, its options and the lark version, it changes whenever the parser `load` builds might."""
+    with open(_grammar_path(grammar)) as r:
+        return _key(r.read(), _options_key(options))
+
+
+def gamebook_parser() -> Lark:
+    """The parser `gamebook.py` and the compiler use for gamebook sources."""
+    # return load("gamebook.lark", parser="earley", lexer="dynamic_complete", ambiguity="resolve")
+    return load("gamebook.lark", parser="lalr", propagate_positions=True)
+
+
+def room_parser() -> Lark:
+    """The gamebook parser with `rooms` as a second start rule, for parsing a book one room block at a time."""
+    return load("gamebook.lark", **_room_options)
+
+
+def room_parser_key() -> str:
+    """The `key` of `room_parser`, for caches of the trees it produced."""
+    return key("gamebook.lark", **_room_options)
@@ -0,0 +1,41 @@
+import importlib.machinery
+import os
+import types
+
+
+def write_room_modules(directory: str, sources: dict[str, str]) -> int:
+    """
+    Write every room into a module of its own, returns how many modules changed.
+
+    Unchanged modules are not touched, their modification time stays the same and Python keeps using their
+    cached bytecode. Modules of rooms that no longer exist are removed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    changed: int = 0
+    for name, source in sources.items():
+        path: str = os.path.join(directory, name + ".py")
+        if os.path.exists(path):
+            with open(path) as r:
+                if r.read() == source:
+                    continue
+        with open(path, "w") as w:
+            w.write(source)
+        changed += 1
+    for file in os.listdir(directory):
+        name, extension = os.path.splitext(file)
+        if extension == ".py" and name not in sources:
+            os.remove(os.path.join(directory, file))
+    return changed
+
+
+def link_rooms(namespace: dict[str, any], directory: str, names: list[str]) -> None:
+    """
+    Run the room modules in the namespace of the compiled gamebook, in the order the rooms were compiled.
+
+    The code comes from the regular bytecode cache in `__pycache__`, a room is only compiled again when its
+    module has changed.
+    """
+    for name in names:
+        path: str = os.path.join(directory, name + ".py")
+        code: types.CodeType = importlib.machinery.SourceFileLoader(name, path).get_code(name)
+        exec(code, namespace)
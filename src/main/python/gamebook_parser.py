@@ -0,0 +1,97 @@
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+
+from lark import Lark
+from lark import Tree
+from lark.exceptions import LarkError
+
+import gamebook_grammar
+
+# a room header on a line of its own, see the `room` rule of gamebook.lark
+_room_header: re.Pattern = re.compile(r"^\[[^]\n]+\][ \t]*\r?$", re.MULTILINE)
+
+
+def room_blocks(source: str) -> list[str]:
+    """
+    Split gamebook source in front of every room header.
+
+    The first block holds the metadata and the first room. A header inside a string, comment or compound
+    statement also splits the source, the blocks around it then fail to parse on their own.
+    """
+    starts: list[int] = [match.start() for match in _room_header.finditer(source)]
+    if len(starts) < 2:
+        return [source]
+    bounds: list[int] = [0] + starts[1:] + [len(source)]
+    return [source[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+
+class IncrementalParser:
+    """
+    Parses gamebook source one room block at a time and keeps the parse tree of every block.
+
+    Blocks are keyed by a hash of their text, so after an edit only the changed rooms are parsed again. The
+    cached `rooms` children are joined into the same tree a full parse produces. Whenever a block does not
+    parse on its own the whole source is parsed in one go, which also reports errors with their real line
+    numbers. Token positions of cached blocks are relative to the start of their block.
+
+    The cache file is stored together with `grammar_key`, a cache written for another grammar or lark version
+    is thrown away as a whole. Callers passing their own parser pass the `gamebook_grammar.key` it was built with.
+    """
+
+    def __init__(self, cache_path: str | None = None, parser: Lark | None = None, grammar_key: str | None = None):
+        self.cache_path: str | None = cache_path
+        self.parser: Lark = parser if parser is not None else gamebook_grammar.room_parser()
+        if grammar_key is None:
+            grammar_key = gamebook_grammar.room_parser_key() if parser is None else ""
+        self.grammar_key: str = grammar_key
+        self.reparsed: int = 0
+        self.reused: int = 0
+        self._trees: dict[str, Tree] = dict()
+        self._used: set[str] = set()
+        if cache_path is not None and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "rb") as r:
+                    cached: any = pickle.load(r)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                cached = None
+            if grammar_key and type(cached) is tuple and len(cached) == 2 and cached[0] == grammar_key:
+                self._trees = cached[1]
+
+    def _block(self, text: str, start: str) -> Tree:
+        key: str = hashlib.sha256(f"{start}\n{text}".encode("utf-8")).hexdigest()
+        self._used.add(key)
+        if key in self._trees:
+            self.reused += 1
+            return self._trees[key]
+        self.reparsed += 1
+        tree: Tree = self.parser.parse(text, start=start)
+        self._trees[key] = tree
+        return tree
+
+    def parse(self, source: str) -> Tree:
+        blocks: list[str] = room_blocks(source)
+        self._used = set()
+        try:
+            head: Tree = self._block(blocks[0], "start")
+            rooms: list = list(head.children[-1].children)
+            for block in blocks[1:]:
+                rooms.extend(self._block(block, "rooms").children)
+            return Tree(head.data, head.children[:-1] + [Tree(head.children[-1].data, rooms)])
+        except LarkError:
+            self.reparsed += 1
+            self._used = set()
+            return self.parser.parse(source, start="start")
+
+    def save(self) -> None:
+        """Write the trees used by the last parse to the cache file, trees of edited away blocks are dropped."""
+        if self.cache_path is None:
+            return
+        trees: dict[str, Tree] = {key: tree for key, tree in self._trees.items() if key in self._used}
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        handle, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.cache_path)), suffix=".tmp")
+        with os.fdopen(handle, "wb") as w:
+            pickle.dump((self.grammar_key, trees), w, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, self.cache_path)
@@ -0,0 +1,190 @@
+import collections
+import hashlib
+import json
+import os
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+
+import mdformat
+
+
+def format_page(text: str, options: dict[str, any]) -> str:
+    return mdformat.text(text, options=options)
+
+
+def write_file(path: str, content: str, previous: str | None) -> tuple[str, bool]:
+    """
+    Write a file unless it still holds the content with the `previous` digest, returns the digest and whether
+    the file was written. The file is replaced atomically, readers never see a half written page.
+    """
+    digest: str = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    if digest == previous and os.path.exists(path):
+        return digest, False
+    temp: str = path + ".tmp"
+    with open(temp, "w") as w:
+        w.write(content)
+    os.replace(temp, path)
+    return digest, True
+
+
+def render_page(path: str, text: str, options: dict[str, any], previous: str | None) -> tuple[str, bool]:
+    """Format a page and write it, runs in the worker processes so only the raw text crosses over."""
+    return write_file(path, "\n" + format_page(text, options) + "\n", previous)
+
+
+class OutputWriter:
+    """
+    Keeps a manifest of the content digests of the files a build writes.
+
+    Files whose content did not change are left alone, their modification time tells later tools nothing
+    changed. When the build is done `close` removes the pages the build did not write again, both the ones
+    in the manifest and any other page in the directory, and saves the new manifest.
+    """
+
+    def __init__(self, directory: str, manifest: str = ".manifest.json"):
+        self.directory: str = directory
+        self.manifest: str = os.path.join(directory, manifest)
+        self.written: int = 0
+        self.unchanged: int = 0
+        self.removed: int = 0
+        self._previous: dict[str, str] = dict()
+        self._current: dict[str, str] = dict()
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.manifest) as r:
+                self._previous = json.load(r)
+        except (OSError, ValueError):
+            self._previous = dict()
+
+    def previous(self, path: str) -> str | None:
+        return self._previous.get(path)
+
+    def record(self, path: str, digest: str, written: bool) -> None:
+        """Account for a file written with `write_file`, e.g. in a worker process."""
+        self._current[path] = digest
+        if written:
+            self.written += 1
+        else:
+            self.unchanged += 1
+
+    def write(self, path: str, content: str) -> None:
+        self.record(path, *write_file(path, content, self.previous(path)))
+
+    def close(self) -> None:
+        stale: set[str] = set(self._previous)
+        stale.update(os.path.join(self.directory, file) for file in os.listdir(self.directory)
+                     if file.endswith(".md") or file.endswith(".tmp"))
+        for path in sorted(stale - set(self._current)):
+            if os.path.exists(path):
+                os.remove(path)
+                self.removed += 1
+        temp: str = self.manifest + ".tmp"
+        with open(temp, "w") as w:
+            json.dump(self._current, w, indent=1, sort_keys=True)
+        os.replace(temp, self.manifest)
+
+
+class PageRenderer:
+    """
+    Formats and writes the pages of a compiled gamebook while it is still being explored.
+
+    The program reports every page appended to another one with `appended` and every finished node with
+    `finished`. Appends are applied in the order they were reported, an append sees the target with its own
+    append only when the target's append was reported first, the same as joining the pages after exploration.
+    A page is handed to the worker processes as soon as its text is complete, they format it and write it
+    through the `OutputWriter`, at most `backlog` pages per worker are in flight. Only the text a later append
+    can still take is kept: the raw text of a page until it is joined and no append waits for it, the joined
+    text of appended pages. Pages finished as not `appendable` are dropped once they are written.
+    """
+
+    def __init__(self, writer: OutputWriter, options: dict[str, any], workers: int = 1, backlog: int = 8):
+        self.writer: OutputWriter = writer
+        self.options: dict[str, any] = options
+        self.rendered: int = 0
+        self._pool: ProcessPoolExecutor | None = ProcessPoolExecutor(workers) if workers > 1 else None
+        self._limit: int = max(1, workers) * backlog
+        self._pending: collections.deque[tuple[str, Future]] = collections.deque()
+        self._raw: dict[str, str] = dict()
+        self._joined: dict[str, str] = dict()
+        # page to (appended page, whether the appended page is taken with its own append)
+        self._appends: dict[str, tuple[str, bool]] = dict()
+        # pages waiting for the raw or the joined text of another page
+        self._waiting_raw: dict[str, list[str]] = dict()
+        self._waiting_joined: dict[str, list[str]] = dict()
+        # appends reported so far that take the raw text of a page and are not joined yet
+        self._raw_readers: collections.Counter[str] = collections.Counter()
+        # pages no other page is appended to
+        self._final: set[str] = set()
+
+    def appended(self, node_id: str, append_node: str) -> None:
+        if node_id not in self._appends:
+            joined: bool = append_node in self._appends
+            self._appends[node_id] = (append_node, joined)
+            if not joined:
+                self._raw_readers[append_node] += 1
+
+    def finished(self, node_id: str, text: str, appendable: bool = True) -> None:
+        self._raw[node_id] = text
+        if not appendable:
+            self._final.add(node_id)
+        self._join(node_id)
+        for node in self._waiting_raw.pop(node_id, ()):
+            self._join(node)
+
+    def _join(self, node_id: str) -> None:
+        if node_id not in self._appends:
+            self._render(node_id, self._raw[node_id])
+            self._release(node_id)
+            return
+        append_node, joined = self._appends[node_id]
+        texts: dict[str, str] = self._joined if joined else self._raw
+        if append_node not in texts:
+            waiting: dict[str, list[str]] = self._waiting_joined if joined else self._waiting_raw
+            waiting.setdefault(append_node, list()).append(node_id)
+            return
+        self._joined[node_id] = self._raw[node_id] + "\n\n" + texts[append_node]
+        self._render(node_id, self._joined[node_id])
+        for node in self._waiting_joined.pop(node_id, ()):
+            self._join(node)
+        self._release(node_id)
+        if not joined:
+            self._raw_readers[append_node] -= 1
+            self._release(append_node)
+
+    def _release(self, node_id: str) -> None:
+        # the appends of a page are reported before it is finished, any append reported later takes the joined
+        # text of an appended page, the raw text of other pages and nothing of a final page
+        if node_id in self._final:
+            self._final.discard(node_id)
+            self._raw.pop(node_id, None)
+            self._joined.pop(node_id, None)
+            self._appends.pop(node_id, None)
+        elif node_id in self._joined and not self._raw_readers[node_id]:
+            self._raw.pop(node_id, None)
+            self._raw_readers.pop(node_id, None)
+
+    def _render(self, node_id: str, text: str) -> None:
+        path: str = os.path.join(self.writer.directory, node_id + ".md")
+        self.rendered += 1
+        if self._pool is None:
+            self.writer.record(path, *render_page(path, text, self.options, self.writer.previous(path)))
+            return
+        self._pending.append((path, self._pool.submit(render_page, path, text, self.options,
+                                                       self.writer.previous(path))))
+        while len(self._pending) > self._limit:
+            self._collect()
+
+    def _collect(self) -> None:
+        path, future = self._pending.popleft()
+        self.writer.record(path, *future.result())
+
+    def close(self) -> None:
+        """Wait for the pages still in flight, errors of the workers are raised here."""
+        while self._pending:
+            self._collect()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._waiting_raw or self._waiting_joined:
+            missing: list[str] = sorted(set(self._waiting_raw) | set(self._waiting_joined))
+            raise KeyError(f"pages appended but never finished: {missing}")
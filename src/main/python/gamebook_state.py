@@ -0,0 +1,595 @@
+import copy
+import hashlib
+import operator
+import types
+from collections.abc import Callable
+from enum import Enum
+
+_atomic_types: tuple[type, ...] = (type(None), bool, int, float, complex, str, bytes)
+_atomic_type_set: frozenset[type] = frozenset(_atomic_types)
+_reference_types: tuple[type, ...] = (type, types.FunctionType, types.BuiltinFunctionType, types.ModuleType)
+_immutable_digest_limit: int = 4096
+# attribute writes to `Tracked` objects so far
+_changes: int = 0
+# the count of `_changes` at the last attribute write of each `Tracked` object, by id
+_written: dict[int, int] = dict()
+_written_limit: int = 1 << 17
+# bumped whenever `_written` is cleared, watches taken before can not tell which objects were written since
+_written_epoch: int = 0
+# slot names of every class `_slot_names` was asked about
+_class_slots: dict[type, list[str]] = dict()
+
+
+class Tracked:
+    """
+    Mixin for game objects that remember when an attribute was last written to them.
+
+    The fingerprint of a variable reaching nothing but tracked objects, containers and values with a
+    `__fingerprint__` is kept without hashing the variable again as long as none of its tracked objects was
+    written to and the containers and fingerprints still hold the same objects.
+    """
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: any) -> None:
+        global _changes
+        _changes += 1
+        _written[id(self)] = _changes
+        object.__setattr__(self, name, value)
+
+    def _copy(self, attribute: Callable[[any], any], memo: dict[int, any] | None = None) -> "Tracked":
+        # like the copy module without going through `__setattr__` for every attribute, nothing can watch a new copy
+        cls: type = type(self)
+        copied: Tracked = cls.__new__(cls)
+        if memo is not None:
+            memo[id(self)] = copied
+        if hasattr(self, "__dict__"):
+            copied.__dict__.update(attribute(self.__dict__))
+        for name in _slot_names(cls):
+            if hasattr(self, name):
+                object.__setattr__(copied, name, attribute(getattr(self, name)))
+        return copied
+
+    def __copy__(self) -> "Tracked":
+        return self._copy(lambda value: value)
+
+    def __deepcopy__(self, memo: dict[int, any]) -> "Tracked":
+        return self._copy(lambda value: copy.deepcopy(value, memo), memo)
+
+
+def mark() -> tuple[int, int]:
+    """The current point in the attribute writes to `Tracked` objects, for `written_since`."""
+    return _written_epoch, _changes
+
+
+def written_since(value: any, since: tuple[int, int]) -> bool:
+    """Whether an attribute of `value` may have been written after `since`, always true for untracked objects."""
+    if since[0] != _written_epoch or not isinstance(value, Tracked):
+        return True
+    return _written.get(id(value), 0) > since[1]
+
+
+def _dict_contents(value: dict) -> tuple:
+    return *dict.keys(value), *dict.values(value)
+
+
+def _fingerprint_contents(value: any) -> tuple:
+    return value.__fingerprint__(),
+
+
+def _copied_id(object_id: int, memo: dict[int, any]) -> int:
+    # objects the copy module shares instead of copying are not in the memo
+    copied: any = memo.get(object_id)
+    return object_id if copied is None else id(copied)
+
+
+class _Watch:
+    """
+    What the structure of a value depends on: the `Tracked` objects it reaches and the objects held by its
+    containers and fingerprints when it was taken. It is incomplete when the value reaches any other object.
+    """
+    __slots__ = ("changes", "epoch", "objects", "contents", "complete")
+
+    def __init__(self):
+        global _written_epoch
+        if len(_written) > _written_limit:
+            _written.clear()
+            _written_epoch += 1
+        self.changes: int = _changes
+        self.epoch: int = _written_epoch
+        self.objects: list[int] = list()
+        self.contents: list[tuple[Callable[[any], tuple], any, tuple]] = list()
+        self.complete: bool = True
+
+    def add(self, contents: Callable[[any], tuple], value: any, held: tuple | None = None) -> None:
+        # the held objects are kept alive, their ids can not be taken by new objects
+        self.contents.append((contents, value, contents(value) if held is None else held))
+
+    def unchanged(self) -> bool:
+        if self.changes != _changes:
+            if self.epoch != _written_epoch:
+                return False
+            changes: int = self.changes
+            if any(_written.get(object_id, 0) > changes for object_id in self.objects):
+                return False
+        for contents, value, held in self.contents:
+            current: tuple = contents(value)
+            if len(current) != len(held) or not all(map(operator.is_, current, held)):
+                return False
+        # nothing was written before this check, later ones only need to look at what was written after it
+        self.changes = _changes
+        return True
+
+    def copied(self, memo: dict[int, any]) -> "_Watch":
+        """The watch of a deep copy of the watched value made with `memo`, taken now."""
+        watch: _Watch = _Watch()
+        watch.objects = [_copied_id(object_id, memo) for object_id in self.objects]
+        for contents, value, _ in self.contents:
+            watch.add(contents, memo.get(id(value), value))
+        return watch
+
+
+def is_immutable(value: any) -> bool:
+    t = type(value)
+    if t in _atomic_types:
+        return True
+    if isinstance(value, _reference_types):
+        # encoded by reference, rebinding is the only change that matters
+        return True
+    if t is tuple or t is frozenset:
+        # flat ones like the numbers of a random state are checked without a call per item
+        if _atomic_type_set.issuperset(map(type, value)):
+            return True
+        for item in value:
+            if not is_immutable(item):
+                return False
+        return True
+    return False
+
+
+def _slot_names(cls: type) -> list[str]:
+    names: list[str] | None = _class_slots.get(cls)
+    if names is not None:
+        return names
+    names = _class_slots[cls] = list()
+    for klass in reversed(cls.__mro__):
+        slots = klass.__dict__.get("__slots__", ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            if name in ("__dict__", "__weakref__") or name in names:
+                continue
+            names.append(name)
+    return names
+
+
+def structure(value: any, memo: dict[int, int] | None = None, watch: _Watch | None = None) -> any:
+    """
+    Reduce a value to nested tuples of primitives.
+
+    Two values reduce to equal structures when jsonpickle would encode them the same way, so the structure
+    can be hashed instead of the much slower jsonpickle round trip. A `watch` collects what it depends on.
+    """
+    if memo is None:
+        memo = dict()
+    t = type(value)
+    if t in _atomic_types:
+        return value
+    if t is tuple:
+        return "py/tuple", tuple([structure(item, memo, watch) for item in value])
+    if t is frozenset:
+        return "py/set", tuple(sorted([repr(structure(item, memo, watch)) for item in value]))
+    if isinstance(value, Enum):
+        return "py/enum", t.__module__, t.__qualname__, value.name
+    if isinstance(value, _reference_types):
+        return "py/type", getattr(value, "__module__", None), getattr(value, "__qualname__", value.__name__)
+
+    # mutable values may be shared, only encode them the first time they are seen
+    if id(value) in memo:
+        return "py/id", memo[id(value)]
+    memo[id(value)] = len(memo)
+
+    if isinstance(value, set):
+        if watch is not None:
+            watch.add(tuple, value)
+        return "py/set", tuple(sorted([repr(structure(item, memo, watch)) for item in value]))
+    if isinstance(value, list):
+        if watch is not None:
+            watch.add(tuple, value)
+        return "py/list", tuple([structure(item, memo, watch) for item in value])
+    if isinstance(value, dict):
+        if watch is not None:
+            watch.add(_dict_contents, value)
+        return "py/dict", tuple([(structure(k, memo, watch), structure(v, memo, watch)) for k, v in value.items()])
+    if hasattr(value, "__fingerprint__"):
+        fingerprint: any = value.__fingerprint__()
+        if watch is not None:
+            watch.add(_fingerprint_contents, value, (fingerprint,))
+        return "py/fingerprint", t.__module__, t.__qualname__, structure(fingerprint, memo, watch)
+
+    if watch is not None:
+        if isinstance(value, Tracked):
+            watch.objects.append(id(value))
+        else:
+            watch.complete = False
+    fields: list[tuple[str, any]] = list()
+    for name in _slot_names(t):
+        if not hasattr(value, name):
+            continue
+        fields.append((name, structure(getattr(value, name), memo, watch)))
+    if hasattr(value, "__dict__"):
+        for name, attr in value.__dict__.items():
+            fields.append((name, structure(attr, memo, watch)))
+    return "py/object", t.__module__, t.__qualname__, tuple(fields)
+
+
+def _type_signature(value: any) -> any:
+    if type(value) is tuple or type(value) is frozenset:
+        signature: tuple[type, ...] = tuple(map(type, value))
+        if tuple in signature or frozenset in signature:
+            return tuple([_type_signature(item) for item in value])
+        return signature
+    return type(value)
+
+
+def digest(value: any, memo: dict[int, int] | None = None, watch: _Watch | None = None) -> int:
+    return int.from_bytes(hashlib.sha512(repr(structure(value, memo, watch)).encode("utf-8")).digest(), "big")
+
+
+class _Entry:
+    __slots__ = ("value", "immutable", "revision", "keyed", "digest", "ids", "watch")
+
+    def __init__(self, value: any, immutable: bool, revision: int | None, keyed: int, value_digest: int,
+                 ids: frozenset[int], watch: _Watch | None):
+        self.value = value
+        self.immutable = immutable
+        self.revision = revision
+        self.keyed = keyed
+        self.digest = value_digest
+        # ids of the mutable objects reachable from the value, used to find values sharing objects
+        self.ids = ids
+        self.watch = watch
+
+
+class StateFingerprint:
+    """
+    Incremental replacement for hashing a full jsonpickle dump of the gamebook state.
+
+    Every variable keeps its own hash. A variable is only hashed again when it has been rebound, when its
+    `fingerprint_revision` has changed since the last time it was hashed, or when it is a mutable value without
+    one and a `Tracked` object or a container it reaches may have changed. Copies restored from a snapshot start
+    out with the hash of the value they were copied from. The per variable hashes are XORed into a rolling digest
+    so only changed variables cost anything.
+    """
+
+    def __init__(self, ignore_keys: set[str] | None = None):
+        self.ignore_keys: set[str] = ignore_keys if ignore_keys is not None else set()
+        self._entries: dict[tuple[str, str], _Entry] = dict()
+        self._immutable_digests: dict[any, int] = dict()
+        self._rolling: int = 0
+        # fresh copies of values with a known digest by id, given to the next checksum
+        self._copies: dict[int, tuple[any, int, frozenset[int], _Watch]] = dict()
+
+    def copied(self, value: any, value_digest: int, ids: frozenset[int], watch: _Watch) -> None:
+        """Take the digest of a fresh copy from the value it was copied from, unless `watch` sees a change."""
+        self._copies[id(value)] = (value, value_digest, ids, watch)
+
+    def _immutable_digest(self, value: any) -> int:
+        # equal immutable values only share a hash when their element types also match, (1,) is not (True,)
+        lookup: tuple[any, any] = (value, _type_signature(value))
+        try:
+            cached: int | None = self._immutable_digests.get(lookup)
+        except TypeError:
+            return digest(value)
+        if cached is None:
+            cached = digest(value)
+            if len(self._immutable_digests) > _immutable_digest_limit:
+                self._immutable_digests.clear()
+            self._immutable_digests[lookup] = cached
+        return cached
+
+    def _update(self, scope: str, key: str, value: any) -> None:
+        entry: _Entry | None = self._entries.get((scope, key))
+        revision: int | None = getattr(value, "fingerprint_revision", None)
+        if entry is not None and entry.value is value:
+            if entry.immutable:
+                return
+            if revision is not None and entry.revision == revision:
+                return
+            if entry.watch is not None and entry.watch.unchanged():
+                return
+        ids: frozenset[int] = frozenset()
+        watch: _Watch | None = None
+        if type(value) is _Pending:
+            # nothing can change a restored value before it is read back out of the state
+            immutable: bool = True
+            value_digest: int = value.unit.digest
+        elif is_immutable(value):
+            immutable: bool = True
+            value_digest: int = self._immutable_digest(value)
+        else:
+            immutable: bool = False
+            copied: tuple[any, int, frozenset[int], _Watch] | None = self._copies.pop(id(value), None)
+            if copied is not None and copied[0] is value and copied[3].unchanged():
+                _, value_digest, ids, watch = copied
+            else:
+                memo: dict[int, int] = dict()
+                watch = _Watch()
+                value_digest: int = digest(value, memo, watch)
+                ids = frozenset(memo)
+                if not watch.complete:
+                    watch = None
+        self._store(entry, scope, key, value, immutable, value_digest, ids, watch)
+
+    def _store(self, entry: _Entry | None, scope: str, key: str, value: any, immutable: bool, value_digest: int,
+               ids: frozenset[int], watch: _Watch | None) -> None:
+        revision: int | None = getattr(value, "fingerprint_revision", None)
+        if entry is not None and entry.digest == value_digest:
+            keyed: int = entry.keyed
+        else:
+            keyed: int = int.from_bytes(hashlib.sha512(f"{scope}/{key}/{value_digest:x}".encode("utf-8")).digest(),
+                                        "big")
+        if entry is None:
+            self._entries[(scope, key)] = _Entry(value, immutable, revision, keyed, value_digest, ids, watch)
+            self._rolling ^= keyed
+            return
+        self._rolling ^= entry.keyed ^ keyed
+        entry.value = value
+        entry.immutable = immutable
+        entry.revision = revision
+        entry.keyed = keyed
+        entry.digest = value_digest
+        entry.ids = ids
+        entry.watch = watch
+
+    def _update_scope(self, scope: str, variables: dict[str, any], seen: set[tuple[str, str]],
+                      ignore_keys: set[str] | None = None) -> None:
+        for key, value in dict.items(variables):
+            if ignore_keys and key in ignore_keys:
+                continue
+            seen.add((scope, key))
+            self._update(scope, key, value)
+
+    def checksum(self, world: dict[str, any], rooms: dict[str, dict[str, any]]) -> str:
+        seen: set[tuple[str, str]] = set()
+        self._update_scope("world_vars", world, seen, self.ignore_keys)
+        for room_name, room_state in rooms.items():
+            self._update_scope(room_name, room_state, seen)
+        if len(seen) != len(self._entries):
+            for stale in [key for key in self._entries if key not in seen]:
+                self._rolling ^= self._entries.pop(stale).keyed
+        self._copies.clear()
+        return f"{self._rolling:0128x}"
+
+
+class _SnapshotGroup:
+    """Mutable values that were copied together, objects shared between them are shared between the copies."""
+    __slots__ = ("keys",)
+
+    def __init__(self, keys: frozenset[tuple[str, str]]):
+        self.keys = keys
+
+
+class _Unit:
+    """One saved variable. Immutable values are kept as is, mutable values as a private copy nobody mutates."""
+    __slots__ = ("value", "digest", "group", "ids", "watch")
+
+    def __init__(self, value: any, value_digest: int, group: _SnapshotGroup | None,
+                 ids: frozenset[int] = frozenset(), watch: _Watch | None = None):
+        self.value = value
+        self.digest = value_digest
+        self.group = group
+        # the reachable objects and the watch of the private copy, passed on to the copies restored from it
+        self.ids = ids
+        self.watch = watch
+
+
+class _PendingRestore:
+    """The restored values of one snapshot group, copied out of the snapshot the first time any of them is read."""
+    __slots__ = ("snapshots", "slots", "done")
+
+    def __init__(self, snapshots: "StateSnapshots"):
+        self.snapshots: StateSnapshots = snapshots
+        self.slots: list[tuple[str, dict, str, _Pending]] = list()
+        self.done: bool = False
+
+    def materialize(self) -> None:
+        if self.done:
+            return
+        self.done = True
+        memo: dict[int, any] = dict()
+        values: list[any] = copy.deepcopy([pending.unit.value for _, _, _, pending in self.slots], memo)
+        for (scope, container, key, pending), value in zip(self.slots, values):
+            # the variable may have been rebound or restored again in the meantime
+            if dict.get(container, key) is pending:
+                dict.__setitem__(container, key, value)
+                self.snapshots._copied(scope, key, value, pending.unit, memo)
+
+
+class _Pending:
+    __slots__ = ("unit", "restore")
+
+    def __init__(self, unit: _Unit, restore: _PendingRestore):
+        self.unit = unit
+        self.restore = restore
+
+
+class StateDict(dict):
+    """
+    dict used for the gamebook state.
+
+    Values put back by `StateSnapshots.restore` are only copied out of the snapshot when they are first read.
+    """
+
+    def __getitem__(self, key: any) -> any:
+        value = dict.__getitem__(self, key)
+        if type(value) is _Pending:
+            value.restore.materialize()
+            value = dict.__getitem__(self, key)
+        return value
+
+    def _materialize(self) -> None:
+        for value in dict.values(self):
+            if type(value) is _Pending:
+                value.restore.materialize()
+
+    def get(self, key: any, default: any = None) -> any:
+        if key in self:
+            return self[key]
+        return default
+
+    def items(self):
+        self._materialize()
+        return dict.items(self)
+
+    def values(self):
+        self._materialize()
+        return dict.values(self)
+
+    def pop(self, key: any, *default: any) -> any:
+        if key in self:
+            self[key]
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key: any, default: any = None) -> any:
+        if key in self:
+            return self[key]
+        return dict.setdefault(self, key, default)
+
+    def copy(self) -> dict:
+        self._materialize()
+        return dict.copy(self)
+
+
+class StateSnapshot:
+    __slots__ = ("world", "rooms")
+
+    def __init__(self):
+        self.world: dict[str, _Unit] = dict()
+        self.rooms: dict[str, dict[str, _Unit]] = dict()
+
+
+class StateSnapshots:
+    """
+    Snapshots of the gamebook state for backtracking, replacing jsonpickle round trips of the whole state.
+
+    Immutable values are shared between the live state and every snapshot. A mutable value is only copied when
+    its fingerprint changed since it was last saved, otherwise the previous copy is shared. Restoring puts
+    placeholders into the state which are copied out on first read, so a rollback only pays for the variables
+    that are used afterwards. Restored values are always fresh objects, just like a decoded jsonpickle dump, but
+    they keep the fingerprint and the saved copy of their snapshot until they are changed.
+    """
+
+    def __init__(self, fingerprint: StateFingerprint):
+        self.fingerprint: StateFingerprint = fingerprint
+        self._saved: dict[tuple[str, str], tuple[any, _Unit]] = dict()
+
+    def _unit(self, scope: str, key: str, value: any, mutable: dict[tuple[str, str], any]) -> _Unit | None:
+        if type(value) is _Pending:
+            return value.unit
+        entry: _Entry = self.fingerprint._entries[(scope, key)]
+        if entry.immutable:
+            saved: tuple[any, _Unit] | None = self._saved.get((scope, key))
+            if saved is not None and saved[0] is value:
+                return saved[1]
+            unit: _Unit = _Unit(value, entry.digest, None)
+            self._saved[(scope, key)] = (value, unit)
+            return unit
+        mutable[(scope, key)] = value
+        return None
+
+    def _groups(self, mutable: dict[tuple[str, str], any]) -> list[list[tuple[str, str]]]:
+        parent: dict[tuple[str, str], tuple[str, str]] = {key: key for key in mutable}
+
+        def find(key: tuple[str, str]) -> tuple[str, str]:
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        owners: dict[int, tuple[str, str]] = dict()
+        for key in mutable:
+            for object_id in self.fingerprint._entries[key].ids:
+                owner: tuple[str, str] = owners.setdefault(object_id, key)
+                if owner != key:
+                    parent[find(owner)] = find(key)
+        groups: dict[tuple[str, str], list[tuple[str, str]]] = dict()
+        for key in mutable:
+            groups.setdefault(find(key), list()).append(key)
+        return list(groups.values())
+
+    def _copied(self, scope: str, key: str, value: any, unit: _Unit, memo: dict[int, any]) -> None:
+        # a restored copy has the digest of its unit, neither the fingerprint nor the next snapshot look at it again
+        self._saved[(scope, key)] = (value, unit)
+        if unit.watch is not None:
+            ids: frozenset[int] = frozenset([_copied_id(object_id, memo) for object_id in unit.ids])
+            self.fingerprint.copied(value, unit.digest, ids, unit.watch.copied(memo))
+
+    def _save_group(self, members: list[tuple[str, str]], mutable: dict[tuple[str, str], any]) -> list[_Unit]:
+        keys: frozenset[tuple[str, str]] = frozenset(members)
+        units: list[_Unit] = list()
+        for key in members:
+            saved: tuple[any, _Unit] | None = self._saved.get(key)
+            if saved is None or saved[0] is not mutable[key] or saved[1].group is None:
+                break
+            if saved[1].group.keys != keys or saved[1].digest != self.fingerprint._entries[key].digest:
+                break
+            units.append(saved[1])
+        else:
+            return units
+
+        group: _SnapshotGroup = _SnapshotGroup(keys)
+        memo: dict[int, any] = dict()
+        values: list[any] = copy.deepcopy([mutable[key] for key in members], memo)
+        units = list()
+        for key, value in zip(members, values):
+            entry: _Entry = self.fingerprint._entries[key]
+            unit: _Unit = _Unit(value, entry.digest, group,
+                                frozenset([_copied_id(object_id, memo) for object_id in entry.ids]),
+                                None if entry.watch is None else entry.watch.copied(memo))
+            self._saved[key] = (mutable[key], unit)
+            units.append(unit)
+        return units
+
+    def snapshot(self, world: dict[str, any], rooms: dict[str, dict[str, any]]) -> StateSnapshot:
+        self.fingerprint.checksum(world, rooms)
+        snapshot: StateSnapshot = StateSnapshot()
+        mutable: dict[tuple[str, str], any] = dict()
+        for key, value in dict.items(world):
+            if key in self.fingerprint.ignore_keys:
+                continue
+            snapshot.world[key] = self._unit("world_vars", key, value, mutable)
+        for room_name, room_state in rooms.items():
+            units: dict[str, _Unit] = dict()
+            for key, value in dict.items(room_state):
+                units[key] = self._unit(room_name, key, value, mutable)
+            snapshot.rooms[room_name] = units
+        for members in self._groups(mutable):
+            for (scope, key), unit in zip(members, self._save_group(members, mutable)):
+                if scope == "world_vars":
+                    snapshot.world[key] = unit
+                else:
+                    snapshot.rooms[scope][key] = unit
+        return snapshot
+
+    def _restored(self, scope: str, container: dict, key: str, unit: _Unit,
+                  pending: dict[int, _PendingRestore]) -> any:
+        if unit.group is None:
+            return unit.value
+        restore: _PendingRestore | None = pending.get(id(unit.group))
+        if restore is None:
+            restore = _PendingRestore(self)
+            pending[id(unit.group)] = restore
+        placeholder: _Pending = _Pending(unit, restore)
+        restore.slots.append((scope, container, key, placeholder))
+        return placeholder
+
+    def restore(self, snapshot: StateSnapshot, world: dict[str, any], state: dict[str, any]) -> None:
+        """Put a snapshot back, every saved room gets a new dict, world variables are rebound in place."""
+        pending: dict[int, _PendingRestore] = dict()
+        for key, unit in snapshot.world.items():
+            dict.__setitem__(world, key, self._restored("world_vars", world, key, unit, pending))
+        for room_name, units in snapshot.rooms.items():
+            room_state: StateDict = StateDict()
+            for key, unit in units.items():
+                dict.__setitem__(room_state, key, self._restored(room_name, room_state, key, unit, pending))
+            dict.__setitem__(state, room_name, room_state)
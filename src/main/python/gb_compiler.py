@@ -1,12 +1,19 @@
+import dataclasses
 import re
 import string
 import textwrap
+from collections.abc import Iterator
+from contextlib import ExitStack, contextmanager
+from typing import TextIO
 
 import lark.visitors
 
+from lark import Lark
 from lark import Token
 from lark import Tree
 
+import gamebook_grammar
+
 
 def unescape(text: str) -> str:
     return text.encode('utf-8').decode('unicode-escape')
@@ -24,72 +31,157 @@ def basic_unescape(text: str) -> str:
     return text.replace("\\\"", "\"").replace("\\\\\"", "\\", )
 
 
-_indent: int = 0
-
-
-def indent_inc() -> int:
-    global _indent
-    _indent += 1
-    return _indent
-
-
-def indent_dec() -> int:
-    global _indent
-    _indent = max(_indent - 1, 0)
-    return _indent
-
+class CodeEmitter:
+    """
+    Collects the lines of a generated program.
+
+    Lines are written to `stream` as they are emitted when one is given, otherwise they are buffered until
+    `getvalue` joins them.
+    """
+
+    def __init__(self, stream: TextIO | None = None):
+        self.stream: TextIO | None = stream
+        self._lines: list[str] = list()
+        self._captures: list[list[str]] = list()
+        self._indent: int = 0
+
+    def indent_inc(self) -> int:
+        self._indent += 1
+        return self._indent
+
+    def indent_dec(self) -> int:
+        self._indent = max(self._indent - 1, 0)
+        return self._indent
+
+    @contextmanager
+    def indented(self) -> Iterator[None]:
+        """Indent everything emitted inside the with block one more level."""
+        self.indent_inc()
+        try:
+            yield
+        finally:
+            self.indent_dec()
+
+    @contextmanager
+    def dedented(self) -> Iterator[None]:
+        """Emit everything inside the with block one level less indented."""
+        indent: int = self._indent
+        self.indent_dec()
+        try:
+            yield
+        finally:
+            self._indent = indent
+
+    def out(self, text: str = "") -> None:
+        prefix: str = "    " * self._indent
+        lines: list[str] = text.splitlines(keepends=False) if "\n" in text else [text]
+        for line in lines:
+            line = prefix + line.rstrip() + "\n"
+            if self._captures:
+                self._captures[-1].append(line)
+            elif self.stream is not None:
+                self.stream.write(line)
+            else:
+                self._lines.append(line)
 
-def indent(text: str) -> str:
-    global _indent
-    _: str = ""
-    _ = "    " * _indent + text
-    return _
+    def capture(self) -> None:
+        """Divert the following lines into a separate buffer until `release` hands them back."""
+        self._captures.append(list())
 
+    def release(self) -> str:
+        return "".join(self._captures.pop())
 
-compiled_program: str = ""
+    def getvalue(self) -> str:
+        """The buffered program, empty when the lines went to a stream."""
+        return "".join(self._lines)
 
 
-def out(text: str = ""):
-    global compiled_program
-    global _indent
-    if "\n" in text:
-        for line in text.splitlines(keepends=False):
-            out(line)
-        return
-    text = text.rstrip()
-    compiled_program += ("    " * _indent) + text + "\n"
+@dataclasses.dataclass(frozen=True, slots=True)
+class CompiledBook:
+    """The result of a compilation, `program` is empty when it was written to a stream."""
+    tree: Tree
+    program: str
+    # room name to the name of its generated function
+    rooms: dict[str, str]
+    main_room: str | None
+    # room function name to the source of its module, empty when the rooms are part of the program
+    room_sources: dict[str, str]
 
 
 class GamebookCompiler(lark.visitors.Interpreter):
     q1 = "\""
     q3 = "\"\"\""
 
-    once_counter: int = 0
-    room_ctr: int = 0
-    room_pad_length: int = 1
-    state_track_set: set[str] = set()
-    _func_ctr: int = 0
-    _abort_ctr: int = 0
-
-    room_lookup: dict[str, str] = dict()
-    room_ctr_lookup: dict[str, int] = dict()
-    var_lookup: dict[str, str] = dict()
-
-    _next_random_seed: int = 0
-
-    main_room: str | None = None
-
-    import_block: list[str] = list()
-
-    scope_world: set[str] = set()
-    scope_room: set[str] = set()
-    scope_local: set[str] = set()
-    defined_macros: dict[str, Tree] = dict()
-
-    next_option_ctrs: dict[str, int] = dict()
-
-    macro_preexec: str = ""
-    macro_postexec: str = ""
+    def __init__(self, stream: TextIO | None = None, parser: Lark | None = None):
+        super().__init__()
+        self.parser: Lark | None = parser
+        self.reset(stream)
+
+    def reset(self, stream: TextIO | None = None, room_modules: str | None = None) -> None:
+        """Forget the previous compilation, every table the compiler fills is per instance and starts empty."""
+        # the generated program goes straight to `stream` when one is given
+        self.emitter: CodeEmitter = CodeEmitter(stream)
+        # directory next to the program the rooms are linked from, None keeps them in the program
+        self.room_modules: str | None = room_modules
+        self.room_sources: dict[str, str] = dict()
+        self._room_module: str | None = None
+        # open indentation of the room function and of its abortable body, closed again by `end_room`
+        self._room_body: ExitStack = ExitStack()
+        self._room_abort: ExitStack = ExitStack()
+
+        self.once_counter: int = 0
+        self.room_ctr: int = 0
+        self.room_pad_length: int = 1
+        self.state_track_set: set[str] = set()
+        self._func_ctr: int = 0
+        self._abort_ctr: int = 0
+
+        self.room_lookup: dict[str, str] = dict()
+        self.room_ctr_lookup: dict[str, int] = dict()
+        self.var_lookup: dict[str, str] = dict()
+
+        self._next_random_seed: int = 0
+
+        self.main_room: str | None = None
+
+        self.import_block: list[str] = list()
+
+        self.scope_world: set[str] = set()
+        self.scope_room: set[str] = set()
+        self.scope_local: set[str] = set()
+        self.defined_macros: dict[str, Tree] = dict()
+
+        self.next_option_ctrs: dict[str, int] = dict()
+
+        self.macro_preexec: str = ""
+        self.macro_postexec: str = ""
+
+    def parse(self, source: str) -> Tree:
+        if self.parser is None:
+            self.parser = gamebook_grammar.gamebook_parser()
+        return self.parser.parse(source)
+
+    def compile(self, source: str | Tree, stream: TextIO | None = None,
+                room_modules: str | None = None) -> "CompiledBook":
+        """
+        Compile gamebook source or an already parsed tree, the compiler can be reused for any number of books.
+
+        With `room_modules` every room goes into `room_sources` instead of the program, the program links them
+        from that directory at startup. See `gamebook_link`.
+        """
+        tree: Tree = source if isinstance(source, Tree) else self.parse(source)
+        self.reset(stream, room_modules)
+        program: str = self.visit(tree)
+        return CompiledBook(tree, program, dict(self.room_lookup), self.main_room, dict(self.room_sources))
+
+    def out(self, text: str = "") -> None:
+        self.emitter.out(text)
+
+    def indent_inc(self) -> int:
+        return self.emitter.indent_inc()
+
+    def indent_dec(self) -> int:
+        return self.emitter.indent_dec()
 
     @property
     def func_ctr(self) -> int:
@@ -128,23 +220,30 @@ class GamebookCompiler(lark.visitors.Interpreter):
     def start(self, tree: Tree) -> str:
         _ = ""
         # system required imports
-        out("from contextlib import contextmanager")
-        out("from datetime import datetime")
-        out("import re")
-        out("import shutil")
-        out("import os")
-        out("import html")
-        out("import dice")
-        out("import hashlib")
-        out("import random")
-        out("import jsonpickle")
-        out("from collections.abc import Callable")
-        out("import textwrap")
-        out()
+        self.out("from contextlib import contextmanager")
+        self.out("from datetime import datetime")
+        self.out("import re")
+        self.out("import shutil")
+        self.out("import os")
+        self.out("import html")
+        self.out("import dice_expr")
+        self.out("import hashlib")
+        self.out("import random")
+        self.out("import jsonpickle")
+        self.out("import gamebook_state")
+        self.out("import gamebook_explorer")
+        self.out("import gamebook_cache")
+        self.out("import gamebook_render")
+        if self.room_modules is not None:
+            self.out("import gamebook_link")
+        self.out("import argparse")
+        self.out("from collections.abc import Callable")
+        self.out("import textwrap")
+        self.out()
 
         for child in tree.children:
             if isinstance(child, Token):
-                out(child.value)
+                self.out(child.value)
                 continue
             if isinstance(child, Tree):
                 _c = self.visit(child)
@@ -152,9 +251,7 @@ class GamebookCompiler(lark.visitors.Interpreter):
                     for _d in _c:
                         _ += _d
                 continue
-        global compiled_program
-        _ = compiled_program
-        return _
+        return self.emitter.getvalue()
 
     def metadata(self, tree: Tree):
         self.visit_children(tree)
@@ -174,14 +271,14 @@ class GamebookCompiler(lark.visitors.Interpreter):
                 info_block.append((tag.strip(), value))
 
         if info_block:
-            out("gamebook_metadata: dict[str, str] = dict()")
+            self.out("gamebook_metadata: dict[str, str] = dict()")
         for tag, value in info_block:
-            out(f"gamebook_metadata[\"{tag}\"] = \"{value}\"")
+            self.out(f"gamebook_metadata[\"{tag}\"] = \"{value}\"")
             if tag == "preexec":
                 self.macro_preexec = value.strip()
             if tag == "postexec":
                 self.macro_postexec = value.strip()
-        out()
+        self.out()
 
     def metadata_entry(self, tree: Tree | Token) -> tuple[str, str]:
         tag: Token
@@ -196,11 +293,11 @@ class GamebookCompiler(lark.visitors.Interpreter):
         if self.import_block:
             self.import_block.sort()
         for import_lib in self.import_block:
-            out(f"import {import_lib}")
-        out()
+            self.out(f"import {import_lib}")
+        self.out()
         for import_lib in self.import_block:
-            out(f"from {import_lib} import *")
-        out()
+            self.out(f"from {import_lib} import *")
+        self.out()
 
         self.room_pad_length = len(str(len([s for s in tree.find_data("room")])))
 
@@ -214,89 +311,102 @@ class GamebookCompiler(lark.visitors.Interpreter):
 
         # enable proper use of "goto" to terminate all remaining code in a room
         # see: https://stackoverflow.com/a/3171971/12407701
-        out()
-        out("class NestedBreakException(Exception):")
-        indent_inc()
-        out("pass")
-        indent_dec()
-        out()
-        out()
-        out("@contextmanager")
-        out("def nested_break():")
-        indent_inc()
-        out('"""\nEnable proper use of "goto" to terminate all remaining code in a room.\nSee: '
-            'https://stackoverflow.com/a/3171971/12407701\n"""')
-        out()
-        out("try:")
-        indent_inc()
-        out("yield NestedBreakException()")
-        indent_dec()
-        out("except NestedBreakException as e:")
-        indent_inc()
-        out("pass")
-        indent_dec()
-        indent_dec()
-        out()
-        out()
+        self.out()
+        self.out("class NestedBreakException(Exception):")
+        with self.emitter.indented():
+            self.out("pass")
+        self.out()
+        self.out()
+        self.out("@contextmanager")
+        self.out("def nested_break():")
+        with self.emitter.indented():
+            self.out('"""\nEnable proper use of "goto" to terminate all remaining code in a room.\nSee: '
+                'https://stackoverflow.com/a/3171971/12407701\n"""')
+            self.out()
+            self.out("try:")
+            with self.emitter.indented():
+                self.out("yield NestedBreakException()")
+            self.out("except NestedBreakException as e:")
+            with self.emitter.indented():
+                self.out("pass")
+        self.out()
+        self.out()
 
         # add the predefined dict, world, pointing to package locals
-        out("state: dict[str, any] = dict()")
-        out("state['world'] = dict()")
-        out("recurse_depth: int = 0")
-        out("imports = dict()")
-        out()
+        self.out("state: dict[str, any] = gamebook_state.StateDict()")
+        self.out("state['world'] = gamebook_state.StateDict()")
+        self.out("imports = dict()")
+        self.out()
         for _ in self.import_block:
-            out(f"exec('from {_} import *', imports)")
-        out()
-        out(f"for attr in [*imports]:")
-        indent_inc()
-        out(f"state['world'][attr] = imports[attr]")
-        indent_dec()
-        out("ignore_pickle_keys: set[str] = set()")
-        out(f"for attr in [*imports]:")
-        indent_inc()
-        out(f"ignore_pickle_keys.add(attr)")
-        indent_dec()
-        out(f"ignore_pickle_keys.add('__builtins__')")
-        out()
+            self.out(f"exec('from {_} import *', imports)")
+        self.out()
+        self.out(f"for attr in [*imports]:")
+        with self.emitter.indented():
+            self.out(f"state['world'][attr] = imports[attr]")
+        self.out("ignore_pickle_keys: set[str] = set()")
+        self.out(f"for attr in [*imports]:")
+        with self.emitter.indented():
+            self.out(f"ignore_pickle_keys.add(attr)")
+        self.out(f"ignore_pickle_keys.add('__builtins__')")
+        self.out("_state_fingerprint = gamebook_state.StateFingerprint(ignore_pickle_keys)")
+        self.out("_state_snapshots = gamebook_state.StateSnapshots(_state_fingerprint)")
+        self.out()
         self.scope_world.add("facing")
-        out("state['world']['facing'] = state['world']['Facing']().with_facing('n')")
-        out()
-        out("_node_id: dict[str, int] = dict()")
-        out()
-        out()
-        out("def copy(o: any) -> any:")
-        indent_inc()
-        out("return jsonpickle.decode(jsonpickle.encode(any, keys=True), keys=True)")
-        indent_dec()
-        out()
-        out()
-        out("def face(facing: str):")
-        indent_inc()
-        out("global state")
-        out("state['world']['facing'].face(facing)")
-        indent_dec()
-        out()
-        out()
-        out("def new_label(room: str = 'no-room') -> str:")
-        indent_inc()
-        out("global _node_id")
-        out("if room not in _node_id:")
-        indent_inc()
-        out("_node_id[room]=0")
-        indent_dec()
-        out("_node_id[room] += 1")
-        out("cnt: int = _node_id[room]")
-        out('return f"{room}-{cnt:03x}"')
-        indent_dec()
-        out()
-        out()
-        out("_output: dict[str, str] = dict()")
-        out("_output_post_append: dict[str, str] = dict()")
-        out("node_id_by_hash: dict[str, str] = dict()")
-        out()
-        out(f"state['world']['__builtins__'] = globals()['__builtins__']")
-        out()
+        self.out("state['world']['facing'] = state['world']['Facing']().with_facing('n')")
+        self.out()
+        self.out("_node_id: dict[str, int] = dict()")
+        self.out()
+        self.out()
+        self.out("def copy(o: any) -> any:")
+        with self.emitter.indented():
+            self.out("return jsonpickle.decode(jsonpickle.encode(any, keys=True), keys=True)")
+        self.out()
+        self.out()
+        self.out("def face(facing: str):")
+        with self.emitter.indented():
+            self.out("global state")
+            self.out("state['world']['facing'].face(facing)")
+        self.out()
+        self.out()
+        self.out("def new_label(room: str = 'no-room') -> str:")
+        with self.emitter.indented():
+            self.out("global _node_id")
+            self.out("if room not in _node_id:")
+            with self.emitter.indented():
+                self.out("_node_id[room]=0")
+            self.out("_node_id[room] += 1")
+            self.out("cnt: int = _node_id[room]")
+            self.out('return f"{room}-{cnt:03x}"')
+        self.out()
+        self.out()
+        self.out("_output: dict[str, str] = dict()")
+        self.out("_output_post_append: dict[str, str] = dict()")
+        self.out("node_id_by_hash: dict[str, str] = dict()")
+        self.out()
+        self.out()
+        self.out("def page_appended(node_id: str, append_node: str) -> None:")
+        with self.emitter.indented():
+            self.out("if _live_pages:")
+            with self.emitter.indented():
+                self.out("_renderer.appended(node_id, append_node)")
+            self.out("else:")
+            with self.emitter.indented():
+                self.out("_output_post_append[node_id] = append_node")
+        self.out()
+        self.out()
+        self.out("def page_finished(node_id: str, out: str, appendable: bool = True) -> None:")
+        with self.emitter.indented():
+            self.out("# live pages go straight to the renderer, only bfs keeps them until the exploration is done")
+            self.out("if _live_pages:")
+            with self.emitter.indented():
+                self.out("_renderer.finished(node_id, out, appendable)")
+            self.out("else:")
+            with self.emitter.indented():
+                self.out("_output[node_id] = out")
+        self.out()
+        self.out()
+        self.out(f"state['world']['__builtins__'] = globals()['__builtins__']")
+        self.out()
 
         # scan ahead for room names to build room to function lookup table
 
@@ -321,99 +431,104 @@ class GamebookCompiler(lark.visitors.Interpreter):
         _ = ""
         for child in tree.children:
             if isinstance(child, Token):
-                out(child.value)
+                self.out(child.value)
             if isinstance(child, Tree):
                 _c = self.visit(child)
                 if _c:
                     for _d in _c:
                         _ += _d
         if _.strip():
-            out(_)
+            self.out(_)
 
         # make sure last room function has closing code
         self.end_room()
-        out("room_function_lookup: dict[str, Callable] = dict()")
+        if self.room_modules is not None:
+            self.out(f"gamebook_link.link_rooms(globals(), os.path.join(os.path.dirname(os.path.abspath(__file__)),")
+            self.out(f"                                                 {self.room_modules!r}),")
+            self.out(f"                         {list(self.room_sources)!r})")
+        self.out("room_function_lookup: dict[str, Callable] = dict()")
         for _key in self.room_lookup.keys():
             _function = self.room_lookup[_key]
-            out(f"room_function_lookup[\"{_key}\"] = {_function}")
-
-        out()
-        out()
-        out("def state_checksum() -> str:")
-        indent_inc()
-        out("pickled: str = save_state()")
-        out("node_hash: str = hashlib.sha512(pickled.encode('utf-8')).hexdigest()")
-        out("return node_hash")
-        indent_dec()
-        out()
-        out()
-        out("def save_state() -> str:")
-        indent_inc()
+            self.out(f"room_function_lookup[\"{_key}\"] = {_function}")
+
+        self.out()
+        self.out()
         sorted_track = sorted(self.state_track_set)
-        out("saved_states: dict[str, dict | str] = dict()")
-        out("saved_states['world_vars']: dict[str, any] = dict()")
-        out("for var in state['world'].keys():")
-        indent_inc()
-        out("if var in ignore_pickle_keys:")
-        indent_inc()
-        out("continue")
-        indent_dec()
-        out("saved_states['world_vars'][var] = state['world'][var]")
-        indent_dec()
-        for state in sorted_track:
-            out(f"saved_states['{state}'] = state['{state}']")
-        out("return jsonpickle.encode(saved_states, keys=True)")
-        indent_dec()
-        out()
-        out()
-        out("def restore_state(_saved_states: str) -> None:")
-        indent_inc()
-        out("saved_states = jsonpickle.decode(_saved_states, keys=True)")
-        out("for var in saved_states['world_vars'].keys():")
-        indent_inc()
-        out("state['world'][var] = saved_states['world_vars'][var]")
-        indent_dec()
-        for state in sorted_track:
-            out(f"state['{state}'] = saved_states['{state}']")
-        out("return")
-        indent_dec()
+        self.out("def tracked_states() -> dict[str, dict]:")
+        with self.emitter.indented():
+            self.out("_tracked_states: dict[str, dict] = dict()")
+            for state in sorted_track:
+                self.out(f"_tracked_states['{state}'] = state['{state}']")
+            self.out("return _tracked_states")
+        self.out()
+        self.out()
+        self.out("def state_checksum() -> str:")
+        with self.emitter.indented():
+            self.out("return _state_fingerprint.checksum(state['world'], tracked_states())")
+        self.out()
+        self.out()
+        self.out("def save_state() -> gamebook_state.StateSnapshot:")
+        with self.emitter.indented():
+            self.out("return _state_snapshots.snapshot(state['world'], tracked_states())")
+        self.out()
+        self.out()
+        self.out("def restore_state(saved_states: gamebook_state.StateSnapshot) -> None:")
+        with self.emitter.indented():
+            self.out("_state_snapshots.restore(saved_states, state['world'], state)")
 
         # the first room is 'main'
-        out()
-        out()
-        out(f"index_node: str = {self.room_lookup[self.main_room]}()")
-        out("""
-import mdformat
-md_options: dict[str, any] = dict()
-md_options["wrap"] = 80
-
-shutil.rmtree("md", ignore_errors=True)
-os.makedirs("md", exist_ok=True)
-
-for append_to in _output_post_append:
-    append_from: str = _output_post_append[append_to]
-    _output[append_to] += '\\n\\n' + _output[append_from]
-    
-for key in _output:
-    out = mdformat.text(_output[key], options=md_options)
-    with open("md/" + key + ".md", "w") as w:
-        w.write("\\n")
-        w.write(out)
-        w.write("\\n")
-        
-with open("md/index.md", "w") as w:
-    out = mdformat.text(_output[index_node], options=md_options)
-    w.write("\\n")
-    w.write(out)
-    w.write("\\n")
-    
-with open("index.md", "w") as w:
-    out = mdformat.text(_output[index_node], options=md_options)
-    out = re.sub("\((.*?md)\)", "(md/\\\\1)", out)
-    w.write("\\n")
-    w.write(out)
-    w.write("\\n")
-
+        self.out()
+        self.out()
+        self.out("_arguments = argparse.ArgumentParser()")
+        self.out("_arguments.add_argument('--order', choices=gamebook_explorer.Explorer.orders, default='dfs',")
+        self.out("                        help='exploration order of the story graph')")
+        self.out("_arguments.add_argument('--workers', type=int, default=1,")
+        self.out("                        help='number of processes formatting the pages')")
+        self.out("_arguments.add_argument('--cache', default=os.path.splitext(__file__)[0] + '.cache.sqlite',")
+        self.out("                        help='exploration cache shared between builds')")
+        self.out("_arguments.add_argument('--no-cache', action='store_true',")
+        self.out("                        help='explore everything without reading or writing the cache')")
+        self.out("_args = _arguments.parse_args()")
+        self.out()
+        self.out("md_options: dict[str, any] = dict()")
+        self.out("md_options['wrap'] = 80")
+        self.out("# only pages that changed since the last build are written, stale pages are removed at the end")
+        self.out("_writer = gamebook_render.OutputWriter('md')")
+        self.out("# pages are formatted and written while the exploration goes on")
+        self.out("_renderer = gamebook_render.PageRenderer(_writer, md_options, workers=_args.workers)")
+        self.out("# bfs hands out placeholder node ids, its pages are only complete after the exploration")
+        self.out("_live_pages: bool = _args.order == 'dfs'")
+        self.out()
+        self.out("_cache: gamebook_cache.ExplorationCache | None = None")
+        self.out("if not _args.no_cache and _args.order == 'dfs':")
+        with self.emitter.indented():
+            self.out("_cache = gamebook_cache.ExplorationCache(_args.cache, globals())")
+        self.out("_explorer = gamebook_explorer.Explorer(save_state, restore_state, order=_args.order, cache=_cache)")
+        self.out(f"index_node: str = _explorer.explore({self.room_lookup[self.main_room]})")
+        self.out("if _cache is not None:")
+        with self.emitter.indented():
+            self.out("_cache.close()")
+            self.out("print(f'Exploration cache: {_cache.hits:,} reused, {_cache.misses:,} explored')")
+        self.out("for _key in _output:")
+        with self.emitter.indented():
+            self.out("_output[_key] = _explorer.resolve(_output[_key])")
+        self.out("for _key in _output_post_append:")
+        with self.emitter.indented():
+            self.out("_output_post_append[_key] = _explorer.resolve(_output_post_append[_key])")
+        self.out("""
+if not _live_pages:
+    for _key in _output_post_append:
+        _renderer.appended(_key, _output_post_append[_key])
+    for _key in _output:
+        _renderer.finished(_key, _output[_key])
+_renderer.close()
+
+with open("md/" + index_node + ".md") as r:
+    out = r.read()
+_writer.write("md/index.md", out)
+_writer.write("index.md", re.sub("\\((.*?md)\\)", "(md/\\\\1)", out))
+_writer.close()
+print(f"Pages: {_writer.written:,} written, {_writer.unchanged:,} unchanged, {_writer.removed:,} removed")
 """)
 
     def room(self, tree: Tree):
@@ -440,63 +555,58 @@ with open("index.md", "w") as w:
                     self.scope_room.add("items")
                     self.room_lookup[name] = room_name
                     self.state_track_set.add(room_name)
-                    out(f"state['{room_name}'] = dict()")
-                    out(f"state['{room_name}']['once'] = set()")
-                    out(f"state['{room_name}']['vars'] = dict()")
-                    out(f"state['{room_name}']['vars']['items'] = gamebook_core.Items()")
-                    out(f"state['{room_name}']['random_state'] = random.Random({self.next_random_seed}).getstate()")
-                    out()
-                    out()
-
-                    out(f"def {room_name}() -> str:")
-                    indent_inc()
+                    if self.room_modules is not None:
+                        self.emitter.capture()
+                        self._room_module = room_name
+                    self.out(f"state['{room_name}'] = gamebook_state.StateDict()")
+                    self.out(f"state['{room_name}']['once'] = set()")
+                    self.out(f"state['{room_name}']['vars'] = dict()")
+                    self.out(f"state['{room_name}']['vars']['items'] = gamebook_core.Items()")
+                    random_seed: int = self.next_random_seed
+                    self.out(f"state['{room_name}']['random_state'] = random.Random({random_seed}).getstate()")
+                    self.out()
+                    self.out()
+
+                    self.out(f"def {room_name}() -> gamebook_explorer.Exploration:")
+                    self._room_body.enter_context(self.emitter.indented())
                     value: str = basic_escape(f"{name}")
-                    out(f"{self.q3}{value}{self.q3}")
-                    out("global _output")
-                    out("global state")
-                    out("global recurse_depth")
-                    out()
-                    out(f"_sub_func_counter: int = 0")
-                    out(f"_state: dict[str, any] = state['{room_name}']")
-                    out(f"_once: set[int] = _state['once']")
-                    out(f"room: str = {self.q1}{value}{self.q1}")
-                    out(f"room_name: str = {self.q1}{room_name}{self.q1}")
-                    out("global node_id_by_hash")
-                    out("node_hash: str = room_name + state_checksum()")
-                    out("if node_hash in node_id_by_hash:")
-                    indent_inc()
-                    out("return node_id_by_hash[node_hash]")
-                    indent_dec()
-                    out(f"node_id: str = new_label(room_name)")
-                    out("node_id_by_hash[node_hash] = node_id")
-                    out()
-                    out("next_turn()")
-                    out()
-                    out("if turn() % 10 == 0 or True:")
-                    indent_inc()
-                    out("_ = str(datetime.now().time())[:8]")
-                    out("")
-                    out("print(f'Turn: {turn()} [{_}] {room}')")
-                    indent_dec()
-                    out()
-                    out("out = ''")
-                    out(f"room_func: Callable = {room_name}")
-                    out("recurse_depth += 1")
-                    out("if recurse_depth > 1000:")
-                    indent_inc()
-                    out("raise RecursionError()")
-                    indent_dec()
-                    out(f"random.setstate(_state['random_state'])")
-                    out("option_list: list[tuple[str, Callable]] = list()")
-                    out("with nested_break() as abort_processing:")
-                    indent_inc()
+                    self.out(f"{self.q3}{value}{self.q3}")
+                    self.out("global state")
+                    self.out()
+                    self.out(f"_sub_func_counter: int = 0")
+                    self.out(f"_state: dict[str, any] = state['{room_name}']")
+                    self.out(f"_once: set[int] = _state['once']")
+                    self.out(f"room: str = {self.q1}{value}{self.q1}")
+                    self.out(f"room_name: str = {self.q1}{room_name}{self.q1}")
+                    self.out("global node_id_by_hash")
+                    self.out("node_hash: str = room_name + state_checksum()")
+                    self.out("if node_hash in node_id_by_hash:")
+                    with self.emitter.indented():
+                        self.out("return node_id_by_hash[node_hash]")
+                    self.out(f"node_id: str = new_label(room_name)")
+                    self.out("node_id_by_hash[node_hash] = node_id")
+                    self.out()
+                    self.out("next_turn()")
+                    self.out()
+                    self.out("if turn() % 10 == 0 or True:")
+                    with self.emitter.indented():
+                        self.out("_ = str(datetime.now().time())[:8]")
+                        self.out("")
+                        self.out("print(f'Turn: {turn()} [{_}] {room}')")
+                    self.out()
+                    self.out("out = ''")
+                    self.out(f"room_func: Callable = {room_name}")
+                    self.out(f"random.setstate(_state['random_state'])")
+                    self.out("option_list: list[tuple[str, Callable]] = list()")
+                    self.out("with nested_break() as abort_processing:")
+                    self._room_abort.enter_context(self.emitter.indented())
                     if self.macro_preexec:
                         if self.macro_preexec in self.defined_macros:
                             self.visit(self.defined_macros[self.macro_preexec])
                     continue
                 if child.type == "NEWLINE":
                     continue
-                out(f"Unknown token: {child.type} = {child.value}")
+                self.out(f"Unknown token: {child.type} = {child.value}")
                 continue
 
             return _
@@ -507,7 +617,7 @@ with open("index.md", "w") as w:
             if visit:
                 _ += visit
         if _.strip():
-            out(_)
+            self.out(_)
 
     def labeled_statement(self, tree: Tree):
         _ = ""
@@ -515,7 +625,7 @@ with open("index.md", "w") as w:
             if visit:
                 _ += visit
         if _.strip():
-            out(_)
+            self.out(_)
 
     def compound_statement(self, tree: Tree):
         label: str = self.next_abort
@@ -524,7 +634,7 @@ with open("index.md", "w") as w:
             if visit:
                 _ += visit
         if _.strip():
-            out(_)
+            self.out(_)
 
     def block_item_list(self, tree: Tree):
         _ = ""
@@ -532,7 +642,7 @@ with open("index.md", "w") as w:
             if visit:
                 _ += visit
         if _.strip():
-            out(_)
+            self.out(_)
 
     def block_item(self, tree: Tree):
         _ = ""
@@ -540,7 +650,7 @@ with open("index.md", "w") as w:
             if visit:
                 _ += visit
         if _.strip():
-            out(_)
+            self.out(_)
 
     def expression_statement(self, tree: Tree):
         _ = ""
@@ -548,32 +658,26 @@ with open("index.md", "w") as w:
             if visit:
                 _ += visit
         if _.strip():
-            out(f"rvalues: any = {_.rstrip()}")
-            out("if rvalues is not None:")
-            indent_inc()  # 1
-            out(f"if not isinstance(rvalues, list):")
-            indent_inc()  # 2
-            out("rvalues = [rvalues]")
-            indent_dec()  # 2
-            out()
-            out("for rvalue in rvalues:")
-            indent_inc()  # 2
-            out("if isinstance(rvalue, gamebook_core.AbstractItem):")
-            indent_inc()  # 3
-            out("state[room_name]['vars']['items'].add(rvalue)")
-            indent_dec()  # 2
-            out("elif isinstance(rvalue, gamebook_core.AbstractCharacter):")
-            indent_inc()  # 3
-            out("state[room_name]['vars']['items'].add(rvalue)")
-            indent_dec()  # 2
-            out("elif rvalue is not None:")
-            indent_inc()  # 3
-            out(f"out += \"\\n\\n\"")
-            # out(f"_ = html.escape(str(segment))")
-            out(f"out += textwrap.dedent(str(rvalue))")
-            indent_dec()  # 2
-            indent_dec()  # 1
-            indent_dec()  # 0
+            self.out(f"rvalues: any = {_.rstrip()}")
+            self.out("if rvalues is not None:")
+            with self.emitter.indented():
+                self.out(f"if not isinstance(rvalues, list):")
+                with self.emitter.indented():
+                    self.out("rvalues = [rvalues]")
+                self.out()
+                self.out("for rvalue in rvalues:")
+                with self.emitter.indented():
+                    self.out("if isinstance(rvalue, gamebook_core.AbstractItem):")
+                    with self.emitter.indented():
+                        self.out("state[room_name]['vars']['items'].add(rvalue)")
+                    self.out("elif isinstance(rvalue, gamebook_core.AbstractCharacter):")
+                    with self.emitter.indented():
+                        self.out("state[room_name]['vars']['items'].add(rvalue)")
+                    self.out("elif rvalue is not None:")
+                    with self.emitter.indented():
+                        self.out(f"out += \"\\n\\n\"")
+                        # out(f"_ = html.escape(str(segment))")
+                        self.out(f"out += textwrap.dedent(str(rvalue))")
 
     def selection_statement(self, tree: Tree):
         _ = ""
@@ -581,7 +685,7 @@ with open("index.md", "w") as w:
             if visit:
                 _ += visit
         if _.strip():
-            out(_)
+            self.out(_)
 
     def __top_level_children(self, children: list[Tree, Token] | Tree) -> str:
         _ = ""
@@ -607,14 +711,12 @@ with open("index.md", "w") as w:
         for part in self.visit(expression):
             _ += part
         _ += ':'
-        out(_)
-        indent_inc()
-        self.visit(true_block)
-        indent_dec()
-        out("else:")
-        indent_inc()
-        self.visit(false_block)
-        indent_dec()
+        self.out(_)
+        with self.emitter.indented():
+            self.visit(true_block)
+        self.out("else:")
+        with self.emitter.indented():
+            self.visit(false_block)
 
     def if_statement(self, tree: Tree):
         _, expression, true_block = tree.children
@@ -623,10 +725,9 @@ with open("index.md", "w") as w:
         for part in self.visit(expression):
             _ += part
         _ += ':'
-        out(_)
-        indent_inc()
-        self.visit(true_block)
-        indent_dec()
+        self.out(_)
+        with self.emitter.indented():
+            self.visit(true_block)
 
     def iteration_statement(self, tree: Tree):
         _ = ""
@@ -634,50 +735,45 @@ with open("index.md", "w") as w:
             if visit:
                 _ += visit
         if _.strip():
-            out(_)
+            self.out(_)
 
     # while_statement:  WHILE "(" expression ")" statement
     def while_statement(self, tree: Tree):
         _, expression, statement = tree.children
         e = self.visit(expression)
-        out(f"while {e}:")
-        indent_inc()
-        self.visit(statement)
-        indent_dec()
+        self.out(f"while {e}:")
+        with self.emitter.indented():
+            self.visit(statement)
 
     # do_while_statement: DO statement WHILE "(" expression ")" _eos
     def do_while_statement(self, tree: Tree):
         _, compound_statement, _, assignment_express, _ = tree.children
-        out("while True:")
-        indent_inc()
-        self.visit(compound_statement)
-        e = self.visit(assignment_express)
-        out(f"if {e}:")
-        indent_inc()
-        out("continue # continue do while loop")
-        indent_dec()
-        out("break  # exit do while loop")
-        indent_dec()
+        self.out("while True:")
+        with self.emitter.indented():
+            self.visit(compound_statement)
+            e = self.visit(assignment_express)
+            self.out(f"if {e}:")
+            with self.emitter.indented():
+                self.out("continue # continue do while loop")
+            self.out("break  # exit do while loop")
 
     # for_statement: FOR "(" assignment_statement expression_statement expression ")" statement
     def for_statement(self, tree: Tree):
         _, assignment_expression, expression_statement, assignment_express, compound_statement = tree.children
-        out(self.visit(assignment_expression))
+        self.out(self.visit(assignment_expression))
         es = self.visit(expression_statement)
         ae = self.visit(assignment_express)
 
-        out(f"while True:")
-        indent_inc()
-        out(f"_ = {es}")
-        out(f"if not _:")
-        indent_inc()
-        out("break  # exit for loop")
-        indent_dec()
+        self.out(f"while True:")
+        with self.emitter.indented():
+            self.out(f"_ = {es}")
+            self.out(f"if not _:")
+            with self.emitter.indented():
+                self.out("break  # exit for loop")
 
-        self.visit(compound_statement)
+            self.visit(compound_statement)
 
-        out(f"{ae}")
-        indent_dec()
+            self.out(f"{ae}")
 
     # for_each_statement: FOR "(" IDENTIFIER ":" expression")" statement
     def for_each_statement(self, tree: Tree):
@@ -696,20 +792,18 @@ with open("index.md", "w") as w:
             if var not in self.scope_world and var not in self.scope_room:
                 self.scope_local.add(var)
 
-        out(f"for {self.visit(postfix)} in {self.visit(expression)}:")
-        indent_inc()
-        self.visit(compound_statement)
-        indent_dec()
+        self.out(f"for {self.visit(postfix)} in {self.visit(expression)}:")
+        with self.emitter.indented():
+            self.visit(compound_statement)
         self.scope_local.intersection_update(saved_locals)
 
     def repeat_statement(self, tree: Tree):
         _, expression, statement = tree.children
 
         e = self.visit(expression)
-        out(f"for _ in range({e}):")
-        indent_inc()
-        self.visit(statement)
-        indent_dec()
+        self.out(f"for _ in range({e}):")
+        with self.emitter.indented():
+            self.visit(statement)
 
     def jump_statement(self, tree: Tree):
         _ = ""
@@ -717,55 +811,52 @@ with open("index.md", "w") as w:
             if visit:
                 _ += visit
         if _.strip():
-            out(_)
+            self.out(_)
 
     def clear_options(self, tree: Tree):
         self.visit_children(tree)
-        out("option_list.clear()")
+        self.out("option_list.clear()")
 
     def goto_statement(self, tree: Tree):
         _, new_room, direction_facing, *_ = tree.children
         func = self.next_goto
-        out()
-        out(f"def {func}():")
-        indent_inc()
-        out("global room_function_lookup")
-        out("global node_id_by_hash")
-        out("nonlocal _state")
-        out("nonlocal node_id")
-        out("nonlocal _sub_func_counter")
-        out()
-        out("_sub_func_counter += 1")
-        out(f"node_hash: str = '{func}' + str(_sub_func_counter) + state_checksum()")
-        out("if node_hash in node_id_by_hash:")
-        indent_inc()
-        out("return node_id_by_hash[node_hash]")
-        indent_dec()
-        out()
-        out(f"goto_saved_state = save_state()")
-
-        room: str = ""
-        for _ in self.visit(new_room):
-            room += _
-        out(f"lookup: str = str({room})")
-        out(f"if lookup not in room_function_lookup:")
-        indent_inc()
-        out(f"raise KeyError(f\"room {{lookup}} not found.\")")
-        indent_dec()
-        facing = ""
-        for _ in self.visit_children(direction_facing):
-            facing += _
-        out(f"state['world']['facing'].face({facing})")
-
-        out(f"append_node: str = room_function_lookup[lookup]()")
-        out(f"node_id_by_hash[node_hash] = append_node")
-        out(f"restore_state(goto_saved_state)")
-        out(f"random.setstate(_state['random_state'])")
-        out(f"return append_node")
-        indent_dec()
-        out(f"append_node: str = {func}()")
-        out("_output_post_append[node_id] = append_node")
-        out("raise abort_processing # end processing after goto")
+        self.out()
+        self.out(f"def {func}() -> gamebook_explorer.Exploration:")
+        with self.emitter.indented():
+            self.out("global room_function_lookup")
+            self.out("global node_id_by_hash")
+            self.out("nonlocal _state")
+            self.out("nonlocal node_id")
+            self.out("nonlocal _sub_func_counter")
+            self.out()
+            self.out("_sub_func_counter += 1")
+            self.out(f"node_hash: str = '{func}' + str(_sub_func_counter) + state_checksum()")
+            self.out("if node_hash in node_id_by_hash:")
+            with self.emitter.indented():
+                self.out("return node_id_by_hash[node_hash]")
+            self.out()
+            self.out(f"goto_saved_state = save_state()")
+
+            room: str = ""
+            for _ in self.visit(new_room):
+                room += _
+            self.out(f"lookup: str = str({room})")
+            self.out(f"if lookup not in room_function_lookup:")
+            with self.emitter.indented():
+                self.out(f"raise KeyError(f\"room {{lookup}} not found.\")")
+            facing = ""
+            for _ in self.visit_children(direction_facing):
+                facing += _
+            self.out(f"state['world']['facing'].face({facing})")
+
+            self.out(f"append_node: str = yield room_function_lookup[lookup]")
+            self.out(f"node_id_by_hash[node_hash] = append_node")
+            self.out(f"restore_state(goto_saved_state)")
+            self.out(f"random.setstate(_state['random_state'])")
+            self.out(f"return append_node")
+        self.out(f"append_node: str = yield {func}")
+        self.out("page_appended(node_id, append_node)")
+        self.out("raise abort_processing # end processing after goto")
         return None
 
     def comment(self, tree: Tree):
@@ -774,7 +865,7 @@ with open("index.md", "w") as w:
             if visit:
                 _ += visit
         if _.strip():
-            out(_)
+            self.out(_)
 
     def direction_statement(self, tree: Tree):
         short_format_string, direction_room, direction_facing, _ = tree.children
@@ -808,32 +899,30 @@ with open("index.md", "w") as w:
         room_func: str = self.room_lookup[room_name]
 
         func: str = self.next_direction
-        out()
-        out(f"def {func}() -> str:")
-        indent_inc()
-        out(f"\"\"\"{basic_escape(option_bin_description)}\"\"\"")
-        out()
-        out("global node_id_by_hash")
-        out("nonlocal out")
-        out("nonlocal room")
-        out("nonlocal _sub_func_counter")
-        out()
-        out("_sub_func_counter += 1")
-        out(f"direction_node_hash: str = '{func}' + str(_sub_func_counter) + state_checksum()")
-        out("if direction_node_hash in node_id_by_hash:")
-        indent_inc()
-        out("return node_id_by_hash[direction_node_hash]")
-        indent_dec()
-        out()
-        out(f"state['world']['facing'].face({facing})")
-        out()
-        out(f"direction_node_id: str = {room_func}()")
-
-        out("node_id_by_hash[direction_node_hash] = direction_node_id")
-        out()
-        out(f"return direction_node_id")
-        indent_dec()
-        out(f"option_list.append(({option_description}, {func}))")
+        self.out()
+        self.out(f"def {func}() -> gamebook_explorer.Exploration:")
+        with self.emitter.indented():
+            self.out(f"\"\"\"{basic_escape(option_bin_description)}\"\"\"")
+            self.out()
+            self.out("global node_id_by_hash")
+            self.out("nonlocal out")
+            self.out("nonlocal room")
+            self.out("nonlocal _sub_func_counter")
+            self.out()
+            self.out("_sub_func_counter += 1")
+            self.out(f"direction_node_hash: str = '{func}' + str(_sub_func_counter) + state_checksum()")
+            self.out("if direction_node_hash in node_id_by_hash:")
+            with self.emitter.indented():
+                self.out("return node_id_by_hash[direction_node_hash]")
+            self.out()
+            self.out(f"state['world']['facing'].face({facing})")
+            self.out()
+            self.out(f"direction_node_id: str = yield {room_func}")
+
+            self.out("node_id_by_hash[direction_node_hash] = direction_node_id")
+            self.out()
+            self.out(f"return direction_node_id")
+        self.out(f"option_list.append(({option_description}, {func}))")
 
     def option_statement(self, tree: Tree):
         next_option_ctrs = self.next_option_ctrs
@@ -844,67 +933,64 @@ with open("index.md", "w") as w:
         saved_locals = self.scope_local.copy()
         closures: str = ""
         if self.scope_local:
-            out()
-            out(f"# Closure vars: {self.scope_local}")
-            for var in self.scope_local:
-                out(f"_local_{var} = _local_{var} if '_local_{var}' in locals() else False")
+            self.out()
+            # sorted so an unchanged room compiles to the same code every time, see gamebook_cache
+            closure_vars: list[str] = sorted(self.scope_local)
+            self.out(f"# Closure vars: {closure_vars}")
+            for var in closure_vars:
+                self.out(f"_local_{var} = _local_{var} if '_local_{var}' in locals() else False")
 
             # out()
-            for var in self.scope_local:
-                out(f"_o_{var} = _local_{var}")
-            out()
-            for var in self.scope_local:
+            for var in closure_vars:
+                self.out(f"_o_{var} = _local_{var}")
+            self.out()
+            for var in closure_vars:
                 if closures:
                     closures += ", "
                 closures += f"_local_{var}=_o_{var}"
-        out(f"def {func}({closures}) -> str:")
-        indent_inc()
-        out(f"\"\"\"{basic_escape(option_description)}\"\"\"")
-        # out()
-        out("global node_id_by_hash")
-        out("global _output")
-        out("nonlocal _state")
-        out("nonlocal room_func")
-        out("nonlocal _sub_func_counter")
-        out()
-        out("_sub_func_counter += 1")
-        out(f"node_hash: str = '{func}' + str(_sub_func_counter) + state_checksum()")
-        out("if node_hash in node_id_by_hash:")
-        indent_inc()
-        out("return node_id_by_hash[node_hash]")
-        indent_dec()
-        out(f"option_saved_state = save_state()")
-        out()
-        out(f"node_id: str = new_label('{func}')")
-        out("node_id_by_hash[node_hash] = node_id")
-        out()
-        out("with nested_break() as abort_processing:")
-        indent_inc()
-        out("out = ''")
-        self.visit(block)
-        out(f"append_node: str = room_func()")
-        out("_output_post_append[node_id] = append_node")
-        indent_dec()
-        out(f"restore_state(option_saved_state)")
-        out(f"random.setstate(_state['random_state'])")
-        out("_output[node_id] = out")
-        out("return node_id")
-        indent_dec()
-        out(f"option_list.append(({option_description}, {func}))")
+        self.out(f"def {func}({closures}) -> gamebook_explorer.Exploration:")
+        with self.emitter.indented():
+            self.out(f"\"\"\"{basic_escape(option_description)}\"\"\"")
+            # out()
+            self.out("global node_id_by_hash")
+            self.out("nonlocal _state")
+            self.out("nonlocal room_func")
+            self.out("nonlocal _sub_func_counter")
+            self.out()
+            self.out("_sub_func_counter += 1")
+            self.out(f"node_hash: str = '{func}' + str(_sub_func_counter) + state_checksum()")
+            self.out("if node_hash in node_id_by_hash:")
+            with self.emitter.indented():
+                self.out("return node_id_by_hash[node_hash]")
+            self.out(f"option_saved_state = save_state()")
+            self.out()
+            self.out(f"node_id: str = new_label('{func}')")
+            self.out("node_id_by_hash[node_hash] = node_id")
+            self.out()
+            self.out("with nested_break() as abort_processing:")
+            with self.emitter.indented():
+                self.out("out = ''")
+                self.visit(block)
+                self.out(f"append_node: str = yield room_func")
+                self.out("page_appended(node_id, append_node)")
+            self.out(f"restore_state(option_saved_state)")
+            self.out(f"random.setstate(_state['random_state'])")
+            self.out("# option pages are only linked to, they are not appendable")
+            self.out("page_finished(node_id, out, False)")
+            self.out("return node_id")
+        self.out(f"option_list.append(({option_description}, {func}))")
         self.scope_local.intersection_update(saved_locals)
 
     def once_statement(self, tree: Tree):
         self.once_counter += 1
-        out(f"if {self.once_counter} not in _once:")
-        indent_inc()
-        out(f"_once.add({self.once_counter})")
-        self.visit_children(tree)
-        indent_dec()
+        self.out(f"if {self.once_counter} not in _once:")
+        with self.emitter.indented():
+            self.out(f"_once.add({self.once_counter})")
+            self.visit_children(tree)
 
     def once_else(self, tree: Tree):
-        indent_dec()
-        out("else:")
-        indent_inc()
+        with self.emitter.dedented():
+            self.out("else:")
 
     def macro_define(self, tree: Tree) -> None:
         macro_id_tree, compound_statement = tree.children
@@ -1087,7 +1173,7 @@ with open("index.md", "w") as w:
             if var not in self.scope_world:
                 self.scope_local.add(var)
                 lvalue: str = self.visit(postfix)
-        out(f"{lvalue} {op} {value}")
+        self.out(f"{lvalue} {op} {value}")
 
     def assignment_operator(self, tree: Tree):
         _ = ""
@@ -1173,7 +1259,7 @@ with open("index.md", "w") as w:
                     already.add(var)
                     _ = _.replace("{" + var, "{" + field_var)
             do_comma: bool = False
-            for kv in key_var:
+            for kv in sorted(key_var):
                 if do_comma:
                     formatter += ", "
                 else:
@@ -1250,12 +1336,12 @@ with open("index.md", "w") as w:
 
     def short_comment(self, tree: Tree):
         comment: str = tree.children[0]
-        out(f"# {comment[1:].strip()}")
+        self.out(f"# {comment[1:].strip()}")
 
     def long_comment(self, tree: Tree):
         comment: str = tree.children[0]
         for line in comment[3:-3].strip().split("\n"):
-            out(f"# {line}")
+            self.out(f"# {line}")
 
     def addition(self, tree: Tree) -> str:
         return self.__binary_op("+", tree)
@@ -1366,69 +1452,68 @@ with open("index.md", "w") as w:
         scope, var, _ = tree.children
         if scope == "world":
             self.scope_world.add(var)
-            out(f"if '{var}' not in state['world']:")
-            indent_inc()
-            out(f"state['world']['{var}'] = False")
-            indent_dec()
+            self.out(f"if '{var}' not in state['world']:")
+            with self.emitter.indented():
+                self.out(f"state['world']['{var}'] = False")
         if scope == "room":
             self.scope_room.add(var)
-            out(f"if '{var}' not in state[room_name]['vars']:")
-            indent_inc()
-            out(f"state[room_name]['vars']['{var}'] = False")
-            indent_dec()
+            self.out(f"if '{var}' not in state[room_name]['vars']:")
+            with self.emitter.indented():
+                self.out(f"state[room_name]['vars']['{var}'] = False")
         if scope == "local":
             self.scope_local.add(var)
-            out(f"_local_{var}: any = False")
+            self.out(f"_local_{var}: any = False")
 
     def start_over(self, tree: Tree):
-        out(f"def start_over():")
-        indent_inc()
-        out("return 'index'")
-        indent_dec()
+        self.out(f"def start_over():")
+        with self.emitter.indented():
+            self.out("return 'index'")
 
-        out(f"option_list.append((\"Start Over\", start_over))")
-        out("raise abort_processing # end processing after restart statement")
+        self.out(f"option_list.append((\"Start Over\", start_over))")
+        self.out("raise abort_processing # end processing after restart statement")
 
     def __default__(self, tree: Tree | Token):
-        out(f"# __default__: {tree.data}")
+        self.out(f"# __default__: {tree.data}")
         _ = ""
         for visit in self.visit_children(tree):
             if visit:
                 _ += visit
         if _.strip():
-            out(_)
+            self.out(_)
 
     def end_room(self) -> None:
         if self.macro_postexec:
             if self.macro_postexec in self.defined_macros:
                 self.visit(self.defined_macros[self.macro_postexec])
-        out("out += state[room_name]['vars']['items'].inv")
-        out("out += \"\\n\\n\"")
-        indent_dec()
-        out(f"_state['random_state'] = random.getstate()")
-        out("recurse_depth -= 1")
-        out("option_list.sort(key=lambda x: x[0])")
-        out("saved_state = save_state()")
-
-        out("if option_list:")
-        indent_inc()
-        out("out += \"\\n_____\\n\"")
-        out("for _ in option_list:")
-        indent_inc()
-        out("destination_node = _[1]()")
-        out("restore_state(saved_state)")
-        out(f"_option_text: str = str(_[0])")
-        out(f"_option_text = html.escape(_option_text)")
-        out(f"_md_link: str = \"[\" + _option_text + \"](\" + destination_node + \".md)\"")
-        out("out += \"* \" + _md_link")
-        out("out += \"\\n\"")
-        indent_dec()
-        out("out += \"_____\\n\"")
-        indent_dec()
-
-        out("restore_turn()")
-        out("_output[node_id] = out")
-        out("return node_id")
-        indent_dec()
-        out()
-        out()
+        self.out("out += state[room_name]['vars']['items'].inv")
+        self.out("out += \"\\n\\n\"")
+        self._room_abort.close()
+        self.out(f"_state['random_state'] = random.getstate()")
+        self.out("option_list.sort(key=lambda x: x[0])")
+        self.out("saved_state = save_state()")
+
+        self.out("if option_list:")
+        with self.emitter.indented():
+            self.out("out += \"\\n_____\\n\"")
+            self.out("for _ix, _ in enumerate(option_list):")
+            with self.emitter.indented():
+                self.out("# every option after the first starts from the restored snapshot "
+                         "and can be taken from the cache")
+                self.out("destination_node = yield gamebook_explorer.FromSnapshot(_[1]) if _ix else _[1]")
+                self.out("restore_state(saved_state)")
+                self.out(f"_option_text: str = str(_[0])")
+                self.out(f"_option_text = html.escape(_option_text)")
+                self.out(f"_md_link: str = \"[\" + _option_text + \"](\" + destination_node + \".md)\"")
+                self.out("out += \"* \" + _md_link")
+                self.out("out += \"\\n\"")
+            self.out("out += \"_____\\n\"")
+
+        self.out("restore_turn()")
+        self.out("page_finished(node_id, out)")
+        self.out("return node_id")
+        self._room_body.close()
+        self.out()
+        self.out()
+        if self._room_module is not None:
+            self.room_sources[self._room_module] = self.emitter.release()
+            self._room_module = None
@@ -1,14 +1,15 @@
 import random
 
-import dice
 import jsonpickle
 
 import character_sheet
+import dice_expr
 from equipment import Armor
 from equipment import Item
 from equipment import Money
 from equipment import Shield
 from equipment import Weapon
+from gamebook_core import AbstractCharacter
 from gamebook_core import dice_roll
 from skills import Difficulty
 
@@ -110,9 +111,7 @@ def deepcopy(o: any) -> any:
 
 
 def roll(die: str) -> int:
-    if die.strip()[-1] != "t":
-        die += " t"
-    return max(0, int(dice.roll(f"{die}")))
+    return max(0, dice_expr.roll(die))
 
 
 def dark_power_intervention_text() -> str:
@@ -281,10 +280,10 @@ def initiative(side_a=None,  #
                 _ = p
                 break
         side_b = _
-    if isinstance(side_a, character_sheet.CharacterSheet):
+    if isinstance(side_a, AbstractCharacter):
         name1 = side_a.name
         side_a = side_a.rogue
-    if isinstance(side_b, character_sheet.CharacterSheet):
+    if isinstance(side_b, AbstractCharacter):
         name2 = side_b.name
         side_b = side_b.rogue
     if side_a is None:
@@ -313,9 +312,9 @@ def initiative_check(side_a: int = 0, side_b: int = 0) -> bool:
         side_a = side_a[0].rogue
     if isinstance(side_b, list):
         side_b = side_b[0].rogue
-    if isinstance(side_a, character_sheet.CharacterSheet):
+    if isinstance(side_a, AbstractCharacter):
         side_a = side_a.rogue
-    if isinstance(side_b, character_sheet.CharacterSheet):
+    if isinstance(side_b, AbstractCharacter):
         side_b = side_b.rogue
 
     roll1: int = roll(f"1d6+{side_a}")
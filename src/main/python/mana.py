@@ -1,10 +1,10 @@
-import jsonpickle
-
+import gamebook_state
+from catalog import Catalog
 from skills import *
 
 
 @dataclass(slots=True)
-class MageSpell:
+class MageSpell(gamebook_state.Tracked):
     _name: str = ""
     description: str = ""
     circle: int = 0
@@ -57,7 +57,12 @@ class MageSpell:
             self.difficulty = Difficulty.Extreme
 
     def __copy__(self) -> "MageSpell":
-        return jsonpickle.decode(jsonpickle.encode(self))
+        spell: MageSpell = MageSpell(self.circle, self._name, self.description)
+        spell.mana_cost = self.mana_cost
+        spell.difficulty = self.difficulty
+        spell.macro = list(self.macro)
+        spell.is_scroll = self.is_scroll
+        return spell
 
     def copy(self) -> "MageSpell":
         return self.__copy__()
@@ -71,66 +76,76 @@ class MageSpell:
         return f"{self.name}, Mana: {self.mana_cost}, Difficulty: {self.difficulty}, {self.description}"
 
 
+def _build_spells() -> list[MageSpell]:
+    mage_spells: list[MageSpell] = list()
+    mage_spells.append(MageSpell(1, "Frost Burn", "Touch. 1d6-2 damage. Mana burn raises damage by +1."))
+    healing_hand = MageSpell(1, "Healing Hand", "Touch. 2d3 HP healed. Mana burn raises heal by +1.")
+    healing_hand.macro.append("@hp: roll('2d3')")
+    healing_hand.macro.append("@pc_id.hp: player.hp_add(hp)")
+    healing_hand.macro.append(f"@pc_id.mana: player.mana - {healing_hand.mana_cost}")
+    mage_spells.append(healing_hand)
+    mage_spells.append(MageSpell(1, "Magic Light", "Create a magic light on the tip of a staff or other "
+                                                        "weapon. 10 yard radius."
+                                                        " Duration: 1 hour + 1 mana per additional hour."
+                                                        " Options: Ball of light (form "
+                                                        "into a ball that can be controlled with thought), "
+                                                        "Colored light (select any visible color), Light beam ("
+                                                        "tight beam up to 15 yards). Bright Flash (Effect ends "
+                                                        "after 1 round. Blinds anyone unprotected for 1d6 "
+                                                        "rounds."))
+    mage_spells.append(MageSpell(1, "Sense Magic", "Sense magic in a 3 yard radius. Mana burn +1 yard."))
+    mage_spells.append(MageSpell(1, "Telekinesis", "Remotely move one item up to 1kg. Duration: 1 min. Mana "
+                                                        "burn +1kg."))
+    mage_spells.append(MageSpell(2, "Food and Water", "1 Daily ration of food and water."))
+    mage_spells.append(MageSpell(2, "Healing Light", "Touch. Heal 1d6 HP. Mana burn: +2 HP."))
+    mage_spells.append(MageSpell(2, "Identify", "Identify one magic property of an item. Mana burn: one "
+                                                     "additional property."))
+    mage_spells.append(MageSpell(2, "Levitation", "Slowly float up and down for 3 minutes. May be sustained "
+                                                       "for 1 mana per minute. No propulsion provided."))
+    mage_spells.append(MageSpell(2, "Lightning Bolt", "Missile attack. 1d6+2 damage. Mana burn: +2 damage."))
+    mage_spells.append(MageSpell(2, "Magic Armor", "Shield. Will last until shield's HP is consumed. 4 HP. "
+                                                        "Mana burn: 4 HP. Excess damage is discarded."))
+    mage_spells.append(MageSpell(3, "Chain Lightning", "Missile attack. Up to 3 targets in a 3 yard radius. "
+                                                            "3d6 damage. Mana burn: damage +2 or radius +2 "
+                                                            "yards."))
+    mage_spells.append(MageSpell(3, "Walk on Air", "Walk on air is if solid ground. Duration: 3 minutes. "
+                                                        "Sustained for 1 minute for 1 mana."))
+    mage_spells.append(MageSpell(3, "Fire Bolt", "Missile. 3d6 damage. Radius of 3 yards. Mana burn: damage "
+                                                      "+2 or radius + 2 yards."))
+    mage_spells.append(MageSpell(3, "Enchant Weapon", "Grants +2 on attack rolls and damage. Last for one "
+                                                           "combat encounter. Mana burn: +1 to attack and "
+                                                           "damage."))
+    mage_spells.append(MageSpell(3, "Stasis", "Touch. Freezes target for number of hours equal to successes "
+                                                   "rolled."))
+    mage_spells.append(MageSpell(4, "Summon Earth Elemental", "Summons. Raises an earth elemental. Remains "
+                                                                   "until dispelled or HP is exhausted."))
+    mage_spells.append(MageSpell(4, "Magic Step", "Teleport up to 10 yards. Mana burn: +10 yards. Must have "
+                                                       "a clear mental image of destination."))
+    mage_spells.append(MageSpell(4, "Moon Gate", "Can open a moongate at special locations such as stone "
+                                                      "circles. Moongates allow instant travel over long "
+                                                      "distances. Closes slowly after 2 minutes. Mana burn: Not "
+                                                      "available."))
+    mage_spells.append(MageSpell(4, "Return to Life", "Touch. Revive one fallen character. Character is "
+                                                           "restored with 2 HP. Mana burn: +2 HP restored. Body "
+                                                           "must still be 'warm'."))
+    mage_spells.append(MageSpell(4, "Summon Phantom Steed", "Summons. Raises a phantom steed. Duration: 24 "
+                                                                 "hours or until dispelled or HP is exhausted. "
+                                                                 "Mana burn: Not available."))
+    return mage_spells
+
+
+_spells: Catalog = Catalog(_build_spells, lambda spell: spell.name, MageSpell.copy)
+# the spells, then each of them as a scroll
+_spells_and_scrolls: Catalog = Catalog(lambda: [*_spells.entries, *(spell.as_scroll for spell in _spells.entries)],
+                                       lambda spell: spell.name, MageSpell.copy)
+
+
 @dataclass(slots=True)
 class MageSpellList:
 
     @classmethod
     def spells(cls) -> list[MageSpell]:
-        mage_spells: list[MageSpell] = list()
-        mage_spells.append(MageSpell(1, "Frost Burn", "Touch. 1d6-2 damage. Mana burn raises damage by +1."))
-        healing_hand = MageSpell(1, "Healing Hand", "Touch. 2d3 HP healed. Mana burn raises heal by +1.")
-        healing_hand.macro.append("@hp: roll('2d3')")
-        healing_hand.macro.append("@pc_id.hp: player.hp_add(hp)")
-        healing_hand.macro.append(f"@pc_id.mana: player.mana - {healing_hand.mana_cost}")
-        mage_spells.append(healing_hand)
-        mage_spells.append(MageSpell(1, "Magic Light", "Create a magic light on the tip of a staff or other "
-                                                            "weapon. 10 yard radius."
-                                                            " Duration: 1 hour + 1 mana per additional hour."
-                                                            " Options: Ball of light (form "
-                                                            "into a ball that can be controlled with thought), "
-                                                            "Colored light (select any visible color), Light beam ("
-                                                            "tight beam up to 15 yards). Bright Flash (Effect ends "
-                                                            "after 1 round. Blinds anyone unprotected for 1d6 "
-                                                            "rounds."))
-        mage_spells.append(MageSpell(1, "Sense Magic", "Sense magic in a 3 yard radius. Mana burn +1 yard."))
-        mage_spells.append(MageSpell(1, "Telekinesis", "Remotely move one item up to 1kg. Duration: 1 min. Mana "
-                                                            "burn +1kg."))
-        mage_spells.append(MageSpell(2, "Food and Water", "1 Daily ration of food and water."))
-        mage_spells.append(MageSpell(2, "Healing Light", "Touch. Heal 1d6 HP. Mana burn: +2 HP."))
-        mage_spells.append(MageSpell(2, "Identify", "Identify one magic property of an item. Mana burn: one "
-                                                         "additional property."))
-        mage_spells.append(MageSpell(2, "Levitation", "Slowly float up and down for 3 minutes. May be sustained "
-                                                           "for 1 mana per minute. No propulsion provided."))
-        mage_spells.append(MageSpell(2, "Lightning Bolt", "Missile attack. 1d6+2 damage. Mana burn: +2 damage."))
-        mage_spells.append(MageSpell(2, "Magic Armor", "Shield. Will last until shield's HP is consumed. 4 HP. "
-                                                            "Mana burn: 4 HP. Excess damage is discarded."))
-        mage_spells.append(MageSpell(3, "Chain Lightning", "Missile attack. Up to 3 targets in a 3 yard radius. "
-                                                                "3d6 damage. Mana burn: damage +2 or radius +2 "
-                                                                "yards."))
-        mage_spells.append(MageSpell(3, "Walk on Air", "Walk on air is if solid ground. Duration: 3 minutes. "
-                                                            "Sustained for 1 minute for 1 mana."))
-        mage_spells.append(MageSpell(3, "Fire Bolt", "Missile. 3d6 damage. Radius of 3 yards. Mana burn: damage "
-                                                          "+2 or radius + 2 yards."))
-        mage_spells.append(MageSpell(3, "Enchant Weapon", "Grants +2 on attack rolls and damage. Last for one "
-                                                               "combat encounter. Mana burn: +1 to attack and "
-                                                               "damage."))
-        mage_spells.append(MageSpell(3, "Stasis", "Touch. Freezes target for number of hours equal to successes "
-                                                       "rolled."))
-        mage_spells.append(MageSpell(4, "Summon Earth Elemental", "Summons. Raises an earth elemental. Remains "
-                                                                       "until dispelled or HP is exhausted."))
-        mage_spells.append(MageSpell(4, "Magic Step", "Teleport up to 10 yards. Mana burn: +10 yards. Must have "
-                                                           "a clear mental image of destination."))
-        mage_spells.append(MageSpell(4, "Moon Gate", "Can open a moongate at special locations such as stone "
-                                                          "circles. Moongates allow instant travel over long "
-                                                          "distances. Closes slowly after 2 minutes. Mana burn: Not "
-                                                          "available."))
-        mage_spells.append(MageSpell(4, "Return to Life", "Touch. Revive one fallen character. Character is "
-                                                               "restored with 2 HP. Mana burn: +2 HP restored. Body "
-                                                               "must still be 'warm'."))
-        mage_spells.append(MageSpell(4, "Summon Phantom Steed", "Summons. Raises a phantom steed. Duration: 24 "
-                                                                     "hours or until dispelled or HP is exhausted. "
-                                                                     "Mana burn: Not available."))
-        return mage_spells
+        return _spells.list()
 
     @classmethod
     def random_spell(cls, mana: int | None = None, circle: int | None = None) -> MageSpell:
@@ -138,21 +153,15 @@ class MageSpellList:
             mana = 2 ** (circle - 1)
         if mana is None:
             mana = 1
-        spells: list[MageSpell] = cls.spells()
+        spells: tuple[MageSpell, ...] = _spells.entries
         while True:
             spell: MageSpell = random.choice(spells)
             if spell.mana_cost <= mana and random.randint(1, 10) > spell.mana_cost:
-                return spell
+                return spell.copy()
 
     @classmethod
     def by_name(cls, name: str) -> MageSpell | None:
-        spells: list[MageSpell] = cls.spells()
-        for spell in spells.copy():
-            spells.append(spell.as_scroll)
-        for spell in spells:
-            if name.lower() in spell.name.lower():
-                return spell
-        return None
+        return _spells_and_scrolls.containing(name)
 
     @classmethod
     def spell_by_name(cls, name: str) -> MageSpell | None:
@@ -1,23 +1,74 @@
+import array
 import random
+import weakref
 from dataclasses import dataclass
 from dataclasses import field
 from enum import Enum
 from enum import auto
+from typing import ClassVar
 
+import character_sheet
 import gamebook_core
 from character_sheet import CharacterSheet
+from character_sheet import best_of
+from combat_events import CombatLog
+from combat_events import CombatSink
+from combat_events import EventKind
 from equipment import Armor
 from equipment import Item
 from equipment import Money
 from equipment import Shield
 from equipment import Weapon
+from gamebook_core import AbstractCharacter
 from gb_utils import get_loot
 from gb_utils import intervention
 from npcs import NPC
+from skills import Difficulty
 
 _mob_counter: int = 0
 
 
+class _MobStats:
+    """
+    Aggregates over the units of a mob, computed in one pass and kept up to date by the mob's damage paths.
+
+    They are valid for the sheet revision and the number of units they were taken at. Any other change to
+    the HP or attributes of a sheet, or units added or removed through `MobUnit.units`, makes the mob
+    compute them again.
+    """
+    __slots__ = ("living", "hp", "attack", "defense", "warrior", "rogue", "mage", "revision", "count")
+
+    def __init__(self, units: list[CharacterSheet]):
+        self.revision: int = character_sheet.revision()
+        self.count: int = len(units)
+        self.living: list[CharacterSheet] = [unit for unit in units if unit.is_alive]
+        self.hp: int = sum(unit.hp for unit in self.living)
+        self.attack: int = max([unit.attack for unit in self.living], default=0)
+        self.defense: int = max([unit.defense for unit in self.living], default=0)
+        self.warrior: int = max([unit.warrior for unit in self.living], default=0)
+        self.rogue: int = max([unit.rogue for unit in self.living], default=0)
+        self.mage: int = max([unit.mage for unit in self.living], default=0)
+
+    def damaged(self, units: list[CharacterSheet], lost: int) -> None:
+        """
+        Account for `lost` HP taken by `units`, dead units leave and the wounded may attack worse. The
+        aggregates must have been valid before the damage was done.
+        """
+        self.revision = character_sheet.revision()
+        self.hp -= lost
+        if not all(unit.is_alive for unit in units):
+            self.living = [unit for unit in self.living if unit.is_alive]
+            self.defense = max([unit.defense for unit in self.living], default=0)
+            self.warrior = max([unit.warrior for unit in self.living], default=0)
+            self.rogue = max([unit.rogue for unit in self.living], default=0)
+            self.mage = max([unit.mage for unit in self.living], default=0)
+        self.attack = max([unit.attack for unit in self.living], default=0)
+
+
+# aggregates by the id of their mob, outside the instances so they never become part of a gamebook's state
+_mob_stats: dict[int, _MobStats | None] = dict()
+
+
 @dataclass
 class MobUnit(gamebook_core.AbstractItem):
     """
@@ -25,6 +76,8 @@ class MobUnit(gamebook_core.AbstractItem):
 
     Inspired by Dungeon Master's guide (2014) pg 250
     """
+    # the name counts the units and shows the leader's HP
+    live_name: ClassVar[bool] = True
 
     _units: list[CharacterSheet] = field(default_factory=list)
     _name: str | None = None
@@ -32,12 +85,36 @@ class MobUnit(gamebook_core.AbstractItem):
     _massive_attack_used: bool = False
     _loot: list[Item | Weapon | Armor | Shield | str] = field(default_factory=list)
 
-    def combat_round(self, opponent_mob: "MobUnit", have_initiative: bool | None = None) -> list[str] | None:
-        if isinstance(opponent_mob, CharacterSheet):
+    def _stats(self) -> _MobStats:
+        key: int = id(self)
+        stats: _MobStats | None = _mob_stats.get(key)
+        if stats is None or stats.revision != character_sheet.revision() or stats.count != len(self._units):
+            if key not in _mob_stats:
+                weakref.finalize(self, _mob_stats.pop, key, None)
+            stats = _mob_stats[key] = _MobStats(self._units)
+        return stats
+
+    def refresh(self) -> None:
+        """Forget the aggregates over the units, e.g. after changing a unit's equipment."""
+        if id(self) in _mob_stats:
+            _mob_stats[id(self)] = None
+
+    def combat_round(self, opponent_mob: "MobUnit", have_initiative: bool | None = None,
+                     sink: CombatSink | None = None) -> list[str] | None:
+        """The log of one round, with a `sink` the events go there instead and nothing is formatted."""
+        if isinstance(opponent_mob, AbstractCharacter):
             _ = opponent_mob
             opponent_mob = MobUnit()
             opponent_mob.add_unit(_)
-        combat_log: list[str] = list()
+        self.refresh()
+        opponent_mob.refresh()
+        log: CombatSink = CombatLog() if sink is None else sink
+        if not self._combat_round(opponent_mob, have_initiative, log):
+            return None
+        return log.lines() if sink is None else list()
+
+    def _combat_round(self, opponent_mob: "MobUnit", have_initiative: bool | None, sink: CombatSink) -> bool:
+        """One round of the fight, False when there was nobody left to fight it."""
         starting_hp: dict[str, int] = dict()
         for unit in self._units:
             starting_hp[unit.name_with_id] = unit.hp
@@ -48,7 +125,7 @@ class MobUnit(gamebook_core.AbstractItem):
             have_initiative = self.initiative_check(opponent_mob)
 
         if not self.units or not opponent_mob.units:
-            return None
+            return False
 
         attacking_mob: MobUnit
         defending_mob: MobUnit
@@ -62,81 +139,101 @@ class MobUnit(gamebook_core.AbstractItem):
         defending_hp: int = defending_mob.hp
 
         if not attacking_mob.is_alive or not defending_mob.is_alive:
-            return None
+            return False
 
         hit: bool = gamebook_core.dice_roll(1, 6) + attacking_mob.attack >= defending_mob.defense
-        combat_result: str = ""
         if hit:
             damage_die: str = attacking_mob.damage_die
-            damage_result: str = defending_mob._take_damage(damage_die)
-            if damage_result:
-                combat_result = damage_result  # f"; {damage_result}{extra}"
+            combat_result: str = defending_mob._take_damage(damage_die)
             all_units: list[CharacterSheet] = list()
             all_units.extend(self.units)
             all_units.extend(opponent_mob.units)
             for unit in all_units:
                 if starting_hp[unit.name_with_id] != unit.hp:
-                    hp_lost: int = unit.hp - starting_hp[unit.name_with_id]
-                    died_text: str = "" if unit.is_alive else ", DIED."
-                    combat_log.append(f"- {unit.name}: {hp_lost:+,} HP{died_text}")
+                    sink.emit(EventKind.UnitHp, unit._name, unit.hp, unit.xp, unit.location,
+                              unit.hp - starting_hp[unit.name_with_id])
             if combat_result:
-                combat_log.append(combat_result)
-        return combat_log
+                sink.text(combat_result)
+        return True
 
-    def combat(self, opponent_mob: "MobUnit", have_initiative: bool | None = None) -> list[str] | None:
-        if isinstance(opponent_mob, CharacterSheet):
+    def combat(self, opponent_mob: "MobUnit", have_initiative: bool | None = None,
+               sink: CombatSink | None = None) -> list[str] | None:
+        """The log of the fight, with a `sink` the events go there instead and nothing is formatted."""
+        if isinstance(opponent_mob, AbstractCharacter):
             _ = opponent_mob
             opponent_mob = MobUnit()
             opponent_mob.add_unit(_)
+        self.refresh()
+        opponent_mob.refresh()
 
         if not self.is_alive or not opponent_mob.is_alive:
             return None
 
-        combat_log: list[str] = list()
-        combat_log.append(f"#### Combat")
+        log: CombatSink = CombatLog() if sink is None else sink
+        self._combat(opponent_mob, have_initiative, log)
+        return log.lines() if sink is None else list()
+
+    def _combat(self, opponent_mob: "MobUnit", have_initiative: bool | None, sink: CombatSink) -> CombatSink:
+        sink.text(f"#### Combat")
 
         if "Player" not in self.name:
-            combat_log.append("")
-            # combat_log.append(f"**{self.name}**")
-            # combat_log.append("")
+            sink.text("")
             for unit in self.units:
-                combat_log.append(f"* {unit.name}")
-            combat_log.append("")
+                sink.emit(EventKind.Unit, unit._name, unit.hp, unit.xp, unit.location)
+            sink.text("")
 
         if "Player" not in self.name and "Player" not in opponent_mob.name:
-            combat_log.append("*vs*")
+            sink.text("*vs*")
 
         if "Player" not in opponent_mob.name:
-            combat_log.append("")
-            # combat_log.append(f"**{opponent_mob.name}**")
-            # combat_log.append("")
+            sink.text("")
             for unit in opponent_mob.units:
-                combat_log.append(f"* {unit.name}")
+                sink.emit(EventKind.Unit, unit._name, unit.hp, unit.xp, unit.location)
 
-        combat_log.append("")
+        sink.text("")
         if have_initiative is None:
             have_initiative = self.initiative_check(opponent_mob)
 
         if have_initiative:
-            combat_log.append(f"- {self.name} has initiative.")
+            sink.text(f"- {self.name} has initiative.")
         else:
-            combat_log.append(f"- {opponent_mob.name} has initiative.")
+            sink.text(f"- {opponent_mob.name} has initiative.")
 
         while self.is_alive and opponent_mob.is_alive:
-            result: list[str] = self.combat_round(opponent_mob, have_initiative=have_initiative)
-            if result:
-                combat_log.extend(result)
+            self._combat_round(opponent_mob, have_initiative, sink)
             have_initiative = not have_initiative
             if not opponent_mob.is_alive or not self.is_alive:
                 _ = opponent_mob if self.is_alive else self
                 if _.fate:
-                    starting_fate: dict[str, int] = dict()
-                    for unit in _.units:
-                        starting_fate[unit.name_with_id] = unit.fate
-                    combat_log.append(_.fate_dec(1))
-                    # for unit in _.units:
-                    #     unit.hp = unit.hit_points_max
-        return combat_log
+                    sink.text(_.fate_dec(1))
+        return sink
+
+    def combat_best_of(self, opponent_mob: "MobUnit", tries: int, have_initiative: bool | None = None) -> list[str]:
+        """The shortest of `tries` fights, both sides are left the way that fight ended."""
+        if isinstance(opponent_mob, AbstractCharacter):
+            _ = opponent_mob
+            opponent_mob = MobUnit()
+            opponent_mob.add_unit(_)
+
+        def fight() -> CombatSink:
+            self.refresh()
+            opponent_mob.refresh()
+            if not self.is_alive or not opponent_mob.is_alive:
+                return CombatLog()
+            return self._combat(opponent_mob, have_initiative, CombatLog())
+
+        return best_of(tries, fight, self, opponent_mob).lines()
+
+    def combat_state(self) -> tuple:
+        return (self._name, self._massive_attack_used, list(self._units),
+                [unit.combat_state() for unit in self._units])
+
+    def restore_combat_state(self, state: tuple) -> None:
+        self._name, self._massive_attack_used, units, states = state
+        self._units[:] = units
+        for unit, unit_state in zip(units, states):
+            unit.restore_combat_state(unit_state)
+        self.refresh()
 
     def initiative_check(self, opponent_mob: "MobUnit", have_initiative: bool | None = None) -> bool:
         opponent_mob: MobUnit | CharacterSheet | list[CharacterSheet]
@@ -144,7 +241,7 @@ class MobUnit(gamebook_core.AbstractItem):
             mob = MobUnit()
             mob.add_units(opponent_mob)
             opponent_mob = mob
-        if isinstance(opponent_mob, CharacterSheet):
+        if isinstance(opponent_mob, AbstractCharacter):
             mob = MobUnit()
             mob.add_unit(opponent_mob)
             opponent_mob = mob
@@ -158,10 +255,7 @@ class MobUnit(gamebook_core.AbstractItem):
 
     @property
     def fate(self) -> int:
-        _ = 0
-        for unit in self.units:
-            _ = max(unit.fate, _)
-        return _
+        return max([unit.fate for unit in self._units], default=0)
 
     @fate.setter
     def fate(self, new_value: int) -> None:
@@ -213,25 +307,25 @@ class MobUnit(gamebook_core.AbstractItem):
 
     @property
     def hp_max(self) -> int:
-        _ = 0
-        for unit in self.units:
-            _ += unit.hit_points_max
-        return _
+        return sum(unit.hit_points_max for unit in self._units)
 
     def add_unit(self, unit: CharacterSheet) -> str:
-        self.units.append(unit)
+        self._units.append(unit)
+        self.refresh()
         return self.name
 
     def add_units(self, units: list[CharacterSheet]) -> str:
         if isinstance(units, MobUnit):
             units = units.units
-        self.units.extend(units)
+        self._units.extend(units)
+        self.refresh()
         return self.name
 
     def remove_unit(self, unit: CharacterSheet) -> str:
         idx: int = self.units.index(unit) if unit in self.units else -1
         if idx < 0:
             return "UNIT NOT FOUND"
+        self.refresh()
         return self.units.pop(idx).name
 
     @property
@@ -248,6 +342,7 @@ class MobUnit(gamebook_core.AbstractItem):
                     self._name = unit.base_name
                     break
         self._units = units
+        self.refresh()
 
     @property
     def name(self) -> str:
@@ -267,12 +362,22 @@ class MobUnit(gamebook_core.AbstractItem):
         dmg: int = max(int(gamebook_core.dice_roll2(f"{die}")), 1)
         r_units: list[CharacterSheet] = self._units.copy()
         random.shuffle(r_units)
-        unit_count = self.unit_count
+        # taken before the damage, the HP written below change the sheet revision
+        stats: _MobStats = self._stats()
+        unit_count = len(stats.living)
+        damaged: list[CharacterSheet] = list()
+        lost: int = 0
         for unit in r_units:
             if unit.is_alive:
+                unit_hp: int = unit.hp
                 unit_dmg = min(unit.hp, dmg)
                 unit.hit_points -= unit_dmg
                 dmg -= unit_dmg
+                if unit.hp != unit_hp:
+                    damaged.append(unit)
+                    lost += unit_hp - unit.hp
+        if damaged:
+            stats.damaged(damaged, lost)
         units_lost = unit_count - self.unit_count
         if not units_lost:
             return ""
@@ -282,11 +387,7 @@ class MobUnit(gamebook_core.AbstractItem):
 
     @property
     def alive_count(self) -> int:
-        _ = 0
-        for u in self.units:
-            if u.is_alive:
-                _ += 1
-        return _
+        return len(self._stats().living)
 
     def take_damage(self, die: str) -> list[str]:
         result: list[str] = list()
@@ -321,35 +422,19 @@ class MobUnit(gamebook_core.AbstractItem):
 
     @property
     def unit_count(self) -> int:
-        _ = 0
-        for unit in self._units:
-            if unit.is_alive:
-                _ += 1
-        return _
+        return len(self._stats().living)
 
     @property
     def hp(self) -> int:
-        _ = 0
-        for unit in self._units:
-            if unit.is_alive:
-                _ += unit.hp
-        return _
+        return self._stats().hp
 
     @property
     def attack(self) -> int:
-        _ = 0
-        for unit in self._units:
-            if unit.is_alive:
-                _ = max(_, unit.attack)
-        return _
+        return self._stats().attack
 
     @property
     def defense(self) -> int:
-        _ = 0
-        for unit in self._units:
-            if unit.is_alive:
-                _ = max(_, unit.defense)
-        return _
+        return self._stats().defense
 
     @property
     def damage(self) -> int:
@@ -369,7 +454,7 @@ class MobUnit(gamebook_core.AbstractItem):
     def damage_die(self) -> str:
         die_max = "1d2"
         val_max: int = 0
-        for unit in self._units:
+        for unit in list(self._stats().living):
             if unit.is_alive:
                 unit_damage = unit.damage.replace("x", "")
                 if unit_damage:
@@ -388,27 +473,15 @@ class MobUnit(gamebook_core.AbstractItem):
 
     @property
     def warrior(self) -> int:
-        s: int = 0
-        for unit in self._units:
-            if unit.is_alive:
-                s = max(unit.warrior, s)
-        return s
+        return self._stats().warrior
 
     @property
     def rogue(self) -> int:
-        s: int = 0
-        for unit in self._units:
-            if unit.is_alive:
-                s = max(unit.rogue, s)
-        return s
+        return self._stats().rogue
 
     @property
     def mage(self) -> int:
-        s: int = 0
-        for unit in self._units:
-            if unit.is_alive:
-                s = max(unit.mage, s)
-        return s
+        return self._stats().mage
 
 
 class AttackOption(Enum):
@@ -419,11 +492,25 @@ class AttackOption(Enum):
     Guard: int = auto()
 
 
+@dataclass
 class MassCombatUnit:
+    """
+    A block of identical soldiers that fights as one in a `MassCombat`.
+
+    The ratings are the ones of a single soldier: the combat rating is its attack, the battle rating its
+    defense, the morale its warrior level and the initiative its rogue level. `hit_points` is the HP of one
+    soldier, the battle only tracks the HP left in the whole block. That starts at `hp`, or with every
+    soldier at full health when `hp` is None.
+    """
+    name: str = ""
+    soldiers: int = 1
+    hit_points: int = 1
+    damage: str = "1d2x"
     _cr: int = 0
     _br: int = 0
     _moral: int = 0
-    _initiative: int = 10
+    _initiative: int = 0
+    hp: int | None = None
 
     @property
     def initiative(self) -> int:
@@ -441,19 +528,201 @@ class MassCombatUnit:
     def br(self) -> int:
         return self._br
 
+    @classmethod
+    def from_sheet(cls, sheet: CharacterSheet, soldiers: int, name: str | None = None) -> "MassCombatUnit":
+        """A block of `soldiers` soldiers like `sheet` at full health, no sheet is made for any of them."""
+        return cls(name=name or sheet.base_name, soldiers=soldiers, hit_points=max(1, sheet.hit_points_max),
+                   damage=sheet.damage_at(sheet.hit_points_max), _cr=sheet.attack_at(sheet.hit_points_max),
+                   _br=sheet.defense, _moral=sheet.warrior, _initiative=sheet.rogue)
+
+    @classmethod
+    def from_mob(cls, mob: MobUnit) -> "MassCombatUnit":
+        """
+        A block of the living units of a mob with their HP, the first of them stands for all and names the
+        block. A soldier has the average HP of the units, rounded up.
+        """
+        if not mob.is_alive:
+            raise ValueError(f"{mob.name} has no living units")
+        leader: CharacterSheet = next(unit for unit in mob.units if unit.is_alive)
+        block: MassCombatUnit = cls.from_sheet(leader, mob.unit_count)
+        block.hit_points = max(1, -(-mob.hp // mob.unit_count))
+        block.hp = mob.hp
+        return block
+
 
 class MassCombat:
     """
     Based on Dungeon Master's Guide (2014), page 250
     and on Unearthed Arcana: Mass Combat [Playtest Material] (2017)
+
+    Two sides of `MassCombatUnit` blocks fight in rounds. Every round the blocks act in the order of their
+    initiative, a d6 exploding plus the initiative, and follow their orders:
+
+    * Attack: the soldiers attack the target, by default the first block of the other side still fighting.
+      Each soldier hits like in `MobUnit`, a d6 plus the combat rating against the target's battle rating,
+      the block does the expected damage of its hits times 2d6 / 7.
+    * Dash: attack at +2, but the block defends at -2 until it acts again.
+    * Defend: no attack, +2 battle rating until the block acts again.
+    * Guard: no attack, attacks on the target, a block of the same side, are taken by the guard until it
+      acts again.
+    * Disengage: the block leaves the battle.
+
+    A block that loses soldiers in a round while down to half its soldiers checks its morale, a d6 exploding
+    plus the morale against a Routine difficulty, Challenging once down to a quarter, and routs on a failure.
+
+    The strength of the blocks lives in arrays indexed by block. A round costs the same for ten soldiers
+    or ten thousand, only the number of blocks counts.
     """
-    pass
+    Fighting: int = 0
+    Destroyed: int = 1
+    Routed: int = 2
+    Withdrawn: int = 3
+
+    def __init__(self, side_a: list[MassCombatUnit], side_b: list[MassCombatUnit]):
+        self.blocks: list[MassCombatUnit] = [*side_a, *side_b]
+        count: int = len(self.blocks)
+        self.side: array.array = array.array("b", [0] * len(side_a) + [1] * len(side_b))
+        self.hp: array.array = array.array("q", [block.soldiers * block.hit_points if block.hp is None
+                                                  else max(0, block.hp) for block in self.blocks])
+        # blocks without any HP never fight
+        self.status: array.array = array.array("b", [MassCombat.Fighting if hp else MassCombat.Destroyed
+                                                     for hp in self.hp])
+        self.rounds: int = 0
+        self._starting: array.array = array.array("q", [block.soldiers for block in self.blocks])
+        # mean damage of a soldier's hit, imported here so books without battles do not load NumPy
+        from dice_distribution import expected_damage
+        self._hit_damage: array.array = array.array("d", [expected_damage(block.damage) for block in self.blocks])
+        self._defense: array.array = array.array("b", [0] * count)
+        # block guarded by each block and the guard of each block, -1 for none
+        self._guarding: array.array = array.array("q", [-1] * count)
+        self._guard: array.array = array.array("q", [-1] * count)
+        # first block of each side still fighting, blocks never come back so this only moves forward
+        self._front: list[int] = [0, 0]
+        self._orders: list[tuple[AttackOption, int]] = [(AttackOption.Attack, -1)] * count
+
+    def index(self, block: MassCombatUnit | int) -> int:
+        if isinstance(block, int):
+            return block
+        for index, other in enumerate(self.blocks):
+            if other is block:
+                return index
+        raise ValueError(f"{block.name} is not in this battle")
+
+    def soldiers(self, block: MassCombatUnit | int) -> int:
+        index: int = self.index(block)
+        return -(-self.hp[index] // self.blocks[index].hit_points)
+
+    def order(self, block: MassCombatUnit | int, option: AttackOption,
+              target: MassCombatUnit | int | None = None) -> None:
+        """Orders stand until they are changed, a missing target is the first block of the other side."""
+        self._orders[self.index(block)] = (option, -1 if target is None else self.index(target))
+
+    def front(self, side: int) -> int:
+        """The first block of a side still fighting, -1 when none is."""
+        index: int = self._front[side]
+        while index < len(self.blocks) and (self.side[index] != side or self.status[index] != MassCombat.Fighting):
+            index += 1
+        self._front[side] = index
+        return index if index < len(self.blocks) else -1
+
+    def fighting(self, side: int) -> bool:
+        return self.front(side) >= 0
+
+    @property
+    def winner(self) -> int | None:
+        """0 for the first side, 1 for the second and None while both still fight or neither does."""
+        a, b = self.fighting(0), self.fighting(1)
+        return None if a == b else (0 if a else 1)
+
+    def battle(self, max_rounds: int = 100) -> list[str]:
+        log: list[str] = ["#### Battle", ""]
+        while self.fighting(0) and self.fighting(1) and self.rounds < max_rounds:
+            log.extend(self.round())
+        log.append("")
+        for index, block in enumerate(self.blocks):
+            status: str = ("", ", destroyed", ", routed", ", withdrawn")[self.status[index]]
+            log.append(f"* {block.name}: {self.soldiers(index):,} of {self._starting[index]:,} soldiers{status}")
+        return log
+
+    def round(self) -> list[str]:
+        log: list[str] = list()
+        lost: dict[int, int] = dict()
+        rolls: dict[int, int] = {index: gamebook_core.dice_roll(1, 6, True) + block.initiative
+                                 for index, block in enumerate(self.blocks)
+                                 if self.status[index] == MassCombat.Fighting}
+        for index in sorted(rolls, key=lambda index: -rolls[index]):
+            if self.status[index] != MassCombat.Fighting:
+                continue
+            self._defense[index] = 0
+            if self._guarding[index] >= 0 and self._guard[self._guarding[index]] == index:
+                self._guard[self._guarding[index]] = -1
+            self._guarding[index] = -1
+            option, target = self._orders[index]
+            block: MassCombatUnit = self.blocks[index]
+            if option == AttackOption.Defend:
+                self._defense[index] = 2
+            elif option == AttackOption.Guard:
+                if 0 <= target != index and self.side[target] == self.side[index]:
+                    self._guarding[index] = target
+                    self._guard[target] = index
+            elif option == AttackOption.Disengage:
+                self.status[index] = MassCombat.Withdrawn
+                log.append(f"- {block.name} withdraws from the battle.")
+            else:
+                bonus: int = 2 if option == AttackOption.Dash else 0
+                if option == AttackOption.Dash:
+                    self._defense[index] = -2
+                log.extend(self._attack(index, target, bonus, lost))
+
+        for index in lost:
+            if self.status[index] != MassCombat.Fighting:
+                continue
+            left: int = self.soldiers(index)
+            if left * 2 > self._starting[index]:
+                continue
+            difficulty: Difficulty = Difficulty.Challenging if left * 4 <= self._starting[index] \
+                else Difficulty.Routine
+            if gamebook_core.dice_roll(1, 6, True) + self.blocks[index].moral < difficulty.value:
+                self.status[index] = MassCombat.Routed
+                log.append(f"- {self.blocks[index].name} routs with {left:,} soldiers left.")
+        self.rounds += 1
+        return log
+
+    def _target(self, index: int, target: int) -> int:
+        """The block that takes an attack on `target`, -1 when the other side has no block left fighting."""
+        if target < 0 or self.side[target] == self.side[index] or self.status[target] != MassCombat.Fighting:
+            target = self.front(1 - self.side[index])
+        if target < 0:
+            return target
+        guard: int = self._guard[target]
+        return guard if guard >= 0 and self.status[guard] == MassCombat.Fighting else target
+
+    def _attack(self, index: int, target: int, bonus: int, lost: dict[int, int]) -> list[str]:
+        target = self._target(index, target)
+        if target < 0:
+            return []
+        block: MassCombatUnit = self.blocks[index]
+        defender: MassCombatUnit = self.blocks[target]
+        # a soldier hits on a d6 plus the combat rating reaching the battle rating
+        hit: float = min(1.0, max(0.0, (7 + block.cr + bonus - defender.br - self._defense[target]) / 6))
+        damage: int = int(self.soldiers(index) * hit * self._hit_damage[index] * gamebook_core.dice_roll(2, 6) / 7
+                          + 0.5)
+        before: int = self.soldiers(target)
+        self.hp[target] = max(0, self.hp[target] - damage)
+        fallen: int = before - self.soldiers(target)
+        if not self.hp[target]:
+            self.status[target] = MassCombat.Destroyed
+        if not fallen:
+            return [f"- {block.name} attacks {defender.name}, no soldiers fall."]
+        lost[target] = lost.get(target, 0) + fallen
+        died_text: str = ", DESTROYED." if not self.hp[target] else "."
+        return [f"- {block.name} attacks {defender.name}: {-fallen:+,} soldiers{died_text}"]
 
 
 def mob_combat(group1: list[CharacterSheet], group2: list[CharacterSheet]) -> list[str]:
-    if isinstance(group1, CharacterSheet):
+    if isinstance(group1, AbstractCharacter):
         group1 = [group1]
-    if isinstance(group2, CharacterSheet):
+    if isinstance(group2, AbstractCharacter):
         group2 = [group2]
 
     m1: MobUnit = MobUnit()
@@ -3,6 +3,7 @@ import random
 import types
 
 from character_sheet import CharacterSheet
+from combatant import Combatant
 from dnd5e_monsters import CharacterSheet5
 from dnd5e_monsters import from_dnd5e
 from equipment import Armor
@@ -31,6 +32,11 @@ class NPC:
             result.append(creature())
         return result
 
+    @classmethod
+    def spawn_combatants(cls, creature: types.FunctionType, count: int = 1) -> list[Combatant]:
+        """Like `spawn`, every sheet is turned into a combatant sharing the stats of its kind."""
+        return [Combatant.from_sheet(sheet) for sheet in cls.spawn(creature, count)]
+
     @classmethod
     @property
     def section_tag(cls) -> str:
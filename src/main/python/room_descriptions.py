@@ -1,5 +1,7 @@
 import random
+import re
 import textwrap
+from collections.abc import Iterable
 from dataclasses import dataclass
 from dataclasses import field
 
@@ -9,9 +11,196 @@ from character_sheet import CharacterSheet
 from equipment import Armor
 from equipment import Item
 from equipment import Weapon
+from gamebook_core import AbstractCharacter
+from gamebook_core import _facing_subj
+from gamebook_core import compass
+from gamebook_core import relative_direction
 from gb_utils import loot
 from mob_combat import MobUnit
 
+# characters that can make up the HP and XP a character sheet shows after its name, lower-cased
+_sheet_stats: str = " (hpx:,)-0123456789"
+
+# the /N/ /E/ /S/ /W/ placeholders of the descriptions, and for every facing of a room what they read as
+_placeholder: re.Pattern = re.compile("/([NESW])/")
+_phrases: tuple[str, ...] = ("in front of you", "to your right", "behind you", "to your left")
+_relative_phrases: dict[str, dict[str, str]] = {
+    facing: {direction.upper(): _phrases[relative_direction[f][d]] for d, direction in enumerate(compass)}
+    for f, facing in enumerate(compass)}
+# for every facing, the compass direction of front, right, rear and left
+_absolute: dict[str, dict[str, str]] = {
+    facing: {_facing_subj[relative_direction[f][d]]: direction for d, direction in enumerate(compass)}
+    for f, facing in enumerate(compass)}
+
+
+def _positions(bits: int) -> list[int]:
+    """The positions of the set bits, lowest first."""
+    reverse: str = bin(bits)[:1:-1]
+    positions: list[int] = list()
+    position: int = reverse.find("1")
+    while position >= 0:
+        positions.append(position)
+        position = reverse.find("1", position + 1)
+    return positions
+
+
+def _first(bits: int) -> int:
+    return (bits & -bits).bit_length() - 1
+
+
+def _without(bits: int, position: int) -> int:
+    """The bits with the one at `position` taken out, the bits above it move down."""
+    return bits & ((1 << position) - 1) | bits >> (position + 1) << position
+
+
+def _behind_name(query: str) -> bool:
+    """Whether a lower-cased query can match the HP and XP a character sheet shows after its name."""
+    # the stats start with " (", a query reaching into them from the name ends with a part of that made of
+    # stats characters only
+    stripped: str = query.rstrip(_sheet_stats)
+    stats: str = query[len(stripped):]
+    return not stripped or " (" in stats or stats.endswith(" ")
+
+
+class _RoomIndex:
+    """
+    Name lookups of one room's items, kept up to date by `_RoomItems`.
+
+    Every lookup the room's methods do is `query in item.name.lower()`, the first match or all of them in the
+    order of the items. The index keeps the lower-cased names and remembers every query with a bitmap of the
+    positions it matched. The HP and XP in a character sheet's name change in every fight, the index only keeps
+    the name in front of them and looks at the full name of a sheet when a query can match behind it or the sheet
+    is at a location. Items with a `live_name` are always looked at.
+    """
+    __slots__ = ("names", "sheets", "located", "live", "found")
+
+    def __init__(self, items: list[Item | Armor | Weapon | CharacterSheet]):
+        self.names: list[str] = list()
+        self.sheets: int = 0
+        self.located: int = 0
+        self.live: int = 0
+        self.found: dict[str, int] = dict()
+        for item in items:
+            self.append(item)
+
+    def append(self, item: Item | Armor | Weapon | CharacterSheet) -> None:
+        bit: int = 1 << len(self.names)
+        name: str = ""
+        if isinstance(item, CharacterSheet):
+            name = item.base_name.lower()
+            self.sheets |= bit
+            if item.location:
+                self.located |= bit
+        elif isinstance(item, AbstractCharacter) or getattr(item, "live_name", False):
+            self.live |= bit
+        else:
+            name = item.name.lower()
+        self.names.append(name)
+        for query, found in self.found.items():
+            if query in name:
+                self.found[query] = found | bit
+
+    def delete(self, position: int) -> None:
+        del self.names[position]
+        self.sheets = _without(self.sheets, position)
+        self.located = _without(self.located, position)
+        self.live = _without(self.live, position)
+        for query, found in self.found.items():
+            self.found[query] = _without(found, position)
+
+    def matches(self, items: list[Item | Armor | Weapon | CharacterSheet], query: str) -> int:
+        """Bitmap of the positions of the items whose lower-cased name contains the lower-cased query."""
+        found: int | None = self.found.get(query)
+        if found is None:
+            found = 0
+            for position, name in enumerate(self.names):
+                if query in name:
+                    found |= 1 << position
+            self.found[query] = found
+        check: int = (self.live | (self.sheets if _behind_name(query) else self.located)) & ~found
+        for position in _positions(check) if check else ():
+            if query in items[position].name.lower():
+                found |= 1 << position
+        return found
+
+
+class _RoomItems(list):
+    """
+    The items of a room, a list that keeps the room's `_RoomIndex` up to date.
+
+    Items appended or removed one at a time update the index, other changes drop it and the next lookup builds
+    it again. Copies and pickles are made of the items alone.
+    """
+    __slots__ = ("_index",)
+
+    def __init__(self, items: Iterable = ()):
+        super().__init__(items)
+        self._index: _RoomIndex | None = None
+
+    def __reduce__(self) -> tuple:
+        return _RoomItems, (list(self),)
+
+    def lookup(self) -> _RoomIndex:
+        if self._index is None:
+            self._index = _RoomIndex(self)
+        return self._index
+
+    def refresh(self) -> None:
+        self._index = None
+
+    def append(self, item: Item | Armor | Weapon | CharacterSheet) -> None:
+        super().append(item)
+        if self._index is not None:
+            self._index.append(item)
+
+    def extend(self, items: Iterable) -> None:
+        for item in items:
+            self.append(item)
+
+    def __iadd__(self, items: Iterable) -> "_RoomItems":
+        self.extend(items)
+        return self
+
+    def pop(self, position: int = -1) -> Item | Armor | Weapon | CharacterSheet:
+        item: Item | Armor | Weapon | CharacterSheet = super().pop(position)
+        if self._index is not None:
+            self._index.delete(position if position >= 0 else position + len(self) + 1)
+        return item
+
+    def remove(self, item: Item | Armor | Weapon | CharacterSheet) -> None:
+        self.pop(self.index(item))
+
+    def __delitem__(self, key: int | slice) -> None:
+        if isinstance(key, int):
+            self.pop(key)
+            return
+        self._index = None
+        super().__delitem__(key)
+
+    def __setitem__(self, key: int | slice, value: any) -> None:
+        self._index = None
+        super().__setitem__(key, value)
+
+    def insert(self, position: int, item: Item | Armor | Weapon | CharacterSheet) -> None:
+        self._index = None
+        super().insert(position, item)
+
+    def clear(self) -> None:
+        self._index = None
+        super().clear()
+
+    def sort(self, *args, **kwargs) -> None:
+        self._index = None
+        super().sort(*args, **kwargs)
+
+    def reverse(self) -> None:
+        self._index = None
+        super().reverse()
+
+    def __imul__(self, times: int) -> "_RoomItems":
+        self._index = None
+        return super().__imul__(times)
+
 
 @dataclass(slots=True)
 class RoomDescription:
@@ -20,13 +209,17 @@ class RoomDescription:
     _desc1: str = ""
     _desc2: str = ""
     notes: str = ""
-    items: list[Item | Armor | Weapon | CharacterSheet] = field(default_factory=list)
+    items: list[Item | Armor | Weapon | CharacterSheet] = field(default_factory=_RoomItems)
     new_visit: bool = True
     views: int = 0
     _complete: bool = False
     last_combat: list[str] = field(default_factory=list)
     _directions: dict[str, str] = field(default_factory=dict)
 
+    def __post_init__(self) -> None:
+        if type(self.items) is not _RoomItems:
+            self.items = _RoomItems(self.items)
+
     @property
     def directions(self) -> dict[str, str]:
         return self._directions
@@ -38,7 +231,7 @@ class RoomDescription:
     def kill_npcs(self, name: str | None = None) -> str:
         _ = ""
         for item in self.items:
-            if isinstance(item, CharacterSheet):
+            if isinstance(item, AbstractCharacter):
                 if name is None or name in item.name:
                     item.hp = 0
                     _ += f"\n;## {item.name}"
@@ -50,13 +243,8 @@ class RoomDescription:
             direction = "rear"
         if direction == "forwards" or direction == "forward":
             direction = "front"
-        un_relative: dict[str, dict[str]] = dict()
-        un_relative["n"] = {"front": "n", "right": "e", "rear": "s", "left": "w"}
-        un_relative["e"] = {"front": "e", "right": "s", "rear": "w", "left": "n"}
-        un_relative["s"] = {"front": "s", "right": "w", "rear": "n", "left": "e"}
-        un_relative["w"] = {"front": "w", "right": "n", "rear": "e", "left": "s"}
-        if self.facing in un_relative:
-            mapping = un_relative[self.facing]
+        if self.facing in _absolute:
+            mapping = _absolute[self.facing]
             if direction in mapping:
                 direction = mapping[direction]
         result: list[str] = list()
@@ -99,31 +287,10 @@ class RoomDescription:
         self._desc2 += f" {desc}"
 
     def fix_directions(self, desc: str) -> str:
-        if self.facing.lower() == "n":
-            desc = desc.replace("/N/", "in front of you")
-            desc = desc.replace("/E/", "to your right")
-            desc = desc.replace("/S/", "behind you")
-            desc = desc.replace("/W/", "to your left")
-
-        if self.facing.lower() == "e":
-            desc = desc.replace("/E/", "in front of you")
-            desc = desc.replace("/S/", "to your right")
-            desc = desc.replace("/W/", "behind you")
-            desc = desc.replace("/N/", "to your left")
-
-        if self.facing.lower() == "s":
-            desc = desc.replace("/S/", "in front of you")
-            desc = desc.replace("/W/", "to your right")
-            desc = desc.replace("/N/", "behind you")
-            desc = desc.replace("/E/", "to your left")
-
-        if self.facing.lower() == "w":
-            desc = desc.replace("/W/", "in front of you")
-            desc = desc.replace("/N/", "to your right")
-            desc = desc.replace("/E/", "behind you")
-            desc = desc.replace("/S/", "to your left")
-
-        return desc
+        phrases: dict[str, str] | None = _relative_phrases.get(self.facing.lower())
+        if phrases is None or "/" not in desc:
+            return desc
+        return _placeholder.sub(lambda match: phrases[match.group(1)], desc)
 
     @property
     def facing(self) -> str:
@@ -145,13 +312,27 @@ class RoomDescription:
     def complete(self, complete: bool) -> None:
         self._complete = complete
 
+    def _items(self) -> _RoomItems:
+        if type(self.items) is not _RoomItems:
+            # a plain list assigned to the room, or restored without `__post_init__`
+            self.items = _RoomItems(self.items)
+        return self.items
+
+    def _found(self, name: str) -> int:
+        """Bitmap of the positions of the items whose name contains `name`, ignoring case."""
+        items: _RoomItems = self._items()
+        return items.lookup().matches(items, name.lower())
+
+    def refresh(self) -> None:
+        """Forget the looked up names, for items renamed or sheets moved to a location while they are in the room."""
+        self._items().refresh()
+
+    def _matches(self, name: str) -> list[Item | Armor | Weapon | CharacterSheet]:
+        """The items whose name contains `name`, ignoring case, in the order of the items."""
+        return [self.items[position] for position in _positions(self._found(name))]
+
     def npc_group(self, substring: str) -> list[CharacterSheet]:
-        result: list[CharacterSheet] = list()
-        for x in self.items:
-            if isinstance(x, CharacterSheet):
-                if substring.lower() in x.name.lower():
-                    result.append(x)
-        return result
+        return [x for x in self._matches(substring) if isinstance(x, AbstractCharacter)]
 
     def mob_group(self, substring: str) -> MobUnit:
         m = MobUnit()
@@ -189,7 +370,7 @@ class RoomDescription:
         m2: MobUnit = self.mob_group(substring_b)
         for unit in m1.units:
             if unit in m2.units:
-                m2.units.remove(unit)
+                m2.remove_unit(unit)
         self.last_combat = m1.combat(m2)
         return self.last_combat
 
@@ -217,55 +398,34 @@ class RoomDescription:
             return f"\n;## [{idx}] Armor: {item.name.strip()}"
         if isinstance(item, Weapon):
             return f"\n;## [{idx}] Weapon: {item.name.strip()}"
-        if isinstance(item, CharacterSheet):
+        if isinstance(item, AbstractCharacter):
             return f"\n;## [{idx}] {item.name.strip()}"
         return f"\n;## [{idx}] {item.name.strip()}"
 
     def pop_item(self, name: str) -> Item | Armor | Weapon | CharacterSheet | None:
-        for _, x in enumerate([x.name for x in self.items]):
-            if x.lower().startswith(name.lower()):
-                return self.items.pop(_)
-            if f"({name.lower()})" in x.lower():
-                return self.items.pop(_)
-            if f"(#{name.lower()})" in x.lower():
-                return self.items.pop(_)
-            if f"{name.lower()}" in x.lower():
-                return self.items.pop(_)
-        return None
+        # a name starting with, or holding "(name)" or "(#name)", always contains the name too
+        found: int = self._found(name)
+        return self.items.pop(_first(found)) if found else None
 
     def pop_items(self, name: str) -> list[Item | Armor | Weapon | CharacterSheet]:
-        items: list[Item | Armor | Weapon | CharacterSheet] = list()
-        name = name.lower()
-        for item in self.items.copy():
-            item_name = item.name.lower()
-            if name in item_name:
-                self.items.remove(item)
-                items.append(item)
+        items: list[Item | Armor | Weapon | CharacterSheet] = self._matches(name)
+        for item in items:
+            self.items.remove(item)
         return items
 
     def remove_items(self, name: str) -> str:
         items: str = ""
-        name = name.lower()
-        for item in self.items.copy():
-            item_name = item.name.lower()
-            if name in item_name:
-                self.items.remove(item)
-                items += f"\n;## Removed {item.name}"
+        for item in self._matches(name):
+            self.items.remove(item)
+            items += f"\n;## Removed {item.name}"
         return items
 
     def get_item(self, name: str) -> Item | Armor | Weapon | CharacterSheet | None:
         return self.item(name)
 
     def item(self, name: str) -> Item | Armor | Weapon | CharacterSheet | None:
-        for _, x in enumerate([x.name for x in self.items]):
-            if x.lower().startswith(name.lower()):
-                return self.items[_]
-            if f"({name.lower()})" in x.lower():
-                return self.items[_]
-            if f"(#{name.lower()})" in x.lower():
-                return self.items[_]
-            if f"{name.lower()}" in x.lower():
-                return self.items[_]
+        found: int = self._found(name)
+        return self.items[_first(found)] if found else None
 
     def __str__(self):
         self.views += 1
@@ -363,7 +523,7 @@ class RoomDescription:
             for item in self.items:
                 idx: int = self.items.index(item) + 1
                 result += f"\n;## [{idx}] "
-                if isinstance(item, CharacterSheet):
+                if isinstance(item, AbstractCharacter):
                     if item.hp < 1:
                         result += "DEAD "
                 result += f"{item.name}"
@@ -378,11 +538,11 @@ class RoomDescription:
         result: list = list()
         if self.items:
             for item in self.items:
-                if isinstance(item, CharacterSheet):
+                if isinstance(item, AbstractCharacter):
                     if item.is_alive:
                         result.append(item)
             for item in self.items:
-                if isinstance(item, CharacterSheet):
+                if isinstance(item, AbstractCharacter):
                     if not item.is_alive:
                         result.append(item)
         return result
@@ -392,7 +552,7 @@ class RoomDescription:
         for _ in identifiers:
             npc = self.get_item(_)
             if npc:
-                if isinstance(npc, CharacterSheet):
+                if isinstance(npc, AbstractCharacter):
                     result.append(npc)
         return result
 
@@ -401,18 +561,11 @@ class RoomDescription:
             identifier -= 1
             if identifier < 0:
                 return None
-            if len(self.items) > identifier and isinstance(self.items[identifier], CharacterSheet):
+            if len(self.items) > identifier and isinstance(self.items[identifier], AbstractCharacter):
                 return self.items[identifier]
-        identifier = str(identifier).lower()
-        for item in self.items:
-            name = item.name.lower()
-            if isinstance(item, CharacterSheet):
-                if f"(#{identifier})" in name:
-                    return item
-                if f"({identifier})" in name:
-                    return item
-                if f"{identifier}" in name:
-                    return item
+        for item in self._matches(str(identifier)):
+            if isinstance(item, AbstractCharacter):
+                return item
         return None
 
     @property
@@ -420,7 +573,7 @@ class RoomDescription:
         result: str = ""
         if self.items:
             for item in self.items:
-                if isinstance(item, CharacterSheet):
+                if isinstance(item, AbstractCharacter):
                     if item.hp < 1:
                         result += f"\n;## {item.name} (DEAD)"
                     else:
@@ -471,11 +624,10 @@ class Rooms:
             from_room = _rooms.room(from_room)
         if isinstance(dest_room, str):
             dest_room = _rooms.room(dest_room)
-        for item in from_room.items.copy():
-            if substring.lower() in item.name.lower():
-                _ = f"{_}\n;## {item.name} moved from {from_room.name} to {dest_room.name}"
-                dest_room.add_item(item)
-                from_room.items.remove(item)
+        for item in from_room._matches(substring):
+            _ = f"{_}\n;## {item.name} moved from {from_room.name} to {dest_room.name}"
+            dest_room.add_item(item)
+            from_room.items.remove(item)
         return _
 
     @classmethod
@@ -487,7 +639,7 @@ class Rooms:
         if isinstance(dest_room, str):
             dest_room = _rooms.room(dest_room)
         for item in from_room.items.copy():
-            if isinstance(item, CharacterSheet):
+            if isinstance(item, AbstractCharacter):
                 if item.is_alive:
                     _ = f"{_}\n;## {item.name} moved from {from_room.name} to {dest_room.name}"
                     dest_room.add_item(item)
@@ -4,6 +4,9 @@ from dataclasses import field
 from enum import Enum
 from enum import auto
 
+import gamebook_state
+from catalog import Catalog
+
 
 class Difficulty(Enum):
     Easy = 5
@@ -26,7 +29,7 @@ class SkillAttribute(Enum):
 
 
 @dataclass(slots=True)
-class DifficultyCheck:
+class DifficultyCheck(gamebook_state.Tracked):
     level: Difficulty = Difficulty.Extreme
     skill: SkillAttribute = SkillAttribute.Warrior
 
@@ -35,7 +38,7 @@ class DifficultyCheck:
 
 
 @dataclass(slots=True)
-class CharacterSkill:
+class CharacterSkill(gamebook_state.Tracked):
     skill_name: str = ""
     skill_attribute: SkillAttribute = None
 
@@ -50,39 +53,50 @@ class CharacterSkill:
         return self.skill_name < other.skill_name
 
 
+def _build_skills() -> list[CharacterSkill]:
+    return [
+        CharacterSkill("Acrobatics", SkillAttribute.Rogue),
+        CharacterSkill("Alchemy", SkillAttribute.Mage),
+        CharacterSkill("Athletics", SkillAttribute.Warrior),
+        CharacterSkill("Awareness", SkillAttribute.Mage),
+        CharacterSkill("Axes", SkillAttribute.Warrior),
+        CharacterSkill("Blunt Weapons", SkillAttribute.Warrior),
+        CharacterSkill("Bows", SkillAttribute.Rogue),
+        CharacterSkill("Driving", SkillAttribute.Warrior),
+        CharacterSkill("Daggers", SkillAttribute.Rogue),
+        CharacterSkill("Firearms", SkillAttribute.Rogue),
+        CharacterSkill("Herbalism", SkillAttribute.Mage),
+        CharacterSkill("Hermeticism", SkillAttribute.Mage),
+        CharacterSkill("Lore", SkillAttribute.Mage),
+        CharacterSkill("Riding", SkillAttribute.Warrior),
+        CharacterSkill("Spears", SkillAttribute.Warrior),
+        CharacterSkill("Swords", SkillAttribute.Warrior),
+        CharacterSkill("Thaumaturgy", SkillAttribute.Mage),
+        CharacterSkill("Thievery", SkillAttribute.Rogue),
+        CharacterSkill("Thrown", SkillAttribute.Rogue),
+        CharacterSkill("Unarmed", SkillAttribute.Warrior),
+    ]
+
+
+_skills: Catalog = Catalog(_build_skills, lambda skill: skill.skill_name,
+                           lambda skill: CharacterSkill(skill.skill_name, skill.skill_attribute))
+
+
 @dataclass(slots=True)
 class CharacterSkillsList:
     skills_list: list[CharacterSkill] = field(default_factory=list)
 
     def __post_init__(self):
-        self.skills_list.append(CharacterSkill("Acrobatics", SkillAttribute.Rogue))
-        self.skills_list.append(CharacterSkill("Alchemy", SkillAttribute.Mage))
-        self.skills_list.append(CharacterSkill("Athletics", SkillAttribute.Warrior))
-        self.skills_list.append(CharacterSkill("Awareness", SkillAttribute.Mage))
-        self.skills_list.append(CharacterSkill("Axes", SkillAttribute.Warrior))
-        self.skills_list.append(CharacterSkill("Blunt Weapons", SkillAttribute.Warrior))
-        self.skills_list.append(CharacterSkill("Bows", SkillAttribute.Rogue))
-        self.skills_list.append(CharacterSkill("Driving", SkillAttribute.Warrior))
-        self.skills_list.append(CharacterSkill("Daggers", SkillAttribute.Rogue))
-        self.skills_list.append(CharacterSkill("Firearms", SkillAttribute.Rogue))
-        self.skills_list.append(CharacterSkill("Herbalism", SkillAttribute.Mage))
-        self.skills_list.append(CharacterSkill("Hermeticism", SkillAttribute.Mage))
-        self.skills_list.append(CharacterSkill("Lore", SkillAttribute.Mage))
-        self.skills_list.append(CharacterSkill("Riding", SkillAttribute.Warrior))
-        self.skills_list.append(CharacterSkill("Spears", SkillAttribute.Warrior))
-        self.skills_list.append(CharacterSkill("Swords", SkillAttribute.Warrior))
-        self.skills_list.append(CharacterSkill("Thaumaturgy", SkillAttribute.Mage))
-        self.skills_list.append(CharacterSkill("Thievery", SkillAttribute.Rogue))
-        self.skills_list.append(CharacterSkill("Thrown", SkillAttribute.Rogue))
-        self.skills_list.append(CharacterSkill("Unarmed", SkillAttribute.Warrior))
+        self.skills_list.extend(_skills.list())
 
     @classmethod
     def random_skill(cls) -> CharacterSkill:
-        return random.choice(CharacterSkillsList().skills_list)
+        return _skills.choice()
 
     @classmethod
     def skill_by_name(cls, skill_name: str) -> CharacterSkill | None:
-        for skill in CharacterSkillsList().skills_list:
-            if skill.skill_name == skill_name:
-                return skill
+        skill: CharacterSkill | None = _skills.named(skill_name)
+        # the names are matched with their case
+        if skill is not None and skill.skill_name == skill_name:
+            return skill
         return None
@@ -1,13 +1,14 @@
-import copy
 import random
 from dataclasses import dataclass
 from dataclasses import field
 
+import gamebook_state
+from catalog import Catalog
 from skills import SkillAttribute
 
 
 @dataclass(slots=True)
-class CharacterTalent:
+class CharacterTalent(gamebook_state.Tracked):
     name: str = ""
     description: str = ""
     skill_attributes: list[SkillAttribute] = field(default_factory=list)
@@ -29,44 +30,55 @@ class CharacterTalent:
         return f"{self.name}: {self.description}"
 
 
+def _build_talents() -> list[CharacterTalent]:
+    return [
+        CharacterTalent("Armored Caster", "Reduce armor penalty -2. May be stacked.", [SkillAttribute.Mage], True),
+        CharacterTalent("Blood Mage", "May use Hit Points instead of Mana for casting spells.", [SkillAttribute.Mage]),
+        CharacterTalent("Champion", "Select a cause. +2 on attack and damage against enemies of "
+                                    "the cause. May be stacked.", None, True),
+        CharacterTalent("Channeller", "Add Mage attribute level to magic attack once per combat.", [SkillAttribute.Mage]),
+        CharacterTalent("Craftsman", "Trained in one craft such as blacksmithing, carpentry, "
+                                     "bow making, etc. May be stacked.", None, True),
+        CharacterTalent("Dual Wielder", "May wield a weapon in off-hand without penalty. Does not "
+                                        "grant an extra attack.", [SkillAttribute.Rogue, SkillAttribute.Warrior]),
+        CharacterTalent("Familiar", "You have a small animal such as a rat, cat, dog, or bird as a "
+                                    "companion that can do simple tricks.", [SkillAttribute.Mage]),
+        CharacterTalent("Henchman", "You are followed around by one henchman that works as your "
+                                    "squire/pack mule.", [SkillAttribute.Warrior, SkillAttribute.Rogue]),
+        CharacterTalent("Hunter", "You are trained as a hunter and to live off the land. With "
+                                  "enough time, may procure food enough for four.", [SkillAttribute.Warrior, SkillAttribute.Rogue]),
+        CharacterTalent("Leadership", "You are a leader and may command troops.", [SkillAttribute.Warrior]),
+        CharacterTalent("Lucky Devil", "May reroll and roll once per scene or combat."),
+        CharacterTalent("Massive Attack", "You can add your Warrior level to your melee attack "
+                                          "damage once per combat.", [SkillAttribute.Warrior]),
+        CharacterTalent("Precise Shot", "You can add your Rogue level to your ranged attack "
+                                        "damage once per combat.", [SkillAttribute.Rogue]),
+        CharacterTalent("Sailor", "You can steer a boat or sailing ship. No penalties for "
+                                  "fighting on a sea vessel.", [SkillAttribute.Rogue, SkillAttribute.Warrior]),
+        CharacterTalent("Sixth Sense", "You may roll 4+ to become aware of an ambush, etc, before "
+                                       "it occurs and are not surprised."),
+        CharacterTalent("Touch as Nails", "All damage per attack is reduced by -2."),
+    ]
+
+
+def _copy_talent(talent: CharacterTalent) -> CharacterTalent:
+    skill_attributes: list[SkillAttribute] | None = list(talent.skill_attributes) if talent.skill_attributes else None
+    return CharacterTalent(talent.name, talent.description, skill_attributes, talent.stackable)
+
+
+_talents: Catalog = Catalog(_build_talents, lambda talent: talent.name, _copy_talent)
+
+
 @dataclass(slots=True)
 class TalentList:
     talents: list[CharacterTalent] = field(default_factory=list)
 
     def __post_init__(self):
-        self.talents.append(CharacterTalent("Armored Caster", "Reduce armor penalty -2. May be stacked.", [SkillAttribute.Mage], True))
-        self.talents.append(CharacterTalent("Blood Mage", "May use Hit Points instead of Mana for casting spells.", [SkillAttribute.Mage]))
-        self.talents.append(CharacterTalent("Champion", "Select a cause. +2 on attack and damage against enemies of "
-                                                        "the cause. May be stacked.", None, True))
-        self.talents.append(CharacterTalent("Channeller", "Add Mage attribute level to magic attack once per combat.", [SkillAttribute.Mage]))
-        self.talents.append(CharacterTalent("Craftsman", "Trained in one craft such as blacksmithing, carpentry, "
-                                                         "bow making, etc. May be stacked.", None, True))
-        self.talents.append(CharacterTalent("Dual Wielder", "May wield a weapon in off-hand without penalty. Does not "
-                                                            "grant an extra attack.", [SkillAttribute.Rogue, SkillAttribute.Warrior]))
-        self.talents.append(CharacterTalent("Familiar", "You have a small animal such as a rat, cat, dog, or bird as a "
-                                                        "companion that can do simple tricks.", [SkillAttribute.Mage]))
-        self.talents.append(CharacterTalent("Henchman", "You are followed around by one henchman that works as your "
-                                                        "squire/pack mule.", [SkillAttribute.Warrior, SkillAttribute.Rogue]))
-        self.talents.append(CharacterTalent("Hunter", "You are trained as a hunter and to live off the land. With "
-                                                      "enough time, may procure food enough for four.", [SkillAttribute.Warrior, SkillAttribute.Rogue]))
-        self.talents.append(CharacterTalent("Leadership", "You are a leader and may command troops.", [SkillAttribute.Warrior]))
-        self.talents.append(CharacterTalent("Lucky Devil", "May reroll and roll once per scene or combat."))
-        self.talents.append(CharacterTalent("Massive Attack", "You can add your Warrior level to your melee attack "
-                                                              "damage once per combat.", [SkillAttribute.Warrior]))
-        self.talents.append(CharacterTalent("Precise Shot", "You can add your Rogue level to your ranged attack "
-                                                            "damage once per combat.", [SkillAttribute.Rogue]))
-        self.talents.append(CharacterTalent("Sailor", "You can steer a boat or sailing ship. No penalties for "
-                                                      "fighting on a sea vessel.", [SkillAttribute.Rogue, SkillAttribute.Warrior]))
-        self.talents.append(CharacterTalent("Sixth Sense", "You may roll 4+ to become aware of an ambush, etc, before "
-                                                           "it occurs and are not surprised."))
-        self.talents.append(CharacterTalent("Touch as Nails", "All damage per attack is reduced by -2."))
+        self.talents.extend(_talents.list())
 
     @classmethod
     def by_name(cls, name: str) -> CharacterTalent | None:
-        for talent in TalentList().talents:
-            if name.lower() == talent.name.lower():
-                return copy.deepcopy(talent)
-        return None
+        return _talents.named(name)
 
     def random_talent(self, skill_attribute: SkillAttribute = None):
         if not skill_attribute:
@@ -10,6 +10,7 @@ Requirements:
   QScintilla==2.10.4
 """
 
+import os
 import sys
 import textwrap
 
@@ -20,15 +21,19 @@ from PyQt5.Qsci import QsciLexerCustom
 
 from lark import Lark
 
+# the grammar loader lives with the gamebook modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "python"))
+import gamebook_grammar  # noqa: E402
+
 
 class LexerJson(QsciLexerCustom):
 
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.lark: Lark | None = None
         self.create_parser()
         self.create_styles()
         self.token_styles = dict()
-        self.lark: Lark | None = None
 
     def create_styles(self):
         deeppink = QColor(249, 38, 114)
@@ -50,11 +55,8 @@ class LexerJson(QsciLexerCustom):
                 "NULL"              : 0, "TRUE": 0, "STRING": 4, "NUMBER": 1, }
 
     def create_parser(self):
-        grammar = ''
-        with open("python/lark/gamebook.lark") as r:
-            grammar = r.read()
-        self.lark = Lark(grammar, parser=None,
-                         lexer='basic')  # All tokens: print([t.name for t in self.lark.parser.lexer.tokens])
+        # shared with every other lexer in the process, all tokens: print([t.name for t in self.lark.terminals])
+        self.lark = gamebook_grammar.load("gamebook.lark", parser=None, lexer='basic')
 
     def defaultPaper(self, style):
         return QColor(39, 40, 34)